@@ -14,6 +14,8 @@ else:
 
 include(
     'components/database.py',
+    'components/cache.py',
+    'components/elasticsearch.py',
     'components/apps.py',
     'components/middleware.py',
     'components/templates.py',
@@ -37,3 +39,7 @@ USE_TZ = True
 STATIC_URL = 'static/'
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
+
+# Source of the movies API: 'query' aggregates the content tables on every request,
+# 'document' reads content.film_work_document (etc/postgres/film_work_document.ddl)
+MOVIES_READ_MODEL = os.environ.get('MOVIES_READ_MODEL', 'query')
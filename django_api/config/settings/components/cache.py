@@ -0,0 +1,15 @@
+import os
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': f"redis://{os.environ.get('REDIS_HOST', '127.0.0.1')}:{os.environ.get('REDIS_PORT', 6379)}/"
+                    f"{os.environ.get('REDIS_CACHE_DB', 1)}",
+    }
+}
+
+# Lifetime of the cached API responses, they are invalidated on changes of the films before that
+MOVIES_CACHE_TIMEOUT = int(os.environ.get('MOVIES_CACHE_TIMEOUT', 300))
+
+# max-age of the API responses for the clients and the nginx cache, which revalidate them with ETag afterwards
+MOVIES_HTTP_MAX_AGE = int(os.environ.get('MOVIES_HTTP_MAX_AGE', 30))
@@ -0,0 +1,9 @@
+import os
+
+ES_HOST = os.environ.get('ES_HOST', '127.0.0.1')
+ES_PORT = os.environ.get('ES_PORT', 9200)
+# Index (alias) of the films kept by the ETL
+ES_INDEX = os.environ.get('ES_INDEX', 'movies')
+# Pooled connections of a process, as many as the uWSGI threads of a worker
+ES_CONNECTIONS = int(os.environ.get('ES_CONNECTIONS', 8))
+ES_TIMEOUT = float(os.environ.get('ES_TIMEOUT', 5))
@@ -0,0 +1,143 @@
+import hashlib
+import logging
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.utils.cache import quote_etag
+from redis.exceptions import RedisError
+
+logger = logging.getLogger(__name__)
+
+LIST_VERSION_KEY = 'movies:list:version'
+FILM_VERSION_KEY = 'movies:film:{}:version'
+STATS_KEY = 'movies:cache:{}'
+STATS = ('hits', 'misses', 'waits')
+
+# Time a recompute may take before the waiting requests give up on it and compute the response themselves
+LOCK_SECONDS = 10
+WAIT_STEP_SECONDS = 0.05
+
+
+def new_version():
+    # Time based, so a version key evicted from Redis never comes back with a version of older entries
+    return time.time_ns()
+
+
+def get_version(key):
+    version = cache.get(key)
+    if version is None:
+        version = new_version()
+        if not cache.add(key, version, None):
+            version = cache.get(key, version)
+    return version
+
+
+def list_version():
+    return get_version(LIST_VERSION_KEY)
+
+
+def film_version(film_id):
+    return get_version(FILM_VERSION_KEY.format(film_id))
+
+
+def invalidate(film_ids=()):
+    """Makes the cached list pages and the cached details of the films stale."""
+    try:
+        cache.set_many({LIST_VERSION_KEY: new_version(),
+                        **{FILM_VERSION_KEY.format(film_id): new_version() for film_id in film_ids}}, None)
+    except RedisError as e:
+        logger.error('Movies cache invalidation failed, Error: %s', e)
+
+
+def list_key(request):
+    query = '&'.join(f'{name}={value}' for name, values in sorted(request.GET.lists()) for value in values)
+    return f'movies:list:{hashlib.md5(query.encode()).hexdigest()}'
+
+
+def make_entry(content):
+    """Cached response: the rendered JSON with its validators, the ETag of the JSON and the time it was rendered."""
+    return content, quote_etag(hashlib.md5(content).hexdigest()), time.time()
+
+
+def detail_key(film_id):
+    return f'movies:detail:{film_id}'
+
+
+def count(stat):
+    key = STATS_KEY.format(stat)
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.add(key, 0, None)
+        cache.incr(key)
+
+
+def stats():
+    values = cache.get_many([STATS_KEY.format(stat) for stat in STATS])
+    return {stat: values.get(STATS_KEY.format(stat), 0) for stat in STATS}
+
+
+def reset_stats():
+    cache.delete_many([STATS_KEY.format(stat) for stat in STATS])
+
+
+def cached_content(key, get_version, render):
+    """
+    Returns the rendered response of the key and version from the cache, rendering it on a miss.
+
+    Only one request renders a missing entry (single flight): the others wait until it appears in the
+    cache or the rendering request gives up, so an invalidated popular page is not computed by every
+    request at once.
+
+    :param key: Cache key of the response.
+    :param get_version: Returns the current version of the key, see list_version() and film_version().
+        It is read from Redis as well, so it is called under the same guard as the entry itself.
+    :param render: Renders the response to cache, see make_entry().
+    :return: Cached response and whether it came from the cache.
+    """
+    lock_key, locked = f'{key}:lock', False
+    try:
+        version = get_version()
+        content = cache.get(key, version=version)
+        if content is not None:
+            count('hits')
+            return content, True
+
+        count('misses')
+        locked = cache.add(lock_key, 1, LOCK_SECONDS, version=version)
+        if not locked:
+            count('waits')
+            deadline = time.monotonic() + LOCK_SECONDS
+            while time.monotonic() < deadline:
+                time.sleep(WAIT_STEP_SECONDS)
+                values = cache.get_many([key, lock_key], version=version)
+                if key in values:
+                    return values[key], True
+                if lock_key not in values:
+                    break
+    except RedisError as e:
+        logger.error('Movies cache unavailable, Error: %s', e)
+        return render(), False
+
+    try:
+        content = render()
+        store(key, content, version)
+    finally:
+        if locked:
+            release(lock_key, version)
+    return content, False
+
+
+def store(key, content, version):
+    try:
+        cache.set(key, content, settings.MOVIES_CACHE_TIMEOUT, version=version)
+    except RedisError as e:
+        logger.error('Movies cache unavailable, Error: %s', e)
+
+
+def release(lock_key, version):
+    try:
+        cache.delete(lock_key, version=version)
+    except RedisError as e:
+        logger.error('Movies cache lock %s not released, Error: %s', lock_key, e)
@@ -0,0 +1,108 @@
+import base64
+import binascii
+import json
+import logging
+import math
+import threading
+import time
+import uuid
+
+from django.core.cache import cache
+from django.db import close_old_connections
+from django.http import Http404
+from redis.exceptions import RedisError
+
+from ...models.film_work import FilmWork
+
+logger = logging.getLogger(__name__)
+
+COUNT_CACHE_KEY = 'movies:count'
+# Age after which the cached count is refreshed in the background, the stale value is served meanwhile
+COUNT_REFRESH_SECONDS = 60
+
+
+def movies_count():
+    """
+    Number of films of the cursor pages, served from the cache and refreshed in the background when stale.
+
+    The ?page=N pages count the films exactly instead: their number of pages decides which page numbers
+    exist, so a stale count would make the newest last pages 404.
+    """
+    try:
+        cached = cache.get(COUNT_CACHE_KEY)
+        if cached is None:
+            return _refresh_count()
+
+        count, counted_at = cached
+        if time.time() - counted_at > COUNT_REFRESH_SECONDS and cache.add(f'{COUNT_CACHE_KEY}:refresh', 1, 30):
+            threading.Thread(target=_refresh_count_in_background, daemon=True).start()
+        return count
+    except RedisError as e:
+        logger.error('Movies count cache unavailable, Error: %s', e)
+        return FilmWork.objects.count()
+
+
+def _refresh_count():
+    # A plain COUNT(*) of the films, the annotated list queryset gives the same number
+    count = FilmWork.objects.count()
+    cache.set(COUNT_CACHE_KEY, (count, time.time()), None)
+    return count
+
+
+def _refresh_count_in_background():
+    try:
+        _refresh_count()
+    finally:
+        cache.delete(f'{COUNT_CACHE_KEY}:refresh')
+        close_old_connections()
+
+
+def encode_cursor(direction, film_id):
+    return base64.urlsafe_b64encode(json.dumps([direction, str(film_id)]).encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    try:
+        direction, film_id = json.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+        if direction not in ('next', 'prev'):
+            raise ValueError(direction)
+        if not isinstance(film_id, str):
+            raise TypeError(film_id)
+        return direction, uuid.UUID(film_id)
+    except (binascii.Error, TypeError, ValueError) as e:
+        raise Http404('Invalid cursor') from e
+
+
+def paginate_by_cursor(queryset, cursor, per_page):
+    """
+    Returns a page of the queryset in the id order and the opaque cursors of the pages around it.
+
+    Every page is a keyset query on the primary key starting right after (or before) the film
+    the cursor points to, so a deep page costs the same as the first one.
+    """
+    direction, film_id = decode_cursor(cursor) if cursor else ('next', None)
+
+    if direction == 'next':
+        queryset = queryset.order_by('id')
+        if film_id is not None:
+            queryset = queryset.filter(id__gt=film_id)
+    else:
+        queryset = queryset.order_by('-id').filter(id__lt=film_id)
+
+    results = list(queryset[:per_page + 1])
+    has_more = len(results) > per_page
+    results = results[:per_page]
+
+    if direction == 'prev':
+        results.reverse()
+        prev_cursor = encode_cursor('prev', results[0]['id']) if has_more else None
+        next_cursor = encode_cursor('next', results[-1]['id']) if results else None
+    else:
+        prev_cursor = encode_cursor('prev', results[0]['id']) if film_id is not None and results else None
+        next_cursor = encode_cursor('next', results[-1]['id']) if has_more else None
+
+    return results, prev_cursor, next_cursor
+
+
+def total_pages(count, per_page):
+    return max(1, math.ceil(count / per_page))
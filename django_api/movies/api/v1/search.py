@@ -0,0 +1,163 @@
+import base64
+import binascii
+import json
+from functools import lru_cache
+
+from django.conf import settings
+from django.core.exceptions import BadRequest
+from elasticsearch import Elasticsearch
+
+# Fields of the full-text query with their boosts, the names are matched as well as the texts
+QUERY_FIELDS = ['title^3', 'description', 'actors_names', 'writers_names', 'director']
+
+# Values of the sort parameter: the sort clauses before the id tie-breaker, which keeps search_after stable
+SORTS = {
+    'relevance': [{'_score': 'desc'}],
+    'rating': [{'imdb_rating': 'asc'}],
+    '-rating': [{'imdb_rating': 'desc'}],
+    'title': [{'title.raw': 'asc'}],
+    '-title': [{'title.raw': 'desc'}],
+}
+
+# Sort fields with numeric values; the values of the rest are keywords. A film without a rating gets
+# an infinite sort value, which Elasticsearch returns as a string
+NUMERIC_SORT_FIELDS = {'_score', 'imdb_rating'}
+NON_FINITE_SORT_VALUES = {'Infinity', '-Infinity'}
+
+SOURCE_FIELDS = ['id', 'title', 'description', 'imdb_rating', 'genre', 'actors_names', 'director', 'writers_names']
+
+PAGE_SIZE = 50
+MAX_PAGE_SIZE = 100
+
+
+@lru_cache(maxsize=None)
+def get_client():
+    """Elasticsearch client of the process, its connection pool is shared by the request threads."""
+    return Elasticsearch(
+        f'http://{settings.ES_HOST}:{settings.ES_PORT}',
+        connections_per_node=settings.ES_CONNECTIONS,
+        request_timeout=settings.ES_TIMEOUT,
+        retry_on_timeout=True,
+        max_retries=1,
+    )
+
+
+def encode_search_after(sort_values):
+    return base64.urlsafe_b64encode(json.dumps(sort_values).encode()).decode().rstrip('=')
+
+
+def decode_search_after(cursor, sort):
+    """
+    Decodes the cursor of the next page to the search_after values, checked against the sort clauses.
+
+    :param cursor: Cursor made by encode_search_after().
+    :param sort: Sort clauses of the search, one value is expected for each of them.
+    :return: search_after values.
+    """
+    try:
+        sort_values = json.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+    except (binascii.Error, TypeError, ValueError) as e:
+        raise BadRequest('Invalid cursor') from e
+
+    if not isinstance(sort_values, list) or len(sort_values) != len(sort) \
+            or not all(is_sort_value(next(iter(clause)), value) for clause, value in zip(sort, sort_values)):
+        raise BadRequest('Invalid cursor')
+    return sort_values
+
+
+def is_sort_value(field, value):
+    if value is None:
+        return field != 'id'
+    if field in NUMERIC_SORT_FIELDS:
+        return (isinstance(value, (int, float)) and not isinstance(value, bool)) or value in NON_FINITE_SORT_VALUES
+    return isinstance(value, str)
+
+
+def parse_float(params, name):
+    value = params.get(name)
+    if value in (None, ''):
+        return None
+    try:
+        return float(value)
+    except ValueError as e:
+        raise BadRequest(f'Invalid {name}') from e
+
+
+def parse_page_size(params):
+    try:
+        page_size = int(params.get('page_size', PAGE_SIZE))
+    except ValueError as e:
+        raise BadRequest('Invalid page_size') from e
+    if not 1 <= page_size <= MAX_PAGE_SIZE:
+        raise BadRequest(f'page_size must be between 1 and {MAX_PAGE_SIZE}')
+    return page_size
+
+
+def build_search(params):
+    """
+    Builds the body of the search request from the query parameters of the endpoint.
+
+    :param params: QueryDict with query, genre (repeatable), rating_min, rating_max, sort, page_size and cursor.
+    :return: Keyword arguments of Elasticsearch.search().
+    """
+    query = params.get('query', '').strip()
+    sort = params.get('sort') or ('relevance' if query else '-rating')
+    if sort not in SORTS:
+        raise BadRequest(f"sort must be one of {', '.join(SORTS)}")
+
+    filters = []
+    if genres := params.getlist('genre'):
+        filters.append({'terms': {'genre': genres}})
+    rating = {bound: value for bound, value in (('gte', parse_float(params, 'rating_min')),
+                                                ('lte', parse_float(params, 'rating_max'))) if value is not None}
+    if rating:
+        filters.append({'range': {'imdb_rating': rating}})
+
+    must = []
+    if query:
+        # Every word has to be found in one of the fields, e.g. a title word and a name of an actor
+        must.append({'multi_match': {'query': query, 'fields': QUERY_FIELDS, 'type': 'cross_fields',
+                                     'operator': 'and'}})
+
+    search = {
+        'query': {'bool': {'must': must, 'filter': filters}},
+        'sort': SORTS[sort] + [{'id': 'asc'}],
+        'size': parse_page_size(params),
+        'source': SOURCE_FIELDS,
+        'track_total_hits': True,
+    }
+    if cursor := params.get('cursor'):
+        search['search_after'] = decode_search_after(cursor, search['sort'])
+    return search
+
+
+def search_movies(params):
+    """
+    Searches the films in the Elasticsearch index of the ETL.
+
+    :param params: Query parameters of the endpoint, see build_search().
+    :return: Page of the films with the total number of the matches and the cursor of the next page.
+    """
+    search = build_search(params)
+    response = get_client().search(index=settings.ES_INDEX, **search)
+
+    hits = response['hits']['hits']
+    return {
+        'count': response['hits']['total']['value'],
+        'next': encode_search_after(hits[-1]['sort']) if len(hits) == search['size'] else None,
+        'results': [to_movie(hit['_source']) for hit in hits],
+    }
+
+
+def to_movie(source):
+    """Film of the index in the format of the movies API, without the fields the index does not keep."""
+    return {
+        'id': source['id'],
+        'title': source['title'],
+        'description': source['description'],
+        'rating': source['imdb_rating'],
+        'genres': source['genre'],
+        'actors': source['actors_names'],
+        'directors': source['director'],
+        'writers': source['writers_names'],
+    }
@@ -4,5 +4,6 @@ from . import views
 
 urlpatterns = [
     path('movies/', views.MoviesListApi.as_view()),
+    path('movies/search/', views.MoviesSearchApi.as_view()),
     path('movies/<uuid:pk>/', views.MoviesDetailApi.as_view())
 ]
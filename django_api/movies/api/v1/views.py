@@ -1,11 +1,26 @@
+import logging
+
+from django.conf import settings
 from django.contrib.postgres.aggregates import ArrayAgg
-from django.db.models import Q, F
-from django.http import JsonResponse
+from django.contrib.postgres.expressions import ArraySubquery
+from django.db.models import Exists, OuterRef, Subquery
+from django.http import HttpResponse, JsonResponse
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date
+from django.views import View
 from django.views.generic.detail import BaseDetailView
 from django.views.generic.list import BaseListView
+from elasticsearch import ApiError, BadRequestError, TransportError
 
 from ...models.film_work import FilmWork
-from ...models.person_film_work import RoleChoice
+from ...models.film_work_document import FilmWorkDocument
+from ...models.person import Person
+from ...models.person_film_work import PersonFilmWork, RoleChoice
+from .cache import cached_content, detail_key, make_entry, film_version, list_key, list_version
+from .pagination import movies_count, paginate_by_cursor, total_pages
+from .search import search_movies
+
+logger = logging.getLogger(__name__)
 
 
 class MoviesApiMixin:
@@ -13,6 +28,18 @@ class MoviesApiMixin:
     http_method_names = ['get']
 
     def get_queryset(self):
+        """
+        Films with the arrays of their genres and of the persons of every role.
+
+        With MOVIES_READ_MODEL = 'document' the films are read from the rows of FilmWorkDocument, which
+        list a person under the roles they have in the film itself.
+
+        Otherwise every array is built by a subquery correlated to the film, so the film row is not joined
+        to its genres and persons at once and then grouped back (genres x persons x their links
+        per film). The arrays are the same as the ones of the grouped query they replace:
+        distinct sorted values, [null] for a film without genres and the persons of the film who
+        have the role in any film.
+        """
         display_values = [
             'id',
             'title',
@@ -21,21 +48,45 @@ class MoviesApiMixin:
             'rating',
             'type',
             'genres',
-        ]
-        queryset = self.model.objects.annotate(genres=ArrayAgg('film_genres__name', distinct=True))
+        ] + [role_key + 's' for role_key, role_name in RoleChoice.choices]
+
+        if settings.MOVIES_READ_MODEL == 'document':
+            return FilmWorkDocument.objects.order_by('id').values(*display_values)
+
+        # Aggregated over the LEFT JOIN of one film, which gives [null] if the film has no genres
+        genres = self.model.objects.filter(pk=OuterRef('pk')).annotate(
+            names=ArrayAgg('film_genres__name', distinct=True)
+        ).values('names')
+        queryset = self.model.objects.annotate(genres=Subquery(genres))
 
         for role_key, role_name in RoleChoice.choices:
-            display_values.append(role_key + 's')
-            queryset = queryset.annotate(**{role_key + 's': ArrayAgg('persons__full_name',
-                                                                     filter=Q(
-                                                                         persons__personfilmwork__role=role_key
-                                                                     ),
-                                                                     distinct=True
-                                                                     )
-                                            }
-                                         )
-
-        return queryset.values(*display_values)
+            has_role = PersonFilmWork.objects.filter(person=OuterRef('pk'), role=role_key)
+            names = Person.objects.filter(
+                Exists(has_role),
+                personfilmwork__film_work=OuterRef('pk'),
+            ).order_by('full_name').values('full_name').distinct()
+            queryset = queryset.annotate(**{role_key + 's': ArraySubquery(names)})
+
+        # The grouped query returned the films in the id order, the pages keep it
+        return queryset.order_by('id').values(*display_values)
+
+    def get(self, request, *args, **kwargs):
+        # The rendered JSON is cached under a version which changes with the films it shows, see movies.signals
+        render = super().get
+        (content, etag, rendered_at), hit = cached_content(
+            self.get_cache_key(), self.get_cache_version,
+            lambda: make_entry(render(request, *args, **kwargs).content)
+        )
+
+        # The validators are kept with the cached JSON, so a 304 costs a cache read and no query
+        response = get_conditional_response(request, etag=etag, last_modified=int(rendered_at))
+        if response is None:
+            response = HttpResponse(content, content_type='application/json')
+        response['ETag'] = etag
+        response['Last-Modified'] = http_date(rendered_at)
+        patch_cache_control(response, public=True, max_age=settings.MOVIES_HTTP_MAX_AGE)
+        response['X-Cache'] = 'HIT' if hit else 'MISS'
+        return response
 
     def render_to_response(self, context, **response_kwargs):
         return JsonResponse(context)
@@ -44,8 +95,28 @@ class MoviesApiMixin:
 class MoviesListApi(MoviesApiMixin, BaseListView):
     paginate_by = 50
 
+    def get_cache_key(self):
+        return list_key(self.request)
+
+    def get_cache_version(self):
+        return list_version()
+
     def get_context_data(self, *, object_list=None, **kwargs):
         queryset = self.get_queryset()
+
+        # Opt-in keyset pagination: ?pagination=cursor for the first page, then ?cursor=<next or prev>
+        if self.request.GET.get('pagination') == 'cursor' or 'cursor' in self.request.GET:
+            results, prev_cursor, next_cursor = paginate_by_cursor(queryset, self.request.GET.get('cursor'),
+                                                                   self.paginate_by)
+            count = movies_count()
+            return {
+                'count': count,
+                'total_pages': total_pages(count, self.paginate_by),
+                'prev': prev_cursor,
+                'next': next_cursor,
+                'results': results
+            }
+
         paginator, page, queryset, is_paginated = self.paginate_queryset(
             queryset,
             self.paginate_by
@@ -61,5 +132,27 @@ class MoviesListApi(MoviesApiMixin, BaseListView):
 
 
 class MoviesDetailApi(MoviesApiMixin, BaseDetailView):
+    def get_cache_key(self):
+        return detail_key(self.kwargs['pk'])
+
+    def get_cache_version(self):
+        return film_version(self.kwargs['pk'])
+
     def get_context_data(self, *, object_list=None, **kwargs):
         return self.object
+
+
+class MoviesSearchApi(View):
+    """Full-text search and filters over the Elasticsearch index of the ETL, the database is not queried."""
+    http_method_names = ['get']
+
+    def get(self, request, *args, **kwargs):
+        try:
+            return JsonResponse(search_movies(request.GET))
+        except BadRequestError as e:
+            # The request was built from the parameters, e.g. search_after of a cursor Elasticsearch could not parse
+            logger.warning('Movies search rejected, Error: %s', e)
+            return JsonResponse({'detail': 'Invalid search parameters'}, status=400)
+        except (ApiError, TransportError) as e:
+            logger.error('Movies search failed, Error: %s', e)
+            return JsonResponse({'detail': 'Search is temporarily unavailable'}, status=503)
@@ -0,0 +1,72 @@
+"""
+Compares the query of the movies API with the grouped query it replaced.
+
+For the first list page and for a film detail it prints EXPLAIN ANALYZE of both queries and the
+median time of --runs executions, and checks that both give the same JSON. With
+MOVIES_READ_MODEL=document the API query reads the film documents, whose role arrays differ by design.
+
+Usage (from the django_api directory, with the same environment as the API):
+    python manage.py bench_movies_queryset [--runs 20] [--film <id>]
+"""
+import json
+import statistics
+from time import perf_counter
+
+from django.contrib.postgres.aggregates import ArrayAgg
+from django.core.management.base import BaseCommand, CommandError
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Q
+
+from ...api.v1.views import MoviesApiMixin, MoviesListApi
+from ...models.film_work import FilmWork
+from ...models.person_film_work import RoleChoice
+
+
+def grouped_queryset():
+    """The query of the API before the correlated subqueries: all the arrays aggregated over one joined row set."""
+    queryset = FilmWork.objects.annotate(genres=ArrayAgg('film_genres__name', distinct=True))
+    for role_key, role_name in RoleChoice.choices:
+        queryset = queryset.annotate(**{role_key + 's': ArrayAgg('persons__full_name',
+                                                                 filter=Q(persons__personfilmwork__role=role_key),
+                                                                 distinct=True)})
+    return queryset.order_by('id').values('id', 'title', 'description', 'creation_date', 'rating', 'type', 'genres',
+                                          *(role_key + 's' for role_key, role_name in RoleChoice.choices))
+
+
+def median_seconds(queryset, runs):
+    timings = []
+    for _ in range(runs):
+        started = perf_counter()
+        list(queryset.all())
+        timings.append(perf_counter() - started)
+    return statistics.median(timings)
+
+
+class Command(BaseCommand):
+    help = 'Compares the plans and the timings of the movies API query with the grouped one'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--runs', type=int, default=20)
+        parser.add_argument('--film', help='id of the film for the detail query, the first one by default')
+
+    def handle(self, *args, **options):
+        film_id = options['film'] or FilmWork.objects.order_by('id').values_list('id', flat=True).first()
+        if film_id is None:
+            raise CommandError('The catalog is empty')
+
+        current = MoviesApiMixin().get_queryset()
+        cases = {
+            'list page': (grouped_queryset()[:MoviesListApi.paginate_by], current[:MoviesListApi.paginate_by]),
+            'detail': (grouped_queryset().filter(pk=film_id), current.filter(pk=film_id)),
+        }
+
+        for case, (before, after) in cases.items():
+            for name, queryset in (('grouped', before), ('api', after)):
+                self.stdout.write(self.style.MIGRATE_HEADING(f'{case}, {name}:'))
+                self.stdout.write(queryset.explain(analyze=True, buffers=True))
+
+            same = (json.dumps(list(before), cls=DjangoJSONEncoder) == json.dumps(list(after), cls=DjangoJSONEncoder))
+            self.stdout.write(self.style.MIGRATE_HEADING(f'{case}:'))
+            self.stdout.write(f"  grouped    {median_seconds(before, options['runs']) * 1000:9.2f} ms")
+            self.stdout.write(f"  api        {median_seconds(after, options['runs']) * 1000:9.2f} ms")
+            self.stdout.write(self.style.SUCCESS('  same JSON') if same else self.style.ERROR('  JSON differs'))
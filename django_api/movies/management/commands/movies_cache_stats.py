@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand
+
+from ...api.v1.cache import STATS, reset_stats, stats
+
+
+class Command(BaseCommand):
+    help = 'Shows the hit, miss and wait counters of the movies API response cache'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--reset', action='store_true', help='reset the counters after showing them')
+
+    def handle(self, *args, **options):
+        values = stats()
+        requests = values['hits'] + values['misses']
+        for stat in STATS:
+            self.stdout.write(f'{stat:>8}: {values[stat]:,}')
+        if requests:
+            self.stdout.write(f"hit rate: {values['hits'] / requests:.1%}")
+
+        if options['reset']:
+            reset_stats()
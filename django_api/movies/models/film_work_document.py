@@ -0,0 +1,31 @@
+from django.contrib.postgres.fields import ArrayField
+from django.db import models
+
+
+class FilmWorkDocument(models.Model):
+    """
+    Film with its genres and persons in one row, read by the movies API and the ETL.
+
+    The table and the triggers which keep it current are created by etc/postgres/film_work_document.ddl.
+    """
+    id = models.UUIDField(primary_key=True)
+    title = models.TextField()
+    description = models.TextField(null=True)
+    creation_date = models.DateField(null=True)
+    rating = models.FloatField(null=True)
+    type = models.CharField(max_length=255)
+    modified = models.DateTimeField(null=True)
+    genres = ArrayField(models.TextField(null=True))
+    actors = ArrayField(models.TextField())
+    directors = ArrayField(models.TextField())
+    writers = ArrayField(models.TextField())
+    actor_persons = models.JSONField()
+    writer_persons = models.JSONField()
+    updated = models.DateTimeField()
+
+    class Meta:
+        managed = False
+        db_table = "content\".\"film_work_document"
+
+    def __str__(self):
+        return self.title
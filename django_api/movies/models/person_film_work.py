@@ -26,7 +26,8 @@ class PersonFilmWork(UUIDMixin):
         ]
 
         indexes = [
-            models.Index(fields=['film_work', 'person', 'role'], name='film_person_work_idx')
+            models.Index(fields=['film_work', 'person', 'role'], name='film_person_work_idx'),
+            models.Index(fields=['person', 'role'], name='person_film_work_person_role_idx'),
         ]
 
     def __str__(self):
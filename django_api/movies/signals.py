@@ -0,0 +1,54 @@
+from django.db import transaction
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.dispatch import receiver
+
+from .api.v1.cache import invalidate
+from .models.film_work import FilmWork
+from .models.genre import Genre
+from .models.genre_film_work import GenreFilmWork
+from .models.person import Person
+from .models.person_film_work import PersonFilmWork
+
+
+def invalidate_on_commit(film_ids):
+    # After the commit, otherwise a request could cache the old rows under the new version
+    film_ids = list(film_ids)
+    transaction.on_commit(lambda: invalidate(film_ids))
+
+
+@receiver([post_save, post_delete], sender=FilmWork)
+def film_work_changed(sender, instance, **kwargs):
+    invalidate_on_commit([instance.pk])
+
+
+@receiver([post_save, post_delete], sender=GenreFilmWork)
+@receiver([post_save, post_delete], sender=PersonFilmWork)
+def film_work_link_changed(sender, instance, **kwargs):
+    invalidate_on_commit([instance.film_work_id])
+
+
+@receiver([post_save, post_delete], sender=Genre)
+def genre_changed(sender, instance, **kwargs):
+    # The links of a deleted genre are deleted before it and invalidate their films themselves
+    invalidate_on_commit(GenreFilmWork.objects.filter(genre_id=instance.pk).values_list('film_work_id', flat=True))
+
+
+@receiver([post_save, post_delete], sender=Person)
+def person_changed(sender, instance, **kwargs):
+    invalidate_on_commit(
+        PersonFilmWork.objects.filter(person_id=instance.pk).values_list('film_work_id', flat=True).distinct()
+    )
+
+
+@receiver(m2m_changed, sender=FilmWork.film_genres.through)
+@receiver(m2m_changed, sender=FilmWork.persons.through)
+def film_work_m2m_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    if not reverse:
+        if action.startswith('post_'):
+            invalidate_on_commit([instance.pk])
+    elif action == 'pre_clear':
+        # The films of a person or genre being cleared are not passed, they are known only before the clear
+        links = sender.objects.filter(**{instance._meta.model_name: instance.pk})
+        invalidate_on_commit(links.values_list('film_work_id', flat=True))
+    elif action in ('post_add', 'post_remove'):
+        invalidate_on_commit(pk_set)
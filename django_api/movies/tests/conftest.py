@@ -0,0 +1,20 @@
+"""
+Sets up Django for the tests which need no database, cache or Elasticsearch.
+
+Usage:
+    python -m pytest django_api/movies/tests
+"""
+import os
+import sys
+
+import django
+from django.conf import settings
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+if not settings.configured:
+    settings.configure(
+        INSTALLED_APPS=['django.contrib.contenttypes', 'django.contrib.auth', 'movies.apps.MoviesConfig'],
+        USE_TZ=True,
+    )
+    django.setup()
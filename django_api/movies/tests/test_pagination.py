@@ -0,0 +1,102 @@
+import base64
+import json
+import uuid
+
+import pytest
+from django.http import Http404
+
+from movies.api.v1.pagination import decode_cursor, encode_cursor, paginate_by_cursor, total_pages
+
+FILM_IDS = sorted(uuid.uuid4() for _ in range(23))
+
+
+class FakeQuerySet:
+    """The values() queryset of the films, as far as paginate_by_cursor uses it."""
+
+    def __init__(self, films) -> None:
+        self.films = films
+
+    def order_by(self, field):
+        return FakeQuerySet(sorted(self.films, key=lambda film: film['id'], reverse=field.startswith('-')))
+
+    def filter(self, id__gt=None, id__lt=None):
+        return FakeQuerySet([film for film in self.films
+                             if (id__gt is None or film['id'] > id__gt) and (id__lt is None or film['id'] < id__lt)])
+
+    def __getitem__(self, item):
+        return self.films[item]
+
+
+def films():
+    return FakeQuerySet([{'id': film_id} for film_id in reversed(FILM_IDS)])
+
+
+def page_ids(results):
+    return [film['id'] for film in results]
+
+
+def raw_cursor(value):
+    return base64.urlsafe_b64encode(json.dumps(value).encode()).decode().rstrip('=')
+
+
+def test_cursor_round_trip():
+    film_id = uuid.uuid4()
+
+    assert decode_cursor(encode_cursor('prev', film_id)) == ('prev', film_id)
+
+
+@pytest.mark.parametrize('cursor', [
+    'not base64!',
+    raw_cursor('next'),
+    raw_cursor(['next']),
+    raw_cursor(['up', str(uuid.uuid4())]),
+    raw_cursor(['next', 'not a uuid']),
+    raw_cursor(['next', 5]),
+    raw_cursor(['next', None]),
+    raw_cursor({'next': str(uuid.uuid4())}),
+])
+def test_invalid_cursor_is_not_found(cursor):
+    with pytest.raises(Http404):
+        decode_cursor(cursor)
+
+
+def test_first_page():
+    results, prev_cursor, next_cursor = paginate_by_cursor(films(), None, 10)
+
+    assert page_ids(results) == FILM_IDS[:10]
+    assert prev_cursor is None
+    assert decode_cursor(next_cursor) == ('next', FILM_IDS[9])
+
+
+def test_next_pages_then_prev_pages_round_trip():
+    forward, cursor = [], None
+    while True:
+        results, prev_cursor, cursor = paginate_by_cursor(films(), cursor, 10)
+        forward.append(page_ids(results))
+        if cursor is None:
+            break
+
+    assert forward == [FILM_IDS[:10], FILM_IDS[10:20], FILM_IDS[20:]]
+
+    backward, cursor = [], prev_cursor
+    while cursor is not None:
+        results, cursor, next_cursor = paginate_by_cursor(films(), cursor, 10)
+        backward.append(page_ids(results))
+        # The next cursor of a previous page leads forward again
+        assert page_ids(paginate_by_cursor(films(), next_cursor, 10)[0]) == forward[len(forward) - len(backward)]
+
+    assert backward == [FILM_IDS[10:20], FILM_IDS[:10]]
+
+
+def test_page_of_exactly_per_page_films_has_no_next_cursor():
+    results, _, next_cursor = paginate_by_cursor(FakeQuerySet([{'id': film_id} for film_id in FILM_IDS[:10]]),
+                                                 None, 10)
+
+    assert len(results) == 10
+    assert next_cursor is None
+
+
+def test_total_pages():
+    assert total_pages(0, 50) == 1
+    assert total_pages(50, 50) == 1
+    assert total_pages(51, 50) == 2
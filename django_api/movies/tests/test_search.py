@@ -0,0 +1,75 @@
+import json
+
+import pytest
+from django.core.exceptions import BadRequest
+from django.http import QueryDict
+from django.test import RequestFactory, override_settings
+from elastic_transport import ApiResponseMeta, HttpHeaders, NodeConfig
+from elasticsearch import BadRequestError
+
+from movies.api.v1 import search
+from movies.api.v1.search import SORTS, build_search, decode_search_after, encode_search_after
+from movies.api.v1.views import MoviesSearchApi
+
+FILM_ID = '00af52ec-9345-4d66-adbe-50eb917f463a'
+
+
+class FakeClient:
+    """Elasticsearch client rejecting every search the way the node rejects an unparsable search_after."""
+
+    def search(self, **kwargs):
+        meta = ApiResponseMeta(400, '1.1', HttpHeaders(), 0.0, NodeConfig('http', 'localhost', 9200))
+        raise BadRequestError('parsing_exception', meta, {'error': 'search_after has wrong type'})
+
+
+def sort(name):
+    return SORTS[name] + [{'id': 'asc'}]
+
+
+@pytest.mark.parametrize('name, values', [
+    ('relevance', [12.5, FILM_ID]),
+    ('-rating', [8, FILM_ID]),
+    ('-rating', ['-Infinity', FILM_ID]),
+    ('title', ['Star Wars', FILM_ID]),
+    ('title', [None, FILM_ID]),
+])
+def test_cursor_round_trip(name, values):
+    assert decode_search_after(encode_search_after(values), sort(name)) == values
+
+
+@pytest.mark.parametrize('name, values', [
+    ('-rating', [8.1]),
+    ('-rating', [8.1, FILM_ID, FILM_ID]),
+    ('-rating', ['high', FILM_ID]),
+    ('-rating', [True, FILM_ID]),
+    ('title', [1, FILM_ID]),
+    ('title', ['Star Wars', None]),
+    ('relevance', {'_score': 1}),
+])
+def test_cursor_not_matching_sort_is_rejected(name, values):
+    with pytest.raises(BadRequest):
+        decode_search_after(encode_search_after(values), sort(name))
+
+
+def test_undecodable_cursor_is_rejected():
+    with pytest.raises(BadRequest):
+        decode_search_after('not a cursor', sort('-rating'))
+
+
+def test_cursor_is_checked_against_requested_sort():
+    cursor = encode_search_after([8.1, FILM_ID])
+
+    assert build_search(QueryDict(f'sort=-rating&cursor={cursor}'))['search_after'] == [8.1, FILM_ID]
+    with pytest.raises(BadRequest):
+        build_search(QueryDict(f'sort=title&cursor={cursor}'))
+
+
+@override_settings(ES_INDEX='movies')
+def test_search_rejected_by_elasticsearch_is_bad_request(monkeypatch):
+    monkeypatch.setattr(search, 'get_client', FakeClient)
+    request = RequestFactory().get('/api/v1/movies/search', {'cursor': encode_search_after([8.1, FILM_ID])})
+
+    response = MoviesSearchApi.as_view()(request)
+
+    assert response.status_code == 400
+    assert json.loads(response.content) == {'detail': 'Invalid search parameters'}
@@ -0,0 +1,181 @@
+import asyncio
+import logging
+from time import perf_counter
+from typing import Any, Dict, List, Mapping, Optional, Tuple
+
+from elasticsearch import AsyncElasticsearch
+
+from backoff import backoff
+from batch_size import AdaptiveBatchSize
+from dead_letters import DeadLetterStore
+from elastic_search_loader import EncodedAction, chunk_actions, drop_unchanged, encode_action, make_actions, \
+    sort_out_items
+from etl.config import BULK_CHUNK_SIZE, BULK_MAX_CHUNK_BYTES, BULK_MAX_RETRIES, BULK_CHUNK_MIN, BULK_TARGET_SECONDS
+from fingerprints import AsyncFingerprintStore
+from logger import logger
+from metrics import DOCUMENTS, STAGE_SECONDS
+from models import FilmWork
+
+
+class AsyncElasticsearchLoader:
+    """
+    asyncio counterpart of ElasticsearchLoader built on AsyncElasticsearch.
+
+    The documents are chunked, retried, skipped as unchanged and counted the same way.
+    """
+
+    def __init__(self, es_host: str = "localhost", es_port: int = 9200, es_index: str = "movies",
+                 chunk_size: int = BULK_CHUNK_SIZE, max_chunk_bytes: int = BULK_MAX_CHUNK_BYTES,
+                 max_retries: int = BULK_MAX_RETRIES, dead_letters: DeadLetterStore | None = None,
+                 fingerprints: AsyncFingerprintStore | None = None) -> None:
+        """
+           Initialize the AsyncElasticsearchLoader.
+
+           :param es_host: The hostname or IP address of the Elasticsearch server. Default is 'localhost'.
+           :param es_port: The port number of the Elasticsearch server. Default is 9200.
+           :param es_index: The name of the Elasticsearch index to use. Default is 'movies'.
+           :param chunk_size: Max number of documents in a bulk request, the actual number is adapted
+                              down to BULK_CHUNK_MIN by the bulk round trip time and 429 rejections.
+           :param max_chunk_bytes: Max payload size of a bulk request.
+           :param max_retries: How many times documents rejected with a retryable status are re-sent.
+           :param dead_letters: Store of the permanently rejected documents.
+           :param fingerprints: Store of the indexed documents fingerprints, None to always send all documents.
+       """
+        self.es_index = es_index
+        self.batch_size = AdaptiveBatchSize('elasticsearch', chunk_size, min(BULK_CHUNK_MIN, chunk_size), chunk_size,
+                                            BULK_TARGET_SECONDS)
+        self.max_chunk_bytes = max_chunk_bytes
+        self.max_retries = max_retries
+        self.dead_letters = dead_letters or DeadLetterStore()
+        self.fingerprints = fingerprints
+        # Documents sent to the index and documents skipped as unchanged since the start
+        self.written = 0
+        self.skipped = 0
+        self.es = AsyncElasticsearch(f"http://{es_host}:{es_port}")
+
+    @backoff(breaker='elasticsearch')
+    async def create_index(self, mappings: Mapping[str, Any] | None = None,
+                           settings: Mapping[str, Any] | None = None) -> None:
+        """
+        Creates the index unless it exists.
+
+        :param mappings: Optional mappings for the Elasticsearch index. Default is None.
+        :param settings: Optional settings for the Elasticsearch index. Default is None.
+        """
+        if (await self.es.indices.exists(index=self.es_index)).body:
+            return
+
+        logger.info("Creating index %s ....", (self.es_index,))
+        await self.es.indices.create(index=self.es_index, mappings=mappings, settings=settings)
+        logger.info("Index %s created successfully!", (self.es_index,))
+
+        # Fingerprints of a previous index with the same name do not match the new empty one
+        if self.fingerprints is not None:
+            await self.fingerprints.clear()
+
+    async def load_actions(self, documents: List[Dict[str, Any]]) -> None:
+        """
+            Loads bulk actions to ElasticSearch, see ElasticsearchLoader.load_actions.
+
+            :param documents: List of bulk actions made by make_actions.
+            :return: None
+        """
+        with STAGE_SECONDS.labels('transform').time():
+            encoded = [(action, encode_action(action)) for action in documents]
+        pending = await self._drop_unchanged(encoded)
+        skipped = len(documents) - len(pending)
+        loaded = 0
+
+        for attempt in range(self.max_retries + 1):
+            rejected = []
+            for chunk in chunk_actions(pending, self.batch_size.size, self.max_chunk_bytes):
+                chunk_rejected, chunk_loaded = await self._load_chunk(chunk)
+                rejected += chunk_rejected
+                loaded += chunk_loaded
+
+            if not rejected:
+                break
+
+            if attempt == self.max_retries:
+                for (action, _), status, error in rejected:
+                    self.dead_letters.add(action, status, error)
+                break
+
+            sleep_time = min(0.1 * 2 ** attempt, 10)
+            logger.warning('%s documents rejected, will retry in: %s seconds', len(rejected), sleep_time)
+            await asyncio.sleep(sleep_time)
+            pending = [encoded for encoded, _, _ in rejected]
+
+        self.written += loaded
+        logger.info('Loading complete! %s Films uploaded, %s unchanged skipped!', loaded, skipped)
+
+    async def _drop_unchanged(self, actions: List[EncodedAction]) -> List[EncodedAction]:
+        """
+            Drops the documents equal to their last indexed version.
+
+            :param actions: Bulk actions with their encoded bulk lines.
+            :return: Bulk actions to send.
+        """
+        if self.fingerprints is None:
+            return actions
+
+        changed = drop_unchanged(actions,
+                                 await self.fingerprints.get_many([str(action['_id']) for action, _ in actions]))
+
+        self.skipped += len(actions) - len(changed)
+        DOCUMENTS.labels('unchanged').inc(len(actions) - len(changed))
+        return changed
+
+    async def _load_chunk(self, chunk: List[EncodedAction]) -> Tuple[List[Tuple[EncodedAction, int, Any]], int]:
+        """
+            Sends a chunk of actions and sorts out the rejected documents, see ElasticsearchLoader._load_chunk.
+
+            :param chunk: Actions with their encoded bulk lines.
+            :return: Actions rejected with a retryable status, with the status and the error,
+                     and the number of the indexed documents.
+        """
+        payload_bytes = sum(len(line) + 1 for _, lines in chunk for line in lines)
+        started = perf_counter()
+        response = await self._send_bulk([line for _, lines in chunk for line in lines])
+        elapsed = perf_counter() - started
+        STAGE_SECONDS.labels('bulk').observe(elapsed)
+
+        retryable, indexed = sort_out_items(chunk, response['items'], self.dead_letters)
+        if self.fingerprints is not None:
+            await self.fingerprints.set_many({id_: self.fingerprints.fingerprint(source)
+                                              for id_, source in indexed.items()})
+
+        logger.info('Bulk chunk: %s docs, %s bytes in %.3fs, %s to retry, %s failed',
+                    len(chunk), payload_bytes, elapsed, len(retryable), len(chunk) - len(retryable) - len(indexed))
+
+        self.batch_size.record(len(chunk), elapsed, payload_bytes=payload_bytes,
+                               throttled=any(status == 429 for _, status, _ in retryable))
+
+        return retryable, len(indexed)
+
+    @backoff(breaker='elasticsearch')
+    async def _send_bulk(self, lines: List[bytes]) -> Dict[str, Any]:
+        """
+            Sends the bulk request, retrying the whole request only on transport errors.
+
+            :param lines: Encoded bulk lines.
+            :return: Bulk response.
+        """
+        try:
+            return (await self.es.bulk(operations=lines)).body
+        except Exception as e:
+            logging.error('Loading to Elastic Search failed, Error: %s', (e,))
+            raise Exception(e)
+
+    async def load_data_to_es(self, films_data: List[Optional[FilmWork]]) -> None:
+        """
+            Loads data to ElasticSearch.
+
+            :param films_data: List of FilmWorks to load.
+            :return: None
+        """
+        await self.load_actions(make_actions(self.es_index, films_data))
+
+    async def close(self) -> None:
+        """Closes the connections of the client."""
+        await self.es.close()
@@ -0,0 +1,151 @@
+import asyncio
+from collections import deque
+from typing import AsyncGenerator, Deque, List, Tuple
+
+import asyncpg
+from redis.asyncio import Redis as AsyncRedis
+
+from async_elastic_search_loader import AsyncElasticsearchLoader
+from async_postgres_extractor import AsyncPostgresExtractor, init_connection
+from change_feed import LEGACY_MODIFIED_KEY, Checkpoint, Positions, SeenSet, decode_position, new_film_batches, \
+    seed_position
+from etl.config import TABLES_DATA, FILM_WORK_TABLE, DEDUP_MAX_IDS, REDIS_URL, DSL, SCHEMA_CONTENT, ES_HOST, \
+    ES_PORT, INDEX_NAME, ES_MAPPINGS, ES_SETTINGS, SLEEP_TIME, FILMS_QUERY, ASYNC_MAX_IN_FLIGHT, STRICT_VALIDATION, \
+    ES_SKIP_UNCHANGED
+from fingerprints import AsyncFingerprintStore
+from logger import logger
+from metrics import QUEUE_DEPTH, ROWS, STAGE_SECONDS, observe_committed, write_metrics_textfile
+from state import AsyncRedisStorage, AsyncState
+
+
+class AsyncChangeFeed:
+    """
+    asyncio counterpart of ChangeFeed: collects ids of changed FilmWorks from all the sources in a single pass.
+    """
+
+    def __init__(self, state: AsyncState, extractor: AsyncPostgresExtractor) -> None:
+        """
+        Initializes the AsyncChangeFeed instance.
+
+        :param state: State storage with the positions of the sources.
+        :param extractor: Extractor used to read the sources.
+        """
+        self.state = state
+        self.extractor = extractor
+        self.checkpoint = Checkpoint()
+
+    async def changed_film_ids(self) -> AsyncGenerator[Tuple[List[str], Positions], None]:
+        """
+        Reads every source from its saved position and yields the ids of the affected FilmWorks,
+        see ChangeFeed.changed_film_ids.
+
+        :return: AsyncGenerator of (FilmWork ids batch, positions) pairs.
+        """
+        seen = SeenSet(DEDUP_MAX_IDS)
+        until = await self.extractor.now()
+
+        for table, m2m, column_id in TABLES_DATA.values():
+            position = await self.state.get_state(f'{table}:position')
+            if position is None:
+                position = seed_position(position, await self.state.get_state(LEGACY_MODIFIED_KEY))
+            self.extractor.update_time(*decode_position(position))
+
+            logger.info("Collecting changes from table %s, filtering time %s", table, self.extractor.time)
+
+            async for batch_table_ids in self.extractor.load_table_ids(table, until):
+                ROWS.labels(table).inc(len(batch_table_ids))
+                if table == FILM_WORK_TABLE:
+                    film_ids = [str(id_) for id_, _ in batch_table_ids]
+                else:
+                    film_ids = [str(id_) for id_ in await self.extractor.load_film_ids(m2m, column_id,
+                                                                                        batch_table_ids)]
+
+                for batch in new_film_batches(seen, film_ids, self.extractor.chunk_size,
+                                              {table: batch_table_ids[-1]}):
+                    yield batch
+
+        logger.info("Collected %s changed films, %s duplicates skipped", seen.added, seen.skipped)
+
+    async def commit(self, positions: Positions) -> None:
+        """
+        Marks the (modified, id) positions of the sources as indexed, see ChangeFeed.commit.
+
+        :param positions: Last indexed ('id', 'modified') pair of every source.
+        :return: None
+        """
+        observe_committed(positions)
+        if self.checkpoint.add(positions):
+            await self.flush()
+
+    async def flush(self) -> None:
+        """
+        Writes all the committed positions to the state at once.
+
+        :return: None
+        """
+        if values := self.checkpoint.take():
+            with STAGE_SECONDS.labels('checkpoint').time():
+                await self.state.set_states(values)
+
+
+async def load_batch(extractor: AsyncPostgresExtractor, es_loader: AsyncElasticsearchLoader,
+                     film_ids: List[str]) -> None:
+    """
+    Loads the films from Postgres and indexes them.
+
+    :param extractor: Extractor used to load the films.
+    :param es_loader: Loader used to index the films.
+    :param film_ids: Ids of the films.
+    """
+    if film_ids:
+        await es_loader.load_data_to_es(await extractor.load_films(film_ids))
+
+
+async def load_data(state: AsyncState, extractor: AsyncPostgresExtractor, es_loader: AsyncElasticsearchLoader,
+                    max_in_flight: int = ASYNC_MAX_IN_FLIGHT):
+    # Up to max_in_flight batches are loaded concurrently, the positions are saved in the order
+    # of the batches, so a position is only saved after all the batches before it are indexed
+    change_feed = AsyncChangeFeed(state, extractor)
+    in_flight: Deque[Tuple[asyncio.Task, Positions]] = deque()
+    QUEUE_DEPTH.labels('in_flight').set_function(lambda: len(in_flight))
+
+    try:
+        async for batch_film_ids, positions in change_feed.changed_film_ids():
+            in_flight.append((asyncio.create_task(load_batch(extractor, es_loader, batch_film_ids)), positions))
+
+            while len(in_flight) >= max_in_flight:
+                task, task_positions = in_flight.popleft()
+                await task
+                await change_feed.commit(task_positions)
+
+        while in_flight:
+            task, task_positions = in_flight.popleft()
+            await task
+            await change_feed.commit(task_positions)
+    finally:
+        for task, _ in in_flight:
+            task.cancel()
+        await change_feed.flush()
+
+
+async def main():
+    redis_adapter = AsyncRedis.from_url(url=REDIS_URL)
+    state = AsyncState(storage=AsyncRedisStorage(redis_adapter=redis_adapter))
+    pool = await asyncpg.create_pool(database=DSL['dbname'], user=DSL['user'], password=DSL['password'],
+                                     host=DSL['host'], port=int(DSL['port']), init=init_connection,
+                                     min_size=1, max_size=ASYNC_MAX_IN_FLIGHT + 1)
+    es_loader = AsyncElasticsearchLoader(es_host=ES_HOST, es_port=ES_PORT, es_index=INDEX_NAME,
+                                         fingerprints=AsyncFingerprintStore(redis_adapter, INDEX_NAME)
+                                         if ES_SKIP_UNCHANGED else None)
+
+    try:
+        extractor = AsyncPostgresExtractor(pool, schema=SCHEMA_CONTENT, films_query=FILMS_QUERY,
+                                           validate=STRICT_VALIDATION)
+        await es_loader.create_index(mappings=ES_MAPPINGS, settings=ES_SETTINGS)
+        while True:
+            await load_data(state, extractor, es_loader)
+            write_metrics_textfile()
+            await asyncio.sleep(int(SLEEP_TIME))
+    finally:
+        await es_loader.close()
+        await pool.close()
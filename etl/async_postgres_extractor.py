@@ -0,0 +1,168 @@
+import datetime
+import json
+import uuid
+from time import perf_counter
+from typing import AsyncGenerator, List, Optional, Tuple, Union
+
+import asyncpg
+
+from backoff import backoff
+from batch_size import AdaptiveBatchSize
+from etl.config import EXTRACT_BATCH_SIZE, EXTRACT_BATCH_MIN, EXTRACT_BATCH_MAX, EXTRACT_TARGET_SECONDS
+from logger import logger
+from metrics import STAGE_SECONDS
+from models import FilmWork
+from postgres_extractor import FILMS_QUERIES, FILM_IDS_QUERY, NIL_UUID, TABLE_IDS_QUERY
+
+# Lower bound of the keyset pagination when there is no saved time and its upper bound when there is no cycle time
+MIN_TIME = datetime.datetime.min.replace(tzinfo=datetime.timezone.utc)
+MAX_TIME = datetime.datetime.max.replace(tzinfo=datetime.timezone.utc)
+
+
+async def init_connection(conn: asyncpg.Connection) -> None:
+    """
+    Decodes json and jsonb columns of the pool connections the same way psycopg2 does.
+
+    :param conn: New connection of the pool.
+    """
+    for type_name in ('json', 'jsonb'):
+        await conn.set_type_codec(type_name, encoder=json.dumps, decoder=json.loads, schema='pg_catalog')
+
+
+class AsyncPostgresExtractor:
+    """
+    asyncio counterpart of PostgresExtractor built on an asyncpg pool.
+
+    It runs the same queries; asyncpg prepares and caches them on every pool connection by itself.
+    """
+    time: Optional[datetime.datetime] = None
+    last_id: Optional[str] = None
+
+    def __init__(self, pool: asyncpg.Pool, schema: str = 'public', films_query: str = 'lateral',
+                 validate: bool = True, batch_size: Optional[AdaptiveBatchSize] = None) -> None:
+        """
+        Initializes the AsyncPostgresExtractor instance.
+
+        Args:
+            pool (asyncpg.Pool): A pool of PostgreSQL connections, see init_connection.
+            schema (str): The schema of the database to be used. Default is 'public'.
+            films_query (str): The key of FILMS_QUERIES used to assemble films. Default is 'lateral'.
+            validate (bool): Validate the film rows with pydantic, False trusts the database rows. Default is True.
+            batch_size (AdaptiveBatchSize | None): Size of the batches, adapted to the time of the films query.
+                                                   Default is the EXTRACT_BATCH_* configuration.
+        :return: None
+        """
+        self.pool = pool
+        self.schema = schema
+        self.films_query = films_query
+        self.validate = validate
+        self.batch_size = batch_size or AdaptiveBatchSize('postgres', EXTRACT_BATCH_SIZE, EXTRACT_BATCH_MIN,
+                                                          EXTRACT_BATCH_MAX, EXTRACT_TARGET_SECONDS)
+
+    @property
+    def chunk_size(self) -> int:
+        """Current size of the batches of ids and films."""
+        return self.batch_size.size
+
+    def update_time(self, time: Optional[Union[datetime.datetime, str]], last_id: Optional[str] = None):
+        """
+        Update the (time, id) position used for filtering during data extraction.
+
+        Args:
+            time (datetime.datetime | str | None): The time to use for filtering, None for no filtering.
+            last_id (str | None): The id of the last processed row with the given time.
+        """
+        self.last_id = last_id
+
+        if time is None or isinstance(time, datetime.datetime):
+            self.time = time
+            return
+
+        try:
+            self.time = datetime.datetime.fromisoformat(time)
+        except Exception as e:
+            logger.error('Error occurred during converting %s to datetime, time was set to None, Error: %s', time, e)
+            self.time = None
+
+    async def now(self) -> datetime.datetime:
+        """
+        Returns the current time of the database clock, see PostgresExtractor.now.
+
+        Returns:
+            datetime.datetime: The current time.
+        """
+        return (await self._fetch('SELECT clock_timestamp()'))[0][0]
+
+    async def load_table_ids(self, table: str, until: Optional[datetime.datetime] = None) \
+            -> AsyncGenerator[List[Tuple[uuid.UUID, datetime.datetime]], None]:
+        """
+        Fetches ('id', 'modified') pairs of the table with keyset pagination, see PostgresExtractor.load_table_ids.
+
+        Args:
+            table (str): The name of the table from which to retrieve the 'id' values.
+            until (datetime.datetime | None): Rows modified later are left for the next cycle.
+
+        Yields:
+            AsyncGenerator[List[Tuple[uuid.UUID, datetime.datetime]], None]: Batches of ('id', 'modified') pairs.
+        """
+        last_modified, last_id = self.time or MIN_TIME, uuid.UUID(self.last_id or NIL_UUID)
+        query = TABLE_IDS_QUERY.format(schema=self.schema, table=table)
+
+        while True:
+            data = [tuple(row) for row in await self._fetch(query, last_modified, last_id, self.chunk_size,
+                                                            until or MAX_TIME)]
+            if not data:
+                return
+
+            yield data
+
+            if len(data) < self.chunk_size:
+                return
+
+            last_id, last_modified = data[-1]
+
+    async def load_film_ids(self, m2m_table: str, column_id: str,
+                            ids: List[Tuple[uuid.UUID, datetime.datetime]]) -> List[uuid.UUID]:
+        """
+        Fetches FilmWork 'id' values related to the given rows through the m2m_table.
+
+        Args:
+            m2m_table (str): The name of the m2m table to read the FilmWork ids from.
+            column_id (str): The column ID representing the relationship with FilmWork.
+            ids (List[Tuple[uuid.UUID, datetime.datetime]]): ('id', 'modified') pairs of the related rows.
+
+        Returns:
+            List[uuid.UUID]: FilmWork ids.
+        """
+        query = FILM_IDS_QUERY.format(schema=self.schema, m2m_table=m2m_table, column_id=column_id)
+        return [row[0] for row in await self._fetch(query, [id_ for id_, _ in ids])]
+
+    async def load_films(self, film_ids: List[str]) -> List[FilmWork]:
+        """
+        Fetches film data based on the provided film_ids.
+
+        Args:
+            film_ids (List[str]): A list of FilmWork IDs to retrieve.
+
+        Returns:
+            List[FilmWork]: FilmWork objects.
+        """
+        query = FILMS_QUERIES[self.films_query].format(schema=self.schema)
+        started = perf_counter()
+        rows = await self._fetch(query, [uuid.UUID(id_) for id_ in film_ids])
+        elapsed = perf_counter() - started
+        STAGE_SECONDS.labels('extract').observe(elapsed)
+        self.batch_size.record(len(film_ids), elapsed)
+        return [FilmWork.from_row(dict(row, id=str(row['id'])), validate=self.validate) for row in rows]
+
+    @backoff(breaker='postgres')
+    async def _fetch(self, query: str, *args) -> List[asyncpg.Record]:
+        """
+        Runs the query on a connection of the pool.
+
+        :param query: SQL text with $1, $2, ... placeholders.
+        :param args: Values of the placeholders.
+        :return: Fetched rows.
+        """
+        async with self.pool.acquire() as conn:
+            return await conn.fetch(query, *args)
@@ -1,41 +1,215 @@
+import asyncio
+import inspect
+import random
+import threading
 from functools import wraps
-from time import sleep
+from time import monotonic, sleep
+from typing import Dict, Optional
 
+from etl.config import BREAKER_FAILURES, BREAKER_RESET_SECONDS
 from logger import logger
 
 
-def backoff(start_sleep_time=0.1, factor=2, border_sleep_time=10):
+class CircuitBreaker:
     """
-    Function for retrying the execution of a function after a certain time if an error occurs. It uses a naive exponential growth of the waiting time (factor) up to the maximum waiting time (border_sleep_time).
+    Circuit breaker shared by all the calls to one backend (Postgres, Elasticsearch, Redis).
+
+    After `failures` consecutive failed calls the circuit opens: for `reset_seconds` the callers
+    wait instead of hammering the backend with their own retries. Then one trial call is let
+    through (half-open); its success closes the circuit, its failure opens it again.
+    """
+
+    def __init__(self, name: str, failures: int = BREAKER_FAILURES, reset_seconds: float = BREAKER_RESET_SECONDS):
+        """
+        Initializes the CircuitBreaker instance.
+
+        :param name: Name of the backend, used in the logs.
+        :param failures: Number of consecutive failures which opens the circuit.
+        :param reset_seconds: Time the circuit stays open before a trial call.
+        """
+        self.name = name
+        self.failures = failures
+        self.reset_seconds = reset_seconds
+        self.failed = 0
+        self.opened_at: Optional[float] = None
+        self._lock = threading.Lock()
+
+    def remaining(self) -> float:
+        """
+        Time to wait before the next call is allowed.
+
+        :return: Seconds, 0 if the circuit is closed or half-open.
+        """
+        with self._lock:
+            if self.opened_at is None:
+                return 0
+            return max(0.0, self.opened_at + self.reset_seconds - monotonic())
+
+    def allow(self) -> bool:
+        """
+        Asks for a call to the backend.
+
+        While the circuit is half-open only one caller is let through, the others wait for
+        another reset_seconds or for the trial call to close the circuit.
+
+        :return: True if the call may be made now.
+        """
+        with self._lock:
+            if self.opened_at is None:
+                return True
+            if monotonic() - self.opened_at < self.reset_seconds:
+                return False
+            self.opened_at = monotonic()
+            return True
+
+    def success(self) -> None:
+        """Records a successful call."""
+        with self._lock:
+            if self.opened_at is not None:
+                logger.warning('Circuit %s closed', self.name)
+            self.failed = 0
+            self.opened_at = None
+
+    def failure(self) -> None:
+        """Records a failed call."""
+        with self._lock:
+            self.failed += 1
+            if self.failed >= self.failures:
+                if self.opened_at is None:
+                    logger.warning('Circuit %s opened after %s failures, calls wait %s seconds',
+                                   self.name, self.failed, self.reset_seconds)
+                self.opened_at = monotonic()
+
+
+_breakers: Dict[str, CircuitBreaker] = {}
+
+
+def circuit_breaker(name: str) -> CircuitBreaker:
+    """
+    Returns the circuit breaker of the backend, creating it on the first use.
+
+    :param name: Name of the backend.
+    :return: CircuitBreaker shared by the whole process.
+    """
+    return _breakers.setdefault(name, CircuitBreaker(name))
+
+
+def backoff(start_sleep_time=0.1, factor=2, border_sleep_time=10, breaker: Optional[str] = None,
+            recover: bool = False):
+    """
+    Function for retrying the execution of a function after a certain time if an error occurs. It uses an exponential growth of the waiting time (factor) up to the maximum waiting time (border_sleep_time) with jitter.
 
     Formula:
-    t = start_sleep_time * 2^(n) if t < border_sleep_time
+    t = start_sleep_time * factor^(n) if t < border_sleep_time
     t = border_sleep_time if t >= border_sleep_time
+    the actual sleep is a random time between t / 2 and t, so the clients do not retry in step
+
+    Generator functions are retried while they are iterated, not only when they are created. If a
+    generator fails after it has yielded some items, it is restarted with the keyword argument
+    resume_after set to the last yielded item, so it continues after it and no item is delivered
+    twice; a generator function without the resume_after argument is not restarted in that case.
+    Every delivered item starts the waiting time over from start_sleep_time.
+
+    With a breaker every attempt, the first one included, waits while the circuit is open.
 
     :param start_sleep_time: initial waiting time
     :param factor: factor by which the waiting time should be increased
     :param border_sleep_time: maximum waiting time
-    :return: result of the function execution
+    :param breaker: name of the backend whose circuit breaker the calls go through, see CircuitBreaker
+    :param recover: call recover(error) of the first argument (the instance) before every retry,
+                    e.g. to reconnect a broken connection
+    :return: result of the function execution (coroutine functions are awaited and retried without blocking the loop)
     """
 
+    def delays():
+        sleep_time = start_sleep_time
+        while True:
+            yield random.uniform(sleep_time / 2, sleep_time)
+            sleep_time = min(sleep_time * factor, border_sleep_time)
+
+    def failed(args, e):
+        logger.error('App stop with error: %s', (e,))
+        if breaker is not None:
+            circuit_breaker(breaker).failure()
+        if recover and args:
+            try:
+                args[0].recover(e)
+            except Exception as recover_error:
+                logger.error('Recovery after %s failed, Error: %s', e, recover_error)
+
+    def succeeded():
+        if breaker is not None:
+            circuit_breaker(breaker).success()
+
+    def blocked():
+        """Time to wait before the next attempt, 0 if the circuit lets it through."""
+        if breaker is None or circuit_breaker(breaker).allow():
+            return 0
+        wait = max(circuit_breaker(breaker).remaining(), 0.01)
+        logger.info('Circuit %s is open, will call in: %s seconds', breaker, round(wait, 3))
+        return wait
+
+    def wait_time(delay):
+        wait = max(delay, circuit_breaker(breaker).remaining()) if breaker is not None else delay
+        logger.info('Will retry in: %s seconds', (round(wait, 3),))
+        return wait
+
     def func_wrapper(func):
+        resumable = 'resume_after' in inspect.signature(func).parameters
+
         @wraps(func)
         def inner(*args, **kwargs):
-            sleep_time = start_sleep_time
-            while True:
+            for delay in delays():
+                while wait := blocked():
+                    sleep(wait)
                 try:
                     result = func(*args, **kwargs)
-                    break
+                    succeeded()
+                    return result
                 except Exception as e:
-                    logger.error('App stop with error: %s', (e,))
-                    logger.info('Will retry in: %s seconds', (sleep_time,))
+                    failed(args, e)
 
-                sleep(sleep_time)
-                new_sleep_time = sleep_time * 2 ** factor
-                sleep_time = new_sleep_time if new_sleep_time < border_sleep_time else border_sleep_time
+                sleep(wait_time(delay))
+
+        @wraps(func)
+        def gen_inner(*args, **kwargs):
+            last_item, delivered = None, False
+            retry_delays = delays()
+            while True:
+                while wait := blocked():
+                    sleep(wait)
+                try:
+                    for item in func(*args, **kwargs, **({'resume_after': last_item} if delivered else {})):
+                        succeeded()
+                        yield item
+                        last_item, delivered = item, True
+                        retry_delays = delays()
+                    return
+                except Exception as e:
+                    if delivered and not resumable:
+                        raise
+                    failed(args, e)
+
+                sleep(wait_time(next(retry_delays)))
+
+        @wraps(func)
+        async def async_inner(*args, **kwargs):
+            for delay in delays():
+                while wait := blocked():
+                    await asyncio.sleep(wait)
+                try:
+                    result = await func(*args, **kwargs)
+                    succeeded()
+                    return result
+                except Exception as e:
+                    failed(args, e)
 
-            return result
+                await asyncio.sleep(wait_time(delay))
 
+        if inspect.iscoroutinefunction(func):
+            return async_inner
+        if inspect.isgeneratorfunction(func):
+            return gen_inner
         return inner
 
     return func_wrapper
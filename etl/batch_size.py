@@ -0,0 +1,103 @@
+from typing import Any, Dict
+
+from logger import logger
+from metrics import BATCH_LAST_BYTES, BATCH_LAST_SECONDS, BATCH_SIZE, BATCH_SIZE_CHOICE
+
+
+class AdaptiveBatchSize:
+    """
+    Batch size which follows the measured latency of the batches towards a target time.
+
+    A full batch done in less than half of the target grows the size by up to 50%, a batch slower
+    than the target shrinks it proportionally but at most by half, a throttled batch (e.g. a 429
+    from Elasticsearch) halves it at once. The size always stays within [minimum, maximum],
+    equal bounds give a fixed size.
+    """
+
+    def __init__(self, name: str, initial: int, minimum: int, maximum: int, target_seconds: float) -> None:
+        """
+        Initializes the AdaptiveBatchSize instance.
+
+        :param name: Name of the batches, used in the logs.
+        :param initial: Size to start with.
+        :param minimum: Lower bound of the size.
+        :param maximum: Upper bound of the size.
+        :param target_seconds: Time a batch should take.
+        """
+        self.name = name
+        self.minimum = minimum
+        self.maximum = max(minimum, maximum)
+        self.target_seconds = target_seconds
+        self.size = self._bounded(initial)
+        # Why the size is what it is, reported with the size
+        self.reason = 'initial size'
+        self.last_elapsed = 0.0
+        self.last_bytes = 0
+        self.publish()
+
+    def record(self, count: int, elapsed: float, throttled: bool = False, payload_bytes: int = 0) -> int:
+        """
+        Adjusts the size by the measurements of a finished batch.
+
+        :param count: Number of the items in the batch.
+        :param elapsed: Time the batch took, in seconds.
+        :param throttled: The backend rejected some items because it is overloaded.
+        :param payload_bytes: Size of the batch payload, reported with the size.
+        :return: New size.
+        """
+        if count <= 0:
+            return self.size
+
+        self.last_elapsed, self.last_bytes = elapsed, payload_bytes
+        size, reason = self.size, self.reason
+
+        if throttled:
+            size, reason = self.size // 2, f'throttled, {count} items in {elapsed:.3f}s'
+        elif elapsed > self.target_seconds:
+            size = max(int(count * self.target_seconds / elapsed), self.size // 2)
+            reason = f'{count} items in {elapsed:.3f}s, slower than {self.target_seconds}s'
+        elif elapsed < self.target_seconds / 2 and count >= self.size:
+            size = min(int(count * self.target_seconds / max(elapsed, 1e-3)), self.size * 3 // 2)
+            reason = f'{count} items in {elapsed:.3f}s, faster than {self.target_seconds}s'
+
+        size = self._bounded(size)
+        if size != self.size:
+            logger.info('%s batch size changed from %s to %s: %s', self.name, self.size, size, reason)
+            self.size, self.reason = size, reason
+        self.publish()
+
+        return self.size
+
+    def snapshot(self) -> Dict[str, Any]:
+        """
+        Returns the current choice and the measurements it is based on.
+
+        :return: Size, bounds, target, last batch time and payload size, the reason of the last change.
+        """
+        return {
+            'name': self.name,
+            'size': self.size,
+            'minimum': self.minimum,
+            'maximum': self.maximum,
+            'target_seconds': self.target_seconds,
+            'last_elapsed': self.last_elapsed,
+            'last_bytes': self.last_bytes,
+            'reason': self.reason,
+        }
+
+    def publish(self) -> None:
+        """
+        Exports the snapshot to the metrics: the size, the last measurements and the reason of the choice.
+
+        :return: None
+        """
+        snapshot = self.snapshot()
+        BATCH_SIZE.labels(self.name).set(snapshot['size'])
+        BATCH_LAST_SECONDS.labels(self.name).set(snapshot['last_elapsed'])
+        BATCH_LAST_BYTES.labels(self.name).set(snapshot['last_bytes'])
+        BATCH_SIZE_CHOICE.labels(self.name).info({key: str(snapshot[key])
+                                                  for key in ('minimum', 'maximum', 'target_seconds', 'reason')})
+
+    def _bounded(self, size: int) -> int:
+        """Clamps the size to the bounds."""
+        return min(max(size, self.minimum), self.maximum)
@@ -0,0 +1,127 @@
+"""
+Measures the ETL throughput on the scenarios which matter in production, against the fake Elasticsearch.
+
+full:    the whole catalog is indexed from scratch
+films:   --touch random films are modified, only they have to be re-indexed
+persons: the --touch most linked persons are modified, every film of theirs has to be re-indexed
+
+Every scenario reports source rows/sec, documents/sec, peak RSS and the time of every stage.
+The engine is selected by ETL_ENGINE as in the ETL service ('async' is not supported here).
+The films and persons scenarios modify the catalog: run them on a generated one, see generate_catalog.py.
+
+Usage (from the etl directory, with the same environment as the ETL):
+    PYTHONPATH=..:. python benchmarks/bench_etl.py [--scenario full|films|persons|all] [--touch 10000]
+"""
+import argparse
+import resource
+from functools import partial
+from time import perf_counter
+from typing import Any, Dict, Optional
+
+import psycopg2
+from prometheus_client import REGISTRY
+
+from benchmarks.fake_es import FakeElasticsearch
+from change_feed import encode_position
+from elastic_search_loader import ElasticsearchLoader
+from etl.config import DSL, SCHEMA_CONTENT, FILMS_QUERY, STRICT_VALIDATION, TABLES_DATA, ETL_ENGINE
+from main import load_data
+from postgres_extractor import PostgresExtractor
+from state import BaseStorage, State
+
+STAGES = ('extract', 'transform', 'bulk', 'checkpoint')
+
+TOUCH_FILMS_QUERY = f"""
+UPDATE {SCHEMA_CONTENT}.film_work SET modified = now()
+WHERE id IN (SELECT id FROM {SCHEMA_CONTENT}.film_work ORDER BY random() LIMIT %s)
+"""
+
+TOUCH_PERSONS_QUERY = f"""
+UPDATE {SCHEMA_CONTENT}.person SET modified = now()
+WHERE id IN (
+    SELECT person_id FROM {SCHEMA_CONTENT}.person_film_work GROUP BY person_id ORDER BY count(*) DESC LIMIT %s
+)
+"""
+
+
+class MemoryStorage(BaseStorage):
+    """Keeps the states in memory as bytes, the way Redis returns them to State.get_state()."""
+
+    def __init__(self) -> None:
+        self.states: Dict[str, bytes] = {}
+
+    def save_state(self, state: dict) -> None:
+        self.states[state['key']] = str(state['value']).encode()
+
+    def retrieve_state(self, key: str) -> Optional[Any]:
+        return self.states.get(key)
+
+
+def counters() -> Dict[str, float]:
+    values = {'rows': sum(REGISTRY.get_sample_value('etl_source_rows_total', {'table': table}) or 0
+                          for table, _, _ in TABLES_DATA.values())}
+    for stage in STAGES:
+        values[stage] = REGISTRY.get_sample_value('etl_stage_seconds_sum', {'stage': stage}) or 0
+    return values
+
+
+def touch(query: Optional[str], count: int) -> Optional[str]:
+    if query is None:
+        return None
+
+    with psycopg2.connect(**DSL) as conn, conn.cursor() as cursor:
+        cursor.execute('SELECT now()')
+        started = cursor.fetchone()[0]
+        cursor.execute(query, (count,))
+    return started.isoformat()
+
+
+def run(scenario: str, touch_count: int, fake_es: FakeElasticsearch) -> None:
+    query = {'full': None, 'films': TOUCH_FILMS_QUERY, 'persons': TOUCH_PERSONS_QUERY}[scenario]
+    started_at = touch(query, touch_count)
+
+    state = State(storage=MemoryStorage())
+    if started_at is not None:
+        state.set_states({f'{table}:position': encode_position(None, started_at)
+                          for table, _, _ in TABLES_DATA.values()})
+
+    with psycopg2.connect(**DSL) as conn:
+        extractor = PostgresExtractor(conn, schema=SCHEMA_CONTENT, films_query=FILMS_QUERY,
+                                      validate=STRICT_VALIDATION, connect=partial(psycopg2.connect, **DSL))
+        es_loader = ElasticsearchLoader(es_host='127.0.0.1', es_port=fake_es.port, es_index='bench_movies')
+
+        before, documents = counters(), fake_es.documents
+        started = perf_counter()
+        load_data(state, extractor, es_loader)
+        elapsed = perf_counter() - started
+        after, documents = counters(), fake_es.documents - documents
+
+    rows = after['rows'] - before['rows']
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    stages = ', '.join(f"{stage} {after[stage] - before[stage]:.2f}s" for stage in STAGES)
+
+    print(f"{scenario:>8}: {elapsed:.2f}s, {rows:,.0f} rows ({rows / elapsed:,.0f}/s), "
+          f"{documents:,} documents ({documents / elapsed:,.0f}/s), peak RSS {peak_rss:,.0f} MB")
+    print(f"{'':>8}  {stages}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='Measure the ETL throughput against a fake Elasticsearch.')
+    parser.add_argument('--scenario', choices=('full', 'films', 'persons', 'all'), default='all')
+    parser.add_argument('--touch', type=int, default=10_000, help='films or persons modified by the scenario')
+    parser.add_argument('--record', help='file to append the bulk payloads to')
+    args = parser.parse_args()
+
+    if ETL_ENGINE == 'async':
+        parser.error("ETL_ENGINE=async is not supported, use 'sequential' or 'pipeline'")
+
+    fake_es = FakeElasticsearch(record_path=args.record).start()
+    try:
+        for scenario in ('full', 'films', 'persons') if args.scenario == 'all' else (args.scenario,):
+            run(scenario, args.touch, fake_es)
+    finally:
+        fake_es.shutdown()
+
+
+if __name__ == "__main__":
+    main()
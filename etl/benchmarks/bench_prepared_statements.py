@@ -0,0 +1,67 @@
+"""
+Compares the extractor queries built with `IN (%s, %s, ...)` against the prepared `= ANY($1)` statements.
+
+Every distinct batch size gives a new `IN` query text which Postgres has to parse and plan again,
+while the prepared statement is planned once per connection.
+
+Usage (from the etl directory, with the same environment as the ETL):
+    PYTHONPATH=..:. python benchmarks/bench_prepared_statements.py [iterations]
+"""
+import sys
+from time import perf_counter
+
+import psycopg2
+
+from etl.config import DSL, SCHEMA_CONTENT
+from prepared_statements import PreparedStatements
+
+BATCH_SIZES = (1, 7, 25, 50, 99, 100)
+
+IN_QUERY = """
+SELECT DISTINCT m2mfw.film_work_id
+FROM {schema}.person_film_work m2mfw
+WHERE m2mfw.person_id IN ({placeholders})
+"""
+
+ANY_QUERY = """
+SELECT DISTINCT m2mfw.film_work_id
+FROM {schema}.person_film_work m2mfw
+WHERE m2mfw.person_id = ANY($1)
+"""
+
+
+def run_in_query(cursor, ids):
+    cursor.execute(IN_QUERY.format(schema=SCHEMA_CONTENT, placeholders=', '.join(['%s'] * len(ids))), ids)
+    cursor.fetchall()
+
+
+def run_prepared_query(statements, cursor, ids):
+    statements.execute(cursor, 'bench_person_film_ids', ANY_QUERY.format(schema=SCHEMA_CONTENT), ('uuid[]',), (ids,))
+    cursor.fetchall()
+
+
+def main(iterations: int = 200) -> None:
+    with psycopg2.connect(**DSL) as conn, conn.cursor() as cursor:
+        cursor.execute(f"SELECT id FROM {SCHEMA_CONTENT}.person LIMIT %s", (max(BATCH_SIZES),))
+        person_ids = [row[0] for row in cursor.fetchall()]
+
+        statements = PreparedStatements(conn)
+        batches = [person_ids[:size] for size in BATCH_SIZES] * iterations
+
+        started = perf_counter()
+        for ids in batches:
+            run_in_query(cursor, ids)
+        in_time = perf_counter() - started
+
+        started = perf_counter()
+        for ids in batches:
+            run_prepared_query(statements, cursor, ids)
+        any_time = perf_counter() - started
+
+    print(f"{len(batches)} queries, batch sizes {BATCH_SIZES}")
+    print(f"IN (%s, ...):      {in_time:.3f}s, {in_time / len(batches) * 1000:.3f}ms per query")
+    print(f"prepared = ANY($1): {any_time:.3f}s, {any_time / len(batches) * 1000:.3f}ms per query")
+
+
+if __name__ == "__main__":
+    main(*map(int, sys.argv[1:2]))
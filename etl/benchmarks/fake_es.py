@@ -0,0 +1,123 @@
+"""
+Local stand-in for Elasticsearch which accepts every bulk request and records what it received.
+
+It answers the requests the ETL loaders make (index exists / create, _bulk) and reports every
+document as created, so the benchmarks measure the ETL itself and not an Elasticsearch node.
+
+Usage (from the etl directory), e.g. to look at the payloads of a regular ETL run:
+    PYTHONPATH=..:. python benchmarks/fake_es.py [port] [payloads file]
+"""
+import json
+import sys
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List, Optional
+
+ACTIONS = ('index', 'create', 'update', 'delete')
+
+
+class FakeElasticsearch(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, port: int = 0, record_path: Optional[str] = None) -> None:
+        super().__init__(('127.0.0.1', port), BulkHandler)
+        self.record_path = record_path
+        self.requests = 0
+        self.documents = 0
+        self.bytes = 0
+        self._lock = threading.Lock()
+
+    @property
+    def port(self) -> int:
+        return self.server_address[1]
+
+    def start(self) -> 'FakeElasticsearch':
+        threading.Thread(target=self.serve_forever, name='fake-es', daemon=True).start()
+        return self
+
+    def record(self, body: bytes, documents: int) -> None:
+        with self._lock:
+            self.requests += 1
+            self.documents += documents
+            self.bytes += len(body)
+            if self.record_path:
+                with open(self.record_path, 'ab') as file:
+                    file.write(body)
+
+
+class BulkHandler(BaseHTTPRequestHandler):
+    server: FakeElasticsearch
+
+    def do_HEAD(self) -> None:
+        self.respond(200, None)
+
+    def do_GET(self) -> None:
+        self.respond(200, {'name': 'fake-es', 'cluster_name': 'bench', 'version': {'number': '8.8.2'},
+                           'tagline': 'You Know, for Search'})
+
+    def do_PUT(self) -> None:
+        # The Python client sends the bulk requests with PUT
+        body = self.read_body()
+        if self.is_bulk():
+            self.bulk(body)
+            return
+
+        self.respond(200, {'acknowledged': True, 'shards_acknowledged': True, 'index': self.path.strip('/')})
+
+    def do_POST(self) -> None:
+        body = self.read_body()
+        if self.is_bulk():
+            self.bulk(body)
+            return
+
+        self.respond(200, {'acknowledged': True})
+
+    def is_bulk(self) -> bool:
+        return self.path.split('?')[0].endswith('/_bulk')
+
+    def bulk(self, body: bytes) -> None:
+        items = bulk_items(body)
+        self.server.record(body, len(items))
+        self.respond(200, {'took': 0, 'errors': False, 'items': items})
+
+    def read_body(self) -> bytes:
+        return self.rfile.read(int(self.headers.get('Content-Length') or 0))
+
+    def respond(self, status: int, body: Optional[Dict[str, Any]]) -> None:
+        payload = json.dumps(body).encode() if body is not None else b''
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('X-Elastic-Product', 'Elasticsearch')
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        if self.command != 'HEAD':
+            self.wfile.write(payload)
+
+    def log_message(self, format: str, *args: Any) -> None:
+        pass
+
+
+def bulk_items(body: bytes) -> List[Dict[str, Any]]:
+    items, lines = [], iter(body.splitlines())
+    for line in lines:
+        if not line.strip():
+            continue
+
+        action, meta = next(iter(json.loads(line).items()))
+        if action not in ACTIONS:
+            continue
+        if action != 'delete':
+            next(lines, None)
+
+        items.append({action: {'_index': meta.get('_index'), '_id': meta.get('_id'), 'status': 201,
+                               'result': 'created'}})
+    return items
+
+
+if __name__ == "__main__":
+    server = FakeElasticsearch(int(sys.argv[1]) if len(sys.argv) > 1 else 9200, *sys.argv[2:3])
+    print(f"Fake Elasticsearch on port {server.port}, Ctrl+C to stop")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print(f"{server.requests} bulk requests, {server.documents} documents, {server.bytes} bytes")
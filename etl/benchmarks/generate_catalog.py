@@ -0,0 +1,140 @@
+"""
+Fills the content schema with a synthetic catalog of the given scale for the ETL benchmarks.
+
+Persons get a skewed popularity: a few of them appear in thousands of films, most in a handful,
+and the cast sizes of the films are skewed the same way, so mass person updates fan out like
+they do on a real catalog. The same --seed always gives the same catalog.
+
+Usage (from the etl directory, with the same environment as the ETL; use a dedicated database):
+    PYTHONPATH=..:. python benchmarks/generate_catalog.py --films 1000000 --persons 200000 --links 10000000
+"""
+import argparse
+import datetime
+import io
+import random
+import uuid
+from time import perf_counter
+
+import psycopg2
+
+from etl.config import DSL, SCHEMA_CONTENT
+
+ROLES = ('director', 'writer', 'writer', 'actor')
+COPY_ROWS = 50_000
+
+
+def make_uuid(rng: random.Random) -> str:
+    return str(uuid.UUID(int=rng.getrandbits(128), version=4))
+
+
+def make_time(rng: random.Random, now: datetime.datetime) -> str:
+    return (now - datetime.timedelta(seconds=rng.randrange(365 * 24 * 3600))).isoformat()
+
+
+def popular_index(rng: random.Random, size: int, skew: float) -> int:
+    # rng.random() ** skew is close to 0 most of the time, so the first indexes are picked most often
+    return int(size * rng.random() ** skew)
+
+
+def cast_size(rng: random.Random, average: float) -> int:
+    return max(1, round(rng.expovariate(1 / average)))
+
+
+def copy_rows(cursor, table: str, columns: str, rows) -> int:
+    buffer, count = io.StringIO(), 0
+    for row in rows:
+        buffer.write('\t'.join(row) + '\n')
+        count += 1
+        if count % COPY_ROWS == 0:
+            buffer.seek(0)
+            cursor.copy_expert(f"COPY {SCHEMA_CONTENT}.{table} ({columns}) FROM STDIN", buffer)
+            buffer = io.StringIO()
+
+    buffer.seek(0)
+    cursor.copy_expert(f"COPY {SCHEMA_CONTENT}.{table} ({columns}) FROM STDIN", buffer)
+    return count
+
+
+def genres(ids, rng, now):
+    for i, id_ in enumerate(ids):
+        created = make_time(rng, now)
+        yield id_, f'Genre {i}', '\\N', created, created
+
+
+def persons(ids, rng, now):
+    for i, id_ in enumerate(ids):
+        created = make_time(rng, now)
+        yield id_, f'Person {i}', created, created
+
+
+def films(film_ids, rng, now):
+    for i, id_ in enumerate(film_ids):
+        created = make_time(rng, now)
+        yield (id_, f'Film {i}', f'Synthetic film number {i}', '\\N', f'{rng.uniform(1, 10):.1f}', 'movie',
+               created, created)
+
+
+def person_links(film_ids, person_ids, rng, now, average, skew):
+    for film_id in film_ids:
+        cast = {popular_index(rng, len(person_ids), skew) for _ in range(cast_size(rng, average))}
+        for position, person in enumerate(cast):
+            yield make_uuid(rng), person_ids[person], film_id, ROLES[min(position, len(ROLES) - 1)], now.isoformat()
+
+
+def genre_links(film_ids, genre_ids, rng, now, per_film):
+    for film_id in film_ids:
+        for genre in {popular_index(rng, len(genre_ids), 2) for _ in range(per_film)}:
+            yield make_uuid(rng), genre_ids[genre], film_id, now.isoformat()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='Fill the content schema with a synthetic catalog.')
+    parser.add_argument('--films', type=int, default=100_000)
+    parser.add_argument('--persons', type=int, default=20_000)
+    parser.add_argument('--genres', type=int, default=30)
+    parser.add_argument('--links', type=int, default=1_000_000, help='approximate number of person links')
+    parser.add_argument('--genres-per-film', type=int, default=3)
+    parser.add_argument('--skew', type=float, default=3, help='person popularity skew, 1 is uniform')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--truncate', action='store_true', help='remove the existing catalog first')
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    now = datetime.datetime(2023, 8, 1, tzinfo=datetime.timezone.utc)
+    genre_ids = [make_uuid(rng) for _ in range(args.genres)]
+    person_ids = [make_uuid(rng) for _ in range(args.persons)]
+    film_ids = [make_uuid(rng) for _ in range(args.films)]
+
+    started = perf_counter()
+    with psycopg2.connect(**DSL) as conn, conn.cursor() as cursor:
+        if args.truncate:
+            cursor.execute(f"TRUNCATE {SCHEMA_CONTENT}.film_work, {SCHEMA_CONTENT}.person, {SCHEMA_CONTENT}.genre "
+                           f"CASCADE")
+
+        counts = {
+            'genre': copy_rows(cursor, 'genre', 'id, name, description, created, modified',
+                               genres(genre_ids, rng, now)),
+            'person': copy_rows(cursor, 'person', 'id, full_name, created, modified',
+                                persons(person_ids, rng, now)),
+            'film_work': copy_rows(cursor, 'film_work',
+                                   'id, title, description, creation_date, rating, type, created, modified',
+                                   films(film_ids, rng, now)),
+            'person_film_work': copy_rows(cursor, 'person_film_work', 'id, person_id, film_work_id, role, created',
+                                          person_links(film_ids, person_ids, rng, now, args.links / args.films,
+                                                       args.skew)),
+            'genre_film_work': copy_rows(cursor, 'genre_film_work', 'id, genre_id, film_work_id, created',
+                                         genre_links(film_ids, genre_ids, rng, now, args.genres_per_film)),
+        }
+
+    with psycopg2.connect(**DSL) as conn:
+        conn.autocommit = True
+        with conn.cursor() as cursor:
+            cursor.execute('ANALYZE')
+
+    for table, count in counts.items():
+        print(f"{table:>16}: {count:,} rows")
+    print(f"Generated in {perf_counter() - started:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,307 @@
+import datetime
+import uuid
+from time import monotonic
+from typing import Collection, Dict, Generator, List, Optional, Set, Tuple, Union
+
+from etl.config import TABLES_DATA, FILM_WORK_TABLE, DEDUP_MAX_IDS, CHECKPOINT_BATCHES, CHECKPOINT_SECONDS
+from leases import Lease, LeaseLost
+from logger import logger
+from metrics import ROWS, STAGE_SECONDS, observe_committed
+from postgres_extractor import PostgresExtractor
+from state import State
+
+# Last processed ('id', 'modified') pair of every source table
+Positions = Dict[str, Tuple[str, datetime.datetime]]
+
+# State key of the single time all the sources were read from before they had their own positions
+LEGACY_MODIFIED_KEY = 'last_modified'
+
+
+def encode_position(last_id: Optional[str], last_modified: Union[datetime.datetime, str]) -> str:
+    """
+    Encodes the (modified, id) position of a source to a state value.
+
+    :param last_id: Id of the last processed row, None to read all the rows with the given time.
+    :param last_modified: Time of the last processed row.
+    :return: State value.
+    """
+    if isinstance(last_modified, datetime.datetime):
+        last_modified = last_modified.isoformat()
+    return f'{last_modified}|{last_id or ""}'
+
+
+def seed_position(position: Optional[str], legacy_modified: Optional[str]) -> Optional[str]:
+    """
+    Seeds the position of a source never saved from the time of LEGACY_MODIFIED_KEY, so an upgraded
+    ETL continues from where the previous version stopped instead of reading all the rows again.
+
+    :param position: Saved state value of the source position.
+    :param legacy_modified: Saved value of LEGACY_MODIFIED_KEY.
+    :return: State value of the position, None if there is neither of them.
+    """
+    if position is None and legacy_modified:
+        return encode_position(None, legacy_modified)
+    return position
+
+
+def decode_position(value: Optional[str]) -> Tuple[Optional[str], Optional[str]]:
+    """
+    Decodes the state value made by encode_position.
+
+    :param value: State value, None if the source has not been read yet.
+    :return: Time and id of the last processed row, (None, None) if there is no position.
+    """
+    if not value:
+        return None, None
+
+    last_modified, _, last_id = value.partition('|')
+    return last_modified, last_id or None
+
+
+class Checkpoint:
+    """
+    Source positions committed since the last write to the state.
+
+    Lets the feeds write the positions of all the sources together once per every_batches
+    committed batches or every_seconds seconds instead of after every batch.
+    """
+
+    def __init__(self, key_prefix: str = '', every_batches: int = CHECKPOINT_BATCHES,
+                 every_seconds: float = CHECKPOINT_SECONDS) -> None:
+        """
+        Initializes the Checkpoint instance.
+
+        :param key_prefix: Prefix of the state keys.
+        :param every_batches: Number of the committed batches which makes the checkpoint due.
+        :param every_seconds: Time since the last write which makes the checkpoint due.
+        """
+        self.key_prefix = key_prefix
+        self.every_batches = every_batches
+        self.every_seconds = every_seconds
+        self.positions: Positions = {}
+        self.batches = 0
+        self.taken_at = monotonic()
+
+    def add(self, positions: Positions) -> bool:
+        """
+        Adds the positions of a committed batch.
+
+        :param positions: Last indexed ('id', 'modified') pair of every source.
+        :return: True if the checkpoint is due.
+        """
+        self.positions.update(positions)
+        self.batches += 1
+        return self.batches >= self.every_batches or monotonic() - self.taken_at >= self.every_seconds
+
+    def take(self) -> Dict[str, str]:
+        """
+        Returns the state values of the added positions and starts a new checkpoint.
+
+        :return: Positions by the state keys.
+        """
+        values = {f'{self.key_prefix}{table}:position': encode_position(str(last_id), last_modified)
+                  for table, (last_id, last_modified) in self.positions.items()}
+
+        self.positions = {}
+        self.batches = 0
+        self.taken_at = monotonic()
+        return values
+
+
+class SeenSet:
+    """
+    Memory-bounded set of the FilmWork ids already yielded during the current cycle.
+
+    Ids are stored as 16 raw bytes instead of 36-character strings. When the set grows over
+    max_size it is cleared, so in the worst case a film is indexed once more, but never skipped.
+    The sources of a cycle must be read up to its start time, see ChangeFeed.changed_film_ids.
+    """
+
+    def __init__(self, max_size: int) -> None:
+        """
+        Initializes the SeenSet instance.
+
+        :param max_size: Max number of ids to keep.
+        """
+        self.max_size = max_size
+        self.added = 0
+        self.skipped = 0
+        self._ids: Set[bytes] = set()
+
+    def add(self, id_: str) -> bool:
+        """
+        Adds the id to the set.
+
+        :param id_: FilmWork id.
+        :return: True if the id was not seen before, False otherwise.
+        """
+        key = uuid.UUID(id_).bytes
+        if key in self._ids:
+            self.skipped += 1
+            return False
+
+        if len(self._ids) >= self.max_size:
+            logger.warning("Seen film ids limit %s reached, the set was cleared", self.max_size)
+            self._ids.clear()
+
+        self._ids.add(key)
+        self.added += 1
+        return True
+
+
+class ChangeFeed:
+    """
+    Collects ids of changed FilmWorks from all the sources in TABLES_DATA in a single pass.
+
+    Every source keeps its own (modified, id) position in the state, so a change in one table
+    never moves the position of another one. The positions of all the sources are written
+    together, in one Redis request per checkpoint, or in one request per source when the
+    sources are leased.
+    """
+
+    def __init__(self, state: State, extractor: PostgresExtractor, key_prefix: str = '',
+                 leases: Optional[Collection[Lease]] = None) -> None:
+        """
+        Initializes the ChangeFeed instance.
+
+        :param state: State storage with the positions of the sources.
+        :param extractor: Extractor used to read the sources.
+        :param key_prefix: Prefix of the state keys, lets several feeds keep separate positions.
+        :param leases: Leases of the sources held by this worker, named by the tables. Only these sources
+            are read, and the position of each one is only saved while its own lease is held.
+            All the TABLES_DATA sources are read without leases.
+        """
+        self.state = state
+        self.extractor = extractor
+        self.key_prefix = key_prefix
+        self.leases = None if leases is None else {lease.unit: lease for lease in leases}
+        self.checkpoint = Checkpoint(key_prefix)
+
+    def changed_film_ids(self) -> Generator[Tuple[List[str], Positions], None, None]:
+        """
+        Reads every source from its saved position and yields the ids of the affected FilmWorks.
+
+        Every FilmWork is yielded at most once per cycle, however many of its persons or genres
+        have changed. Each batch comes with the source positions which may be saved by commit()
+        once this batch and all the previous ones have been indexed. A source batch which does
+        not affect any new films still yields an empty batch with its position.
+
+        Every source is read up to the time the cycle started at. A film loaded after that time
+        already shows the changes read by the later sources, so skipping it there loses nothing,
+        while a change made after the film was loaded is left for the next cycle.
+
+        :return: Generator of (FilmWork ids batch, positions) pairs.
+        """
+        seen = SeenSet(DEDUP_MAX_IDS)
+        until = self.extractor.now()
+
+        for table, m2m, column_id in TABLES_DATA.values():
+            if self.leases is not None and table not in self.leases:
+                continue
+
+            self.extractor.update_time(*decode_position(self._saved_position(table)))
+
+            logger.info("Collecting changes from table %s, filtering time %s", table, self.extractor.time)
+
+            for batch_table_ids in self.extractor.load_table_ids(table, until):
+                ROWS.labels(table).inc(len(batch_table_ids))
+                if table == FILM_WORK_TABLE:
+                    film_ids = [str(id_) for id_, _ in batch_table_ids]
+                else:
+                    film_ids = [str(id_)
+                                for batch_film_ids in self.extractor.load_film_ids(m2m, column_id, batch_table_ids)
+                                for id_, in batch_film_ids]
+
+                yield from new_film_batches(seen, film_ids, self.extractor.chunk_size, {table: batch_table_ids[-1]})
+
+        logger.info("Collected %s changed films, %s duplicates skipped", seen.added, seen.skipped)
+
+    def _saved_position(self, table: str) -> Optional[str]:
+        """
+        Reads the saved position of the source, see seed_position.
+
+        :param table: Source table.
+        :return: State value of the position, None to read all the rows.
+        """
+        position = self.state.get_state(f'{self.key_prefix}{table}:position')
+        if position is None and not self.key_prefix:
+            position = seed_position(position, self.state.get_state(LEGACY_MODIFIED_KEY))
+        return position
+
+    def commit(self, positions: Positions) -> None:
+        """
+        Marks the (modified, id) positions of the sources as indexed.
+
+        The positions are written to the state by flush(), which is called here once per
+        CHECKPOINT_BATCHES commits or CHECKPOINT_SECONDS seconds.
+
+        :param positions: Last indexed ('id', 'modified') pair of every source.
+        :return: None
+        """
+        if self.leases is not None:
+            for table in positions:
+                if not self.leases[table].held:
+                    raise LeaseLost(f'Lease of {table} lost, the cycle is stopped')
+
+        observe_committed(positions)
+        if self.checkpoint.add(positions):
+            self.flush()
+
+    def flush(self) -> None:
+        """
+        Writes all the committed positions to the state at once.
+
+        Must be called when the consumer stops, so the last committed batches are not read again.
+        With leases the position of every source is fenced by its own lease: the positions of the
+        held sources are saved even if another one was lost.
+
+        :return: None
+        """
+        if values := self.checkpoint.take():
+            with STAGE_SECONDS.labels('checkpoint').time():
+                if self.leases is None:
+                    self.state.set_states(values)
+                    return
+
+                lost = []
+                for table, lease in self.leases.items():
+                    key = f'{self.key_prefix}{table}:position'
+                    if key in values:
+                        try:
+                            lease.save_states({key: values[key]})
+                        except LeaseLost:
+                            lost.append(table)
+
+                if lost:
+                    raise LeaseLost(f"Leases of {', '.join(lost)} lost, their checkpoints discarded")
+
+
+def new_film_batches(seen: SeenSet, film_ids: List[str], size: int,
+                     positions: Positions) -> List[Tuple[List[str], Positions]]:
+    """
+    Drops the already seen film ids and splits the rest to the batches.
+
+    The positions are attached to the last batch, an empty batch is made if no new ids are left,
+    so the positions are saved anyway.
+
+    :param seen: Film ids already yielded during the cycle.
+    :param film_ids: Film ids affected by a batch of source rows.
+    :param size: Max size of a batch.
+    :param positions: Positions of the source rows.
+    :return: List of (FilmWork ids batch, positions) pairs.
+    """
+    new_film_ids = [id_ for id_ in film_ids if seen.add(id_)]
+
+    *batches, last_batch = split_to_batches(new_film_ids, size) or [[]]
+    return [(batch, {}) for batch in batches] + [(last_batch, positions)]
+
+
+def split_to_batches(ids: List[str], size: int) -> List[List[str]]:
+    """
+    Splits ids to the batches of the given size.
+
+    :param ids: Ids to split.
+    :param size: Max size of a batch.
+    :return: List of batches.
+    """
+    return [ids[i:i + size] for i in range(0, len(ids), size)]
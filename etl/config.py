@@ -19,6 +19,57 @@ REDIS_URL = f"redis://{REDIS_HOST}:{REDIS_PORT}/0"
 SLEEP_TIME = os.environ.get('SLEEP_TIME', 2)
 LOG_LEVEL = os.environ.get('LOG_LEVEL', 'INFO')
 
+# ETL engine: 'sequential' runs the stages one after another, 'pipeline' runs them in parallel threads,
+# 'async' runs them on asyncio with asyncpg, AsyncElasticsearch and asyncio Redis
+ETL_ENGINE = os.environ.get('ETL_ENGINE', 'sequential')
+# Max number of batches waiting between two pipeline stages
+PIPELINE_QUEUE_SIZE = int(os.environ.get('PIPELINE_QUEUE_SIZE', 4))
+# Max number of batches loaded concurrently by the async engine
+ASYNC_MAX_IN_FLIGHT = int(os.environ.get('ASYNC_MAX_IN_FLIGHT', 4))
+
+# Change capture: 'polling' reads the 'modified' columns of the sources every SLEEP_TIME seconds,
+# 'outbox' waits for the NOTIFY of the etc/postgres/etl_outbox.ddl triggers and drains their outbox table
+CHANGE_CAPTURE = os.environ.get('CHANGE_CAPTURE', 'polling')
+# Max time the outbox mode waits for a notification before draining the outbox anyway
+OUTBOX_MAX_WAIT = float(os.environ.get('OUTBOX_MAX_WAIT', 60))
+
+# Full reindex: number of worker processes and of the film id ranges they share
+REINDEX_WORKERS = int(os.environ.get('REINDEX_WORKERS', os.cpu_count() or 1))
+REINDEX_PARTITIONS = int(os.environ.get('REINDEX_PARTITIONS', 16))
+
+# Strategy of the FilmWork documents assembly, one of postgres_extractor.FILMS_QUERIES keys
+FILMS_QUERY = os.environ.get('FILMS_QUERY', 'lateral')
+
+# Validate every film row with pydantic, by default the rows of the films query are trusted
+STRICT_VALIDATION = os.environ.get('STRICT_VALIDATION', 'False') == 'True'
+
+# Source positions are written to the state once per CHECKPOINT_BATCHES batches or CHECKPOINT_SECONDS seconds
+CHECKPOINT_BATCHES = int(os.environ.get('CHECKPOINT_BATCHES', 10))
+CHECKPOINT_SECONDS = float(os.environ.get('CHECKPOINT_SECONDS', 5))
+
+# Circuit breaker of a backend: consecutive failures which open it and seconds it stays open
+BREAKER_FAILURES = int(os.environ.get('BREAKER_FAILURES', 5))
+BREAKER_RESET_SECONDS = float(os.environ.get('BREAKER_RESET_SECONDS', 30))
+
+# Batches of ids and films read from Postgres: initial size, bounds and the target time of the films query.
+# The size is adapted to the measured time, equal bounds fix it
+EXTRACT_BATCH_SIZE = int(os.environ.get('EXTRACT_BATCH_SIZE', 100))
+EXTRACT_BATCH_MIN = int(os.environ.get('EXTRACT_BATCH_MIN', 20))
+EXTRACT_BATCH_MAX = int(os.environ.get('EXTRACT_BATCH_MAX', 1000))
+EXTRACT_TARGET_SECONDS = float(os.environ.get('EXTRACT_TARGET_SECONDS', 0.5))
+
+# Prometheus metrics: port of the HTTP endpoint and path of the file for the node_exporter textfile
+# collector, written after every cycle; empty values disable them
+METRICS_PORT = int(os.environ.get('METRICS_PORT') or 0)
+METRICS_TEXTFILE = os.environ.get('METRICS_TEXTFILE', '')
+
+# Lifetime of the work unit leases of the workers without heartbeats, a crashed worker's units are
+# claimed by the other workers after it
+LEASE_SECONDS = float(os.environ.get('LEASE_SECONDS', 30))
+
+# Max number of film ids remembered per cycle to index every film only once
+DEDUP_MAX_IDS = int(os.environ.get('DEDUP_MAX_IDS', 1_000_000))
+
 TABLES_DATA = {
     0: (FILM_WORK_TABLE, '', ''),
     1: (PERSON_TABLE, FILM_WORK_PERSON_M2M_TABLE, 'person_id'),
@@ -37,6 +88,18 @@ DSL = {
 INDEX_NAME = 'movies'
 ES_HOST = os.environ.get('ES_HOST', '127.0.0.1')
 ES_PORT = os.environ.get('ES_PORT', 9200)
+# Bulk requests: max documents and max payload bytes per request, retries of the rejected documents
+BULK_CHUNK_SIZE = int(os.environ.get('BULK_CHUNK_SIZE', 500))
+BULK_MAX_CHUNK_BYTES = int(os.environ.get('BULK_MAX_CHUNK_BYTES', 10 * 1024 * 1024))
+BULK_MAX_RETRIES = int(os.environ.get('BULK_MAX_RETRIES', 3))
+# Documents per bulk request are adapted between BULK_CHUNK_MIN and BULK_CHUNK_SIZE to the target round trip time,
+# a 429 from Elasticsearch halves them
+BULK_CHUNK_MIN = int(os.environ.get('BULK_CHUNK_MIN', 50))
+BULK_TARGET_SECONDS = float(os.environ.get('BULK_TARGET_SECONDS', 1))
+# Skip documents whose content did not change since they were last indexed
+ES_SKIP_UNCHANGED = os.environ.get('ES_SKIP_UNCHANGED', 'True') == 'True'
+# Replicas of the index restored after a full reindex, which loads the index without replicas
+ES_NUMBER_OF_REPLICAS = int(os.environ.get('ES_NUMBER_OF_REPLICAS', 1))
 
 ES_SETTINGS = {
     "refresh_interval": "1s",
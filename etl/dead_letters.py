@@ -0,0 +1,48 @@
+import datetime
+import json
+import threading
+from typing import Any, Dict
+
+from logger import logger
+from metrics import DOCUMENTS
+
+
+class DeadLetterStore:
+    """
+    Keeps the documents Elasticsearch permanently rejected, one JSON object per line.
+
+    Such documents (mapping conflicts, exhausted retries) are not re-sent with the next batches;
+    they are kept with the error to be inspected and re-indexed after the cause is fixed.
+    """
+
+    def __init__(self, path: str = 'logs/etl_dead_letters.jsonl') -> None:
+        """
+        Initializes the DeadLetterStore instance.
+
+        :param path: Path of the file the rejected documents are appended to.
+        """
+        self.path = path
+        self._lock = threading.Lock()
+
+    def add(self, action: Dict[str, Any], status: int, error: Any) -> None:
+        """
+        Stores the rejected bulk action.
+
+        :param action: Bulk action made by make_actions.
+        :param status: HTTP status of the document in the bulk response.
+        :param error: Error of the document in the bulk response.
+        :return: None
+        """
+        record = {
+            'time': datetime.datetime.now(datetime.timezone.utc).isoformat(),
+            'index': action.get('_index'),
+            'id': action.get('_id'),
+            'status': status,
+            'error': error,
+            'source': action.get('_source'),
+        }
+        with self._lock, open(self.path, 'a', encoding='utf-8') as file:
+            file.write(json.dumps(record, default=str, ensure_ascii=False) + '\n')
+        DOCUMENTS.labels('dead_letter').inc()
+
+        logger.error('Document %s rejected with status %s, moved to dead letters: %s', record['id'], status, error)
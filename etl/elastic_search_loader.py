@@ -1,23 +1,136 @@
 import logging
-from typing import List, Optional, Mapping, Any
+from time import perf_counter, sleep
+from typing import Any, Dict, Generator, List, Mapping, Optional, Tuple
 
-from elasticsearch import Elasticsearch, helpers
+import orjson
+from elasticsearch import Elasticsearch
 
 from backoff import backoff
+from batch_size import AdaptiveBatchSize
+from dead_letters import DeadLetterStore
+from fingerprints import FingerprintStore
+from etl.config import BULK_CHUNK_SIZE, BULK_MAX_CHUNK_BYTES, BULK_MAX_RETRIES, BULK_CHUNK_MIN, BULK_TARGET_SECONDS
 from logger import logger
+from metrics import BULK_ERRORS, DOCUMENTS, STAGE_SECONDS
 from models import FilmWork
 
+# Statuses of the documents in a bulk response which are worth re-sending
+RETRYABLE_STATUSES = (429, 502, 503, 504)
+
+# Bulk action with its encoded action and source lines
+EncodedAction = Tuple[Dict[str, Any], List[bytes]]
+
+
+def make_actions(es_index: str, films_data: List[Optional[FilmWork]]) -> List[Dict[str, Any]]:
+    """
+        Transforms FilmWorks to ElasticSearch bulk actions for the given index.
+
+        :param es_index: The name of the Elasticsearch index.
+        :param films_data: List of FilmWorks to transform.
+        :return: List of bulk actions.
+    """
+    return [
+        {
+            "_index": es_index,
+            "_id": film.id,
+            "_source": film.to_source()
+        }
+        for film in films_data
+    ]
+
+
+def encode_action(action: Dict[str, Any]) -> List[bytes]:
+    """
+        Encodes the bulk action to the bulk request lines.
+
+        :param action: Bulk action made by make_actions.
+        :return: Action and source lines.
+    """
+    header = {"index": {"_index": action["_index"], "_id": action["_id"]}}
+    return [orjson.dumps(header), orjson.dumps(action["_source"])]
+
+
+def chunk_actions(actions: List[EncodedAction], max_docs: int,
+                  max_bytes: int) -> Generator[List[EncodedAction], None, None]:
+    """
+        Splits the actions to the chunks limited by the number of documents and by the payload size.
+
+        :param actions: Bulk actions with their encoded bulk lines.
+        :param max_docs: Max number of documents in a chunk.
+        :param max_bytes: Max payload size of a chunk, a larger single document makes its own chunk.
+        :return: Generator of chunks of actions with their encoded bulk lines.
+    """
+    chunk, size = [], 0
+    for action, lines in actions:
+        action_size = sum(len(line) + 1 for line in lines)
+
+        if chunk and (len(chunk) == max_docs or size + action_size > max_bytes):
+            yield chunk
+            chunk, size = [], 0
+
+        chunk.append((action, lines))
+        size += action_size
+
+    if chunk:
+        yield chunk
+
+
+def drop_unchanged(actions: List[EncodedAction], saved: List[Optional[bytes]]) -> List[EncodedAction]:
+    """
+        Drops the documents equal to their last indexed version.
+
+        :param actions: Bulk actions with their encoded bulk lines.
+        :param saved: Fingerprints of the last indexed versions in the order of actions, None if never indexed.
+        :return: Bulk actions to send.
+    """
+    return [(action, lines) for (action, lines), fingerprint in zip(actions, saved)
+            if fingerprint != FingerprintStore.fingerprint(lines[1])]
+
+
+def sort_out_items(chunk: List[EncodedAction], items: List[Dict[str, Any]],
+                   dead_letters: DeadLetterStore) -> Tuple[List[Tuple[EncodedAction, int, Any]], Dict[str, bytes]]:
+    """
+        Sorts out the items of a bulk response, the permanently rejected documents are moved to the dead letters.
+
+        :param chunk: Actions with their encoded bulk lines, in the order of the bulk request.
+        :param items: Items of the bulk response.
+        :param dead_letters: Store of the permanently rejected documents.
+        :return: Actions rejected with a retryable status, with the status and the error,
+                 and the encoded sources of the indexed documents by their ids.
+    """
+    retryable, indexed = [], {}
+    for (action, lines), item in zip(chunk, items):
+        result = next(iter(item.values()))
+        status = result['status']
+        if status < 300:
+            indexed[str(action['_id'])] = lines[1]
+            continue
+
+        BULK_ERRORS.labels(status).inc()
+        if status in RETRYABLE_STATUSES:
+            retryable.append(((action, lines), status, result.get('error')))
+        else:
+            dead_letters.add(action, status, result.get('error'))
+
+    DOCUMENTS.labels('indexed').inc(len(indexed))
+    return retryable, indexed
+
 
 class ElasticsearchLoader:
 
-    @backoff()
+    @backoff(breaker='elasticsearch')
     def __init__(
             self,
             es_host: str = "localhost",
             es_port: int = 9200,
             es_index: str = "movies",
             mappings: Mapping[str, Any] | None = None,
-            settings: Mapping[str, Any] | None = None
+            settings: Mapping[str, Any] | None = None,
+            chunk_size: int = BULK_CHUNK_SIZE,
+            max_chunk_bytes: int = BULK_MAX_CHUNK_BYTES,
+            max_retries: int = BULK_MAX_RETRIES,
+            dead_letters: DeadLetterStore | None = None,
+            fingerprints: FingerprintStore | None = None
     ) -> None:
         """
            Initialize the ElasticsearchLoader.
@@ -27,10 +140,25 @@ class ElasticsearchLoader:
            :param es_index: The name of the Elasticsearch index to use. Default is 'movies'.
            :param mappings: Optional mappings for the Elasticsearch index. Default is None.
            :param settings: Optional settings for the Elasticsearch index. Default is None.
+           :param chunk_size: Max number of documents in a bulk request, the actual number is adapted
+                              down to BULK_CHUNK_MIN by the bulk round trip time and 429 rejections.
+           :param max_chunk_bytes: Max payload size of a bulk request.
+           :param max_retries: How many times documents rejected with a retryable status are re-sent.
+           :param dead_letters: Store of the permanently rejected documents.
+           :param fingerprints: Store of the indexed documents fingerprints, None to always send all documents.
        """
         self.es_host = es_host
         self.es_port = es_port
         self.es_index = es_index
+        self.batch_size = AdaptiveBatchSize('elasticsearch', chunk_size, min(BULK_CHUNK_MIN, chunk_size), chunk_size,
+                                            BULK_TARGET_SECONDS)
+        self.max_chunk_bytes = max_chunk_bytes
+        self.max_retries = max_retries
+        self.dead_letters = dead_letters or DeadLetterStore()
+        self.fingerprints = fingerprints
+        # Documents sent to the index and documents skipped as unchanged since the start
+        self.written = 0
+        self.skipped = 0
         self.es = Elasticsearch(f"http://{es_host}:{es_port}")
 
         if self.is_index_exists() is False:
@@ -40,6 +168,10 @@ class ElasticsearchLoader:
                 self.es.indices.create(index=es_index, mappings=mappings, settings=settings)
                 logger.info("Index %s created successfully!", (es_index,))
 
+                # Fingerprints of a previous index with the same name do not match the new empty one
+                if self.fingerprints is not None:
+                    self.fingerprints.clear()
+
             except Exception as e:
                 logging.error("Something went wrong while creating index %s , Error: %s", (es_index, e))
                 raise Exception
@@ -52,26 +184,119 @@ class ElasticsearchLoader:
         """
         return self.es.indices.exists(index=self.es_index).body
 
-    @backoff()
-    def load_data_to_es(self, films_data: List[Optional[FilmWork]]) -> None:
+    def make_actions(self, films_data: List[Optional[FilmWork]]) -> List[Dict[str, Any]]:
         """
-            Loads data to ElasticSearch.
+            Transforms FilmWorks to ElasticSearch bulk actions.
 
-            :param films_data: List of FilmWorks to load.
+            :param films_data: List of FilmWorks to transform.
+            :return: List of bulk actions.
+        """
+        with STAGE_SECONDS.labels('transform').time():
+            return make_actions(self.es_index, films_data)
+
+    def load_actions(self, documents: List[Dict[str, Any]]) -> None:
+        """
+            Loads bulk actions to ElasticSearch.
+
+            Actions are sent in chunks limited by both the number of documents and the payload size.
+            Only the documents rejected with a retryable status are sent again, the ones rejected
+            permanently or after the last retry are moved to the dead letters. With a fingerprint
+            store the documents equal to their last indexed version are skipped.
+
+            :param documents: List of bulk actions made by make_actions.
             :return: None
         """
-        documents = []
-        for film in films_data:
-            doc = {
-                "_index": self.es_index,
-                "_id": film.id,
-                "_source": film.model_dump(exclude={'modified'})
-            }
-            documents.append(doc)
+        with STAGE_SECONDS.labels('transform').time():
+            encoded = [(action, encode_action(action)) for action in documents]
+        pending = self._drop_unchanged(encoded)
+        skipped = len(documents) - len(pending)
+        loaded = 0
 
+        for attempt in range(self.max_retries + 1):
+            rejected = []
+            for chunk in chunk_actions(pending, self.batch_size.size, self.max_chunk_bytes):
+                chunk_rejected, chunk_loaded = self._load_chunk(chunk)
+                rejected += chunk_rejected
+                loaded += chunk_loaded
+
+            if not rejected:
+                break
+
+            if attempt == self.max_retries:
+                for (action, _), status, error in rejected:
+                    self.dead_letters.add(action, status, error)
+                break
+
+            sleep_time = min(0.1 * 2 ** attempt, 10)
+            logger.warning('%s documents rejected, will retry in: %s seconds', len(rejected), sleep_time)
+            sleep(sleep_time)
+            pending = [encoded for encoded, _, _ in rejected]
+
+        self.written += loaded
+        logger.info('Loading complete! %s Films uploaded, %s unchanged skipped!', loaded, skipped)
+
+    def _drop_unchanged(self, actions: List[EncodedAction]) -> List[EncodedAction]:
+        """
+            Drops the documents equal to their last indexed version.
+
+            :param actions: Bulk actions with their encoded bulk lines.
+            :return: Bulk actions to send.
+        """
+        if self.fingerprints is None:
+            return actions
+
+        changed = drop_unchanged(actions, self.fingerprints.get_many([str(action['_id']) for action, _ in actions]))
+
+        self.skipped += len(actions) - len(changed)
+        DOCUMENTS.labels('unchanged').inc(len(actions) - len(changed))
+        return changed
+
+    def _load_chunk(self, chunk: List[EncodedAction]) -> Tuple[List[Tuple[EncodedAction, int, Any]], int]:
+        """
+            Sends a chunk of actions and sorts out the rejected documents.
+
+            :param chunk: Actions with their encoded bulk lines.
+            :return: Actions rejected with a retryable status, with the status and the error,
+                     and the number of the indexed documents.
+        """
+        payload_bytes = sum(len(line) + 1 for _, lines in chunk for line in lines)
+        started = perf_counter()
+        response = self._send_bulk([line for _, lines in chunk for line in lines])
+        elapsed = perf_counter() - started
+        STAGE_SECONDS.labels('bulk').observe(elapsed)
+
+        retryable, indexed = sort_out_items(chunk, response['items'], self.dead_letters)
+        if self.fingerprints is not None:
+            self.fingerprints.set_many({id_: self.fingerprints.fingerprint(source)
+                                        for id_, source in indexed.items()})
+
+        logger.info('Bulk chunk: %s docs, %s bytes in %.3fs, %s to retry, %s failed',
+                    len(chunk), payload_bytes, elapsed, len(retryable), len(chunk) - len(retryable) - len(indexed))
+
+        self.batch_size.record(len(chunk), elapsed, payload_bytes=payload_bytes,
+                               throttled=any(status == 429 for _, status, _ in retryable))
+
+        return retryable, len(indexed)
+
+    @backoff(breaker='elasticsearch')
+    def _send_bulk(self, lines: List[bytes]) -> Dict[str, Any]:
+        """
+            Sends the bulk request, retrying the whole request only on transport errors.
+
+            :param lines: Encoded bulk lines.
+            :return: Bulk response.
+        """
         try:
-            helpers.bulk(self.es, documents)
-            logger.info('Loading complete! %s Films uploaded!', len(documents))
+            return self.es.bulk(operations=lines).body
         except Exception as e:
             logging.error('Loading to Elastic Search failed, Error: %s', (e,))
             raise Exception(e)
+
+    def load_data_to_es(self, films_data: List[Optional[FilmWork]]) -> None:
+        """
+            Loads data to ElasticSearch.
+
+            :param films_data: List of FilmWorks to load.
+            :return: None
+        """
+        self.load_actions(self.make_actions(films_data))
@@ -0,0 +1,114 @@
+import hashlib
+from typing import Dict, List, Optional
+
+from redis.asyncio import Redis as AsyncRedis
+from redis.client import Redis
+
+from backoff import backoff
+
+
+class FingerprintStore:
+    """
+    Compact fingerprints of the documents last indexed to Elasticsearch, kept in a Redis hash.
+
+    A fingerprint is an 8-byte BLAKE2b digest of the encoded '_source', so a film whose document
+    did not change since it was last indexed can be dropped before the bulk request.
+    """
+
+    def __init__(self, redis_adapter: Redis, es_index: str) -> None:
+        """
+        Initializes the FingerprintStore instance.
+
+        :param redis_adapter: Redis client.
+        :param es_index: The name of the Elasticsearch index the fingerprints belong to.
+        """
+        self.redis_adapter = redis_adapter
+        self.key = f'fingerprints:{es_index}'
+
+    @staticmethod
+    def fingerprint(source: bytes) -> bytes:
+        """
+        Computes the fingerprint of the encoded document.
+
+        :param source: Encoded '_source' of the document.
+        :return: 8-byte digest.
+        """
+        return hashlib.blake2b(source, digest_size=8).digest()
+
+    @backoff(breaker='redis')
+    def get_many(self, ids: List[str]) -> List[Optional[bytes]]:
+        """
+        Returns the fingerprints of the last indexed versions of the documents.
+
+        :param ids: Ids of the documents.
+        :return: Fingerprints in the order of ids, None for the documents never indexed.
+        """
+        return self.redis_adapter.hmget(self.key, ids) if ids else []
+
+    @backoff(breaker='redis')
+    def set_many(self, fingerprints: Dict[str, bytes]) -> None:
+        """
+        Saves the fingerprints of the indexed documents.
+
+        :param fingerprints: Fingerprints by the ids of the documents.
+        :return: None
+        """
+        if fingerprints:
+            self.redis_adapter.hset(self.key, mapping=fingerprints)
+
+    @backoff(breaker='redis')
+    def clear(self) -> None:
+        """
+        Forgets all the fingerprints, e.g. when the index is created from scratch.
+
+        :return: None
+        """
+        self.redis_adapter.delete(self.key)
+
+
+class AsyncFingerprintStore:
+    """
+    asyncio counterpart of FingerprintStore, keeps the fingerprints in the same Redis hash.
+    """
+
+    fingerprint = staticmethod(FingerprintStore.fingerprint)
+
+    def __init__(self, redis_adapter: AsyncRedis, es_index: str) -> None:
+        """
+        Initializes the AsyncFingerprintStore instance.
+
+        :param redis_adapter: asyncio Redis client.
+        :param es_index: The name of the Elasticsearch index the fingerprints belong to.
+        """
+        self.redis_adapter = redis_adapter
+        self.key = f'fingerprints:{es_index}'
+
+    @backoff(breaker='redis')
+    async def get_many(self, ids: List[str]) -> List[Optional[bytes]]:
+        """
+        Returns the fingerprints of the last indexed versions of the documents, see FingerprintStore.get_many.
+
+        :param ids: Ids of the documents.
+        :return: Fingerprints in the order of ids, None for the documents never indexed.
+        """
+        return await self.redis_adapter.hmget(self.key, ids) if ids else []
+
+    @backoff(breaker='redis')
+    async def set_many(self, fingerprints: Dict[str, bytes]) -> None:
+        """
+        Saves the fingerprints of the indexed documents.
+
+        :param fingerprints: Fingerprints by the ids of the documents.
+        :return: None
+        """
+        if fingerprints:
+            await self.redis_adapter.hset(self.key, mapping=fingerprints)
+
+    @backoff(breaker='redis')
+    async def clear(self) -> None:
+        """
+        Forgets all the fingerprints, e.g. when the index is created from scratch.
+
+        :return: None
+        """
+        await self.redis_adapter.delete(self.key)
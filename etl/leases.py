@@ -0,0 +1,216 @@
+import math
+import os
+import socket
+import threading
+import uuid
+from time import time
+from typing import Dict, List, Optional
+
+from redis.client import Redis
+
+from backoff import backoff
+from etl.config import LEASE_SECONDS
+from logger import logger
+
+# Prolongs the lease if it is still held by the owner
+RENEW_SCRIPT = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('PEXPIRE', KEYS[1], ARGV[2])
+end
+return 0
+"""
+
+# Removes the lease if it is still held by the owner
+RELEASE_SCRIPT = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('DEL', KEYS[1])
+end
+return 0
+"""
+
+# Writes the states (KEYS[2:], ARGV[2:]) only if the lease KEYS[1] is still held by the owner ARGV[1]
+FENCED_MSET_SCRIPT = """
+if redis.call('GET', KEYS[1]) ~= ARGV[1] then
+    return 0
+end
+for i = 2, #KEYS do
+    redis.call('SET', KEYS[i], ARGV[i])
+end
+return 1
+"""
+
+WORKERS_KEY = 'etl:workers'
+
+
+class LeaseLost(Exception):
+    """The lease of a work unit expired or was taken by another worker."""
+
+
+class Lease:
+    """
+    Exclusive right of a worker to process a work unit, kept in Redis with an expiry.
+
+    The owner prolongs the lease with heartbeats; if the owner dies, the lease expires and
+    another worker claims the unit, continuing from the last checkpoint of the unit.
+    """
+
+    def __init__(self, redis_adapter: Redis, unit: str, owner: str, ttl_seconds: float = LEASE_SECONDS) -> None:
+        """
+        Initializes the Lease instance.
+
+        :param redis_adapter: Redis client.
+        :param unit: Name of the work unit.
+        :param owner: Id of the worker.
+        :param ttl_seconds: Time the lease lives without heartbeats.
+        """
+        self.redis_adapter = redis_adapter
+        self.unit = unit
+        self.owner = owner
+        self.key = f'lease:{unit}'
+        self.ttl_ms = int(ttl_seconds * 1000)
+        self.held = False
+
+    @backoff(breaker='redis')
+    def acquire(self) -> bool:
+        """
+        Claims the unit if no other worker holds it.
+
+        :return: True if the lease is held by this worker.
+        """
+        self.held = bool(self.redis_adapter.set(self.key, self.owner, nx=True, px=self.ttl_ms)) or self.renew()
+        return self.held
+
+    def renew(self) -> bool:
+        """
+        Prolongs the lease, called by the heartbeats.
+
+        :return: False if the lease is lost.
+        """
+        self.held = bool(self.redis_adapter.eval(RENEW_SCRIPT, 1, self.key, self.owner, self.ttl_ms))
+        return self.held
+
+    @backoff(breaker='redis')
+    def release(self) -> None:
+        """
+        Gives the unit up, so another worker may claim it at once.
+
+        :return: None
+        """
+        self.redis_adapter.eval(RELEASE_SCRIPT, 1, self.key, self.owner)
+        self.held = False
+
+    def save_states(self, states: Dict[str, str]) -> None:
+        """
+        Writes the checkpoint of the unit atomically, only while the lease is held.
+
+        A worker which lost its lease (e.g. it was paused longer than the lease lives) cannot
+        overwrite the checkpoint of the new owner.
+
+        :param states: Values by the state keys.
+        :return: None
+        """
+        if not self._fenced_mset(states):
+            self.held = False
+            raise LeaseLost(f'Lease of {self.unit} lost, checkpoint discarded')
+
+    @backoff(breaker='redis')
+    def _fenced_mset(self, states: Dict[str, str]) -> bool:
+        """Runs FENCED_MSET_SCRIPT."""
+        return bool(self.redis_adapter.eval(FENCED_MSET_SCRIPT, len(states) + 1, self.key, *states.keys(),
+                                            self.owner, *states.values()))
+
+
+class WorkerLeases:
+    """
+    Shares the work units between the ETL workers running at the same time.
+
+    Every worker registers itself with heartbeats and holds at most its fair share of the units,
+    ceil(units / live workers): it claims free units up to the share and gives up the extra ones,
+    so the units are rebalanced when workers join or leave.
+    """
+
+    def __init__(self, redis_adapter: Redis, units: List[str], ttl_seconds: float = LEASE_SECONDS,
+                 owner: Optional[str] = None) -> None:
+        """
+        Initializes the WorkerLeases instance.
+
+        :param redis_adapter: Redis client.
+        :param units: Names of all the work units.
+        :param ttl_seconds: Time a lease and a worker registration live without heartbeats.
+        :param owner: Id of the worker, unique by default.
+        """
+        self.redis_adapter = redis_adapter
+        self.ttl_seconds = ttl_seconds
+        self.owner = owner or f'{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}'
+        self.leases = [Lease(redis_adapter, unit, self.owner, ttl_seconds) for unit in units]
+        self._stopped = threading.Event()
+        self._heartbeat = threading.Thread(target=self._beat, name='etl-leases', daemon=True)
+
+    def start(self) -> 'WorkerLeases':
+        """
+        Registers the worker and starts the heartbeats.
+
+        :return: self
+        """
+        self._register()
+        self._heartbeat.start()
+        logger.info('Worker %s started', self.owner)
+        return self
+
+    def claim(self) -> List[Lease]:
+        """
+        Brings the held units to the fair share of the worker.
+
+        :return: Leases held by the worker.
+        """
+        share = math.ceil(len(self.leases) / self._register())
+
+        held = [lease for lease in self.leases if lease.held]
+        for lease in held[share:]:
+            lease.release()
+            logger.info('Unit %s released for rebalancing', lease.unit)
+
+        for lease in self.leases:
+            if sum(lease.held for lease in self.leases) >= share:
+                break
+            if not lease.held and lease.acquire():
+                logger.info('Unit %s claimed by %s', lease.unit, self.owner)
+
+        return [lease for lease in self.leases if lease.held]
+
+    def stop(self) -> None:
+        """
+        Stops the heartbeats and releases all the units.
+
+        :return: None
+        """
+        self._stopped.set()
+        for lease in self.leases:
+            if lease.held:
+                lease.release()
+        self.redis_adapter.zrem(WORKERS_KEY, self.owner)
+
+    @backoff(breaker='redis')
+    def _register(self) -> int:
+        """
+        Renews the registration of the worker and drops the expired ones.
+
+        :return: Number of the live workers.
+        """
+        now = time()
+        pipe = self.redis_adapter.pipeline()
+        pipe.zadd(WORKERS_KEY, {self.owner: now})
+        pipe.zremrangebyscore(WORKERS_KEY, '-inf', now - self.ttl_seconds)
+        pipe.zcard(WORKERS_KEY)
+        return max(1, pipe.execute()[-1])
+
+    def _beat(self) -> None:
+        """Renews the registration and the held leases three times per the lease lifetime."""
+        while not self._stopped.wait(self.ttl_seconds / 3):
+            try:
+                self._register()
+                for lease in self.leases:
+                    if lease.held and not lease.renew():
+                        logger.warning('Lease of %s lost by %s', lease.unit, self.owner)
+            except Exception as e:
+                logger.error('Lease heartbeat failed, Error: %s', e)
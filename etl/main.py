@@ -1,73 +1,107 @@
+import asyncio
+from functools import partial
 from time import sleep
+from typing import List, Optional
 
 import psycopg2
 from redis.client import Redis
 
+import async_engine
+from change_feed import ChangeFeed
 from elastic_search_loader import ElasticsearchLoader
-from etl.config import TABLES_DATA, FILM_WORK_TABLE, REDIS_URL, DSL, SCHEMA_CONTENT, ES_HOST, ES_PORT, INDEX_NAME, \
-    ES_MAPPINGS, ES_SETTINGS, SLEEP_TIME
+from etl.config import REDIS_URL, DSL, SCHEMA_CONTENT, ES_HOST, ES_PORT, INDEX_NAME, \
+    ES_MAPPINGS, ES_SETTINGS, SLEEP_TIME, FILMS_QUERY, \
+    ETL_ENGINE, PIPELINE_QUEUE_SIZE, ES_SKIP_UNCHANGED, STRICT_VALIDATION, CHANGE_CAPTURE, OUTBOX_MAX_WAIT, \
+    TABLES_DATA
+from fingerprints import FingerprintStore
+from leases import Lease, LeaseLost, WorkerLeases
 from logger import logger
+from metrics import start_metrics_server, write_metrics_textfile
+from outbox import OutboxFeed, OutboxListener
+from pipeline import Pipeline
 from postgres_extractor import PostgresExtractor
 from state import RedisStorage, State
 
 
-def load_data(state: State, extractor: PostgresExtractor, es_loader: ElasticsearchLoader):
-    # Get the last execution time and queue index from the state
-    last_modified = state.get_state('last_modified')
-    queue_index = state.get_state('queue_index', 0)
-    queue_index = int(queue_index) % len(TABLES_DATA.keys())
-
-    # Setting time to filter by modified column
-    extractor.update_time(last_modified)
-
-    # Getting current table datas
-    table, m2m, column_id = TABLES_DATA[queue_index]
-
-    logger.info("Current queue %s, working on table %s, filtering time %s", *(queue_index, table, extractor.time))
-
-    table_ids = extractor.load_table_ids(table)
+def load_data(state: State, extractor: PostgresExtractor, es_loader: ElasticsearchLoader, key_prefix: str = '',
+              outbox: Optional[PostgresExtractor] = None, leases: Optional[List[Lease]] = None):
+    # Films changed in any of the tables since the last cycle, each one only once.
+    # With leases only the sources of the leased units are read, still in one pass.
+    # In the outbox mode the rows are deleted by the outbox extractor on its own connection
+    if outbox is not None:
+        change_feed = OutboxFeed(extractor, outbox, lease=leases[0] if leases else None)
+    else:
+        change_feed = ChangeFeed(state, extractor, key_prefix=key_prefix, leases=leases)
 
-    if table != FILM_WORK_TABLE:
-        for batch_table_ids in table_ids:
-            # Update the state with the last_modified
-            state.set_state('last_modified', batch_table_ids[-1][-1].isoformat())
+    if ETL_ENGINE == 'pipeline':
+        Pipeline(change_feed, extractor, es_loader, queue_size=PIPELINE_QUEUE_SIZE).run()
+        return
 
-            film_work_ids = extractor.load_film_ids(m2m, column_id, batch_table_ids)
+    try:
+        for batch_film_ids, positions in change_feed.changed_film_ids():
+            if batch_film_ids:
+                films = extractor.load_films(batch_film_ids)
 
-            for batch_film_work_ids in film_work_ids:
-                films = extractor.load_films(batch_film_work_ids)
                 for batch_films in films:
                     es_loader.load_data_to_es(batch_films)
-    else:
-        for batch_film_work_ids in table_ids:
-            films = extractor.load_films([id_[0] for id_ in batch_film_work_ids])
-
-            for batch_films in films:
-                es_loader.load_data_to_es(batch_films)
-                # Update the state with the last_modified
-                state.set_state('last_modified', batch_films[-1].modified.isoformat())
 
-    queue_index += 1
-    state.set_state('queue_index', queue_index)
+            # Mark the positions of the indexed rows, they are saved to the state in checkpoints
+            change_feed.commit(positions)
+    finally:
+        change_feed.flush()
 
 
 def main():
-    storage = RedisStorage(redis_adapter=Redis.from_url(url=REDIS_URL))
+    start_metrics_server()
+
+    if ETL_ENGINE == 'async':
+        asyncio.run(async_engine.main())
+        return
+
+    redis_adapter = Redis.from_url(url=REDIS_URL)
+    storage = RedisStorage(redis_adapter=redis_adapter)
     state = State(storage=storage)
     pg_connection = psycopg2.connect(**DSL)
+    listener = outbox = None
+    # Work units shared by the running workers: the outbox or every source table
+    leases = WorkerLeases(redis_adapter, ['outbox'] if CHANGE_CAPTURE == 'outbox'
+                          else [table for table, _, _ in TABLES_DATA.values()]).start()
 
     try:
         with pg_connection as conn:
-            extractor = PostgresExtractor(conn, schema=SCHEMA_CONTENT)
+            extractor = PostgresExtractor(conn, schema=SCHEMA_CONTENT, films_query=FILMS_QUERY,
+                                          validate=STRICT_VALIDATION, connect=partial(psycopg2.connect, **DSL))
             es_loader = ElasticsearchLoader(es_host=ES_HOST,
                                             es_port=ES_PORT,
                                             es_index=INDEX_NAME,
                                             mappings=ES_MAPPINGS,
-                                            settings=ES_SETTINGS)
+                                            settings=ES_SETTINGS,
+                                            fingerprints=FingerprintStore(redis_adapter, INDEX_NAME)
+                                            if ES_SKIP_UNCHANGED else None)
+            # In the outbox mode the next cycle starts as soon as the triggers notify about a change
+            if CHANGE_CAPTURE == 'outbox':
+                listener = OutboxListener(DSL)
+                outbox = PostgresExtractor(psycopg2.connect(**DSL), schema=SCHEMA_CONTENT,
+                                           connect=partial(psycopg2.connect, **DSL))
             while True:
-                load_data(state, extractor, es_loader)
-                sleep(int(SLEEP_TIME))
+                held = leases.claim()
+                if held:
+                    try:
+                        load_data(state, extractor, es_loader, outbox=outbox, leases=held)
+                    except LeaseLost as e:
+                        logger.warning('%s', e)
+
+                write_metrics_textfile()
+                if listener is not None and held:
+                    listener.wait(OUTBOX_MAX_WAIT)
+                else:
+                    sleep(int(SLEEP_TIME))
     finally:
+        leases.stop()
+        if listener is not None:
+            listener.close()
+        if outbox is not None:
+            outbox.connection.close()
         pg_connection.close()
 
 
@@ -0,0 +1,83 @@
+import datetime
+from time import time
+from typing import Any, Dict, Optional, Tuple
+
+from prometheus_client import Counter, Gauge, Histogram, Info, REGISTRY, start_http_server, write_to_textfile
+
+from etl.config import METRICS_PORT, METRICS_TEXTFILE
+from logger import logger
+
+# Time of the stages per batch: extract (films query), transform (documents and their encoding),
+# bulk (bulk request round trip) and checkpoint (positions write)
+STAGE_SECONDS = Histogram('etl_stage_seconds', 'Time of an ETL stage per batch', ['stage'])
+
+# rate() of the counters gives rows/sec and documents/sec
+ROWS = Counter('etl_source_rows_total', 'Changed source rows read', ['table'])
+DOCUMENTS = Counter('etl_documents_total', 'Documents by the result of indexing: indexed, unchanged, dead_letter',
+                    ['result'])
+BULK_ERRORS = Counter('etl_bulk_errors_total', 'Documents rejected in bulk responses', ['status'])
+
+QUEUE_DEPTH = Gauge('etl_queue_depth', 'Batches waiting for the next stage', ['queue'])
+BATCH_SIZE = Gauge('etl_batch_size', 'Current adaptive batch size', ['name'])
+# Measurements and bounds the adaptive batch size is chosen by, see AdaptiveBatchSize.snapshot()
+BATCH_LAST_SECONDS = Gauge('etl_batch_last_seconds', 'Time of the last measured batch', ['name'])
+BATCH_LAST_BYTES = Gauge('etl_batch_last_bytes', 'Payload size of the last measured batch', ['name'])
+BATCH_SIZE_CHOICE = Info('etl_batch_size_choice', 'Bounds, target and reason of the current adaptive batch size',
+                         ['name'])
+
+LAST_INDEXED_MODIFIED = Gauge('etl_last_indexed_modified_timestamp_seconds',
+                              'Newest source modified time indexed and committed')
+FRESHNESS_LAG = Gauge('etl_freshness_lag_seconds',
+                      'Time since the newest committed source change, grows while nothing newer is indexed')
+
+# Newest source modified time committed so far by any source, as a POSIX timestamp
+_newest_committed: Optional[float] = None
+FRESHNESS_LAG.set_function(lambda: max(0.0, time() - _newest_committed) if _newest_committed is not None else 0.0)
+
+
+def observe_committed(positions: Dict[str, Tuple[Any, datetime.datetime]]) -> None:
+    """
+    Updates the freshness metrics with the positions of an indexed batch.
+
+    The metrics only move forward: a source committing older changes than another one
+    did before does not make the index look staler than it is.
+
+    :param positions: Last indexed ('id', 'modified') pair of every source.
+    :return: None
+    """
+    global _newest_committed
+
+    times = [modified for _, modified in positions.values() if isinstance(modified, datetime.datetime)]
+    if not times:
+        return
+
+    newest = max(times).timestamp()
+    if _newest_committed is None or newest > _newest_committed:
+        _newest_committed = newest
+        LAST_INDEXED_MODIFIED.set(newest)
+
+
+def start_metrics_server() -> None:
+    """
+    Serves the metrics in the Prometheus format on METRICS_PORT, if it is set.
+
+    :return: None
+    """
+    if METRICS_PORT:
+        start_http_server(METRICS_PORT)
+        logger.info('Metrics are served on port %s', METRICS_PORT)
+
+
+def write_metrics_textfile() -> None:
+    """
+    Writes the metrics to METRICS_TEXTFILE for the node_exporter textfile collector, if it is set.
+
+    :return: None
+    """
+    if not METRICS_TEXTFILE:
+        return
+
+    try:
+        write_to_textfile(METRICS_TEXTFILE, REGISTRY)
+    except OSError as e:
+        logger.error('Writing metrics to %s failed, Error: %s', METRICS_TEXTFILE, e)
@@ -1,5 +1,5 @@
 import datetime
-from typing import List, Optional
+from typing import Any, Dict, List, Mapping, Optional
 
 from pydantic import BaseModel
 
@@ -22,3 +22,27 @@ class FilmWork(BaseModel):
     actors: List[Optional[Person]]
     writers: List[Optional[Person]]
 
+    @classmethod
+    def from_row(cls, row: Mapping[str, Any], validate: bool = True) -> 'FilmWork':
+        """
+        Builds the FilmWork from a database row.
+
+        :param row: Row of the films query.
+        :param validate: False trusts the row and skips the validation, nested persons are kept as dicts.
+        :return: FilmWork
+        """
+        return cls(**row) if validate else cls.model_construct(**row)
+
+    def to_source(self) -> Dict[str, Any]:
+        """
+        Returns the Elasticsearch document of the film, i.e. all the fields but 'modified'.
+
+        Works for both validated and constructed FilmWorks without a full model_dump.
+
+        :return: Document source.
+        """
+        source = {name: getattr(self, name) for name in self.model_fields if name != 'modified'}
+        for name in ('actors', 'writers'):
+            source[name] = [person.model_dump() if isinstance(person, BaseModel) else person
+                            for person in source[name]]
+        return source
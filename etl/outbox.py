@@ -0,0 +1,145 @@
+import datetime
+import select
+from typing import Any, Dict, Generator, List, Optional, Tuple
+
+import psycopg2
+from psycopg2._psycopg import connection
+
+from backoff import backoff
+from change_feed import SeenSet, new_film_batches
+from leases import Lease, LeaseLost
+from logger import logger
+from metrics import ROWS, observe_committed
+from postgres_extractor import PostgresExtractor
+
+# Channel the triggers of etc/postgres/etl_outbox.ddl notify
+OUTBOX_CHANNEL = 'etl_outbox'
+
+
+class OutboxFeed:
+    """
+    Collects ids of changed FilmWorks from the outbox table filled by the database triggers.
+
+    A drop-in replacement of ChangeFeed for the CHANGE_CAPTURE=outbox mode: instead of
+    positions it yields the ids and the creation times of the outbox rows, which commit()
+    deletes once their films have been indexed. Rows are deleted by id, so a row which became visible after the rows
+    with greater ids (its transaction committed later) is still read by the next cycle.
+    """
+
+    def __init__(self, extractor: PostgresExtractor, cleaner: PostgresExtractor, lease: Optional[Lease] = None) -> None:
+        """
+        Initializes the OutboxFeed instance.
+
+        :param extractor: Extractor used to read the outbox.
+        :param cleaner: Extractor on its own connection used to delete the indexed rows. commit() runs
+            in the consumer thread of the pipeline, which must not share the connection of the extractor.
+        :param lease: Lease of the outbox held by this worker, the rows are only deleted while it is held.
+        """
+        self.extractor = extractor
+        self.cleaner = cleaner
+        self.lease = lease
+
+    def changed_film_ids(self) -> Generator[Tuple[List[str], List[Tuple[int, datetime.datetime]]], None, None]:
+        """
+        Drains the outbox and yields the ids of the affected FilmWorks.
+
+        A film is yielded once per outbox batch: all the rows of a batch are read before its films
+        are loaded, so deleting them loses no change. A row of a film loaded by an earlier batch
+        may have been added after that load, so the film is yielded again.
+
+        :return: Generator of (FilmWork ids batch, outbox ('id', 'created') pairs) pairs,
+            see ChangeFeed.changed_film_ids.
+        """
+        added = skipped = 0
+
+        for rows in self.extractor.load_outbox():
+            ROWS.labels('etl_outbox').inc(len(rows))
+            seen = SeenSet(len(rows))
+            film_ids = [str(film_id) for _, film_id, _ in rows]
+            yield from new_film_batches(seen, film_ids, self.extractor.chunk_size,
+                                        [(id_, created) for id_, _, created in rows])
+            added, skipped = added + seen.added, skipped + seen.skipped
+
+        if added or skipped:
+            logger.info("Collected %s changed films from the outbox, %s duplicates skipped", added, skipped)
+
+    def commit(self, outbox_rows: List[Tuple[int, datetime.datetime]]) -> None:
+        """
+        Deletes the outbox rows of the indexed batch and updates the freshness metrics.
+
+        :param outbox_rows: ('id', 'created') pairs of the outbox rows.
+        :return: None
+        """
+        if self.lease is not None and not self.lease.held:
+            raise LeaseLost(f'Lease of {self.lease.unit} lost, the cycle is stopped')
+
+        if outbox_rows:
+            self.cleaner.delete_outbox([id_ for id_, _ in outbox_rows])
+            observe_committed({'etl_outbox': max(outbox_rows, key=lambda row: row[1])})
+
+    def flush(self) -> None:
+        """
+        Does nothing, the outbox rows are deleted right on commit.
+
+        :return: None
+        """
+
+
+class OutboxListener:
+    """
+    Waits for the notifications of the outbox triggers on a dedicated autocommit connection.
+    """
+
+    def __init__(self, dsl: Dict[str, Any], channel: str = OUTBOX_CHANNEL) -> None:
+        """
+        Initializes the OutboxListener instance.
+
+        :param dsl: Connection parameters of the database.
+        :param channel: Channel to listen to.
+        """
+        self.dsl = dsl
+        self.channel = channel
+        self.connection = self._connect()
+
+    @backoff(breaker='postgres')
+    def _connect(self) -> connection:
+        """Opens the connection and subscribes to the channel."""
+        conn = psycopg2.connect(**self.dsl)
+        conn.autocommit = True
+        with conn.cursor() as cursor:
+            cursor.execute(f'LISTEN {self.channel}')
+        logger.info('Listening to the %s channel', self.channel)
+        return conn
+
+    def wait(self, timeout: float) -> bool:
+        """
+        Blocks until a notification arrives or the timeout expires.
+
+        Notifications sent while the outbox was being drained are already queued, so the
+        call returns at once and no change is missed between two cycles.
+
+        :param timeout: Max waiting time in seconds; the outbox is drained anyway after it.
+        :return: True if there was a notification.
+        """
+        try:
+            self.connection.poll()
+            if not self.connection.notifies:
+                select.select([self.connection], [], [], timeout)
+                self.connection.poll()
+        except psycopg2.OperationalError as e:
+            logger.error('Outbox listener connection lost, reconnecting, Error: %s', e)
+            self.close()
+            self.connection = self._connect()
+            return True
+
+        notified = bool(self.connection.notifies)
+        self.connection.notifies.clear()
+        return notified
+
+    def close(self) -> None:
+        """
+        Closes the connection.
+
+        :return: None
+        """
+        self.connection.close()
@@ -0,0 +1,131 @@
+import threading
+from queue import Queue, Empty, Full
+from typing import Any, Callable, Generator, Iterable, Optional
+
+from change_feed import ChangeFeed
+from elastic_search_loader import ElasticsearchLoader
+from logger import logger
+from metrics import QUEUE_DEPTH
+from postgres_extractor import PostgresExtractor
+
+# Marks the end of the stream in a stage queue
+_DONE = object()
+
+
+class Pipeline:
+    """
+    Runs the extract, transform and load stages of an ETL cycle in parallel threads.
+
+    The stages are connected by bounded queues, so a fast stage blocks on a full queue instead
+    of piling up batches in memory. Batches are loaded in the order they were extracted and
+    the source positions are saved only after their batch has been confirmed by Elasticsearch.
+    """
+
+    def __init__(self, change_feed: ChangeFeed, extractor: PostgresExtractor, es_loader: ElasticsearchLoader,
+                 queue_size: int = 4) -> None:
+        """
+        Initializes the Pipeline instance.
+
+        :param change_feed: Change feed yielding the ids of the changed films.
+        :param extractor: Extractor used to load the films.
+        :param es_loader: Loader used to transform and index the films.
+        :param queue_size: Max number of batches waiting between two stages.
+        """
+        self.change_feed = change_feed
+        self.extractor = extractor
+        self.es_loader = es_loader
+        self.queue_size = queue_size
+        self.stopped = threading.Event()
+        self.error: Optional[BaseException] = None
+
+    def run(self) -> None:
+        """
+        Runs the cycle until the change feed is exhausted.
+
+        :return: None
+        """
+        extracted = Queue(maxsize=self.queue_size)
+        transformed = Queue(maxsize=self.queue_size)
+        QUEUE_DEPTH.labels('extracted').set_function(extracted.qsize)
+        QUEUE_DEPTH.labels('transformed').set_function(transformed.qsize)
+
+        threads = [
+            threading.Thread(target=self._run_stage, args=(self._extract(), extracted), name='etl-extract'),
+            threading.Thread(target=self._run_stage, args=(self._transform(extracted), transformed),
+                             name='etl-transform'),
+        ]
+        for thread in threads:
+            thread.start()
+
+        try:
+            for documents, positions in self._consume(transformed):
+                if documents:
+                    self.es_loader.load_actions(documents)
+                self.change_feed.commit(positions)
+        except BaseException as e:
+            self.error = self.error or e
+        finally:
+            self.stopped.set()
+            for thread in threads:
+                thread.join()
+            self.change_feed.flush()
+
+        if self.error is not None:
+            raise self.error
+
+    def _extract(self) -> Generator[Any, None, None]:
+        """Extract stage: loads the changed films from Postgres."""
+        for batch_film_ids, positions in self.change_feed.changed_film_ids():
+            films = [film
+                     for batch_films in (self.extractor.load_films(batch_film_ids) if batch_film_ids else [])
+                     for film in batch_films]
+            yield films, positions
+
+    def _transform(self, extracted: Queue) -> Generator[Any, None, None]:
+        """Transform stage: turns the films into Elasticsearch bulk actions."""
+        for films, positions in self._consume(extracted):
+            yield self.es_loader.make_actions(films), positions
+
+    def _run_stage(self, stage: Generator[Any, None, None], output: Queue) -> None:
+        """
+        Puts every item produced by the stage to the output queue, then the end marker.
+
+        The stage is closed as soon as the pipeline stops, so a failed stage downstream does not
+        leave it producing the rest of its items.
+
+        :param stage: Generator of the stage.
+        :param output: Queue of the next stage.
+        """
+        try:
+            for item in stage:
+                if self._put(output, item) is _DONE:
+                    break
+        except BaseException as e:
+            logger.error('Pipeline stage %s failed, Error: %s', threading.current_thread().name, e)
+            self.error = self.error or e
+            self.stopped.set()
+        finally:
+            stage.close()
+            self._put(output, _DONE)
+
+    def _put(self, queue: Queue, item: Any) -> Any:
+        """
+        Puts the item to the queue, waiting for free space unless the pipeline is stopped.
+
+        :return: _DONE if the pipeline stopped before the item was put.
+        """
+        return self._wait(lambda: queue.put(item, timeout=0.1), Full)
+
+    def _consume(self, queue: Queue) -> Iterable[Any]:
+        """Yields the items of the queue until the end marker or the pipeline stop."""
+        while (item := self._wait(lambda: queue.get(timeout=0.1), Empty)) is not _DONE:
+            yield item
+
+    def _wait(self, operation: Callable[[], Any], timeout_error: type) -> Any:
+        """Retries the blocking queue operation until it succeeds, returns _DONE if the pipeline stops."""
+        while not self.stopped.is_set():
+            try:
+                return operation()
+            except timeout_error:
+                continue
+        return _DONE
@@ -1,32 +1,219 @@
 import datetime
 import uuid
-from typing import List, Optional, Union, Generator, Tuple
+from time import perf_counter
+from typing import Callable, List, Optional, Union, Generator, Tuple
 
 from psycopg2._psycopg import connection
 from psycopg2.extras import DictCursor
 
 from backoff import backoff
+from batch_size import AdaptiveBatchSize
+from etl.config import EXTRACT_BATCH_SIZE, EXTRACT_BATCH_MIN, EXTRACT_BATCH_MAX, EXTRACT_TARGET_SECONDS
 from logger import logger
+from metrics import STAGE_SECONDS
 from models import FilmWork
+from prepared_statements import PreparedStatements
+
+
+NIL_UUID = '00000000-0000-0000-0000-000000000000'
+
+# Keyset page of ('id', 'modified') pairs of a table, up to the time the cycle started at
+TABLE_IDS_QUERY = """SELECT id, modified
+FROM {schema}.{table}
+WHERE (modified, id) > ($1, $2) AND modified <= $4
+ORDER BY modified, id
+LIMIT $3
+"""
+
+# Keyset page of the FilmWork ids within an inclusive id range
+FILM_IDS_RANGE_QUERY = """SELECT id
+FROM {schema}.film_work
+WHERE id >= $1 AND id <= $2
+ORDER BY id
+LIMIT $3
+"""
+
+# Ids of the FilmWorks related to the given rows through a m2m table
+FILM_IDS_QUERY = """
+SELECT DISTINCT m2mfw.film_work_id
+FROM {schema}.{m2m_table} m2mfw
+WHERE m2mfw.{column_id} = ANY($1)
+"""
+
+# Page of the outbox rows written by the triggers of etc/postgres/etl_outbox.ddl
+OUTBOX_QUERY = """SELECT id, film_work_id, created
+FROM {schema}.etl_outbox
+WHERE id > $1
+ORDER BY id
+LIMIT $2
+"""
+
+# Removes the outbox rows whose films have been indexed
+OUTBOX_DELETE_QUERY = """DELETE FROM {schema}.etl_outbox
+WHERE id = ANY($1)
+"""
+
+# Queries assembling FilmWork documents, selected by FILMS_QUERY.
+# 'join' joins persons and genres at once and collapses the persons x genres rows with DISTINCT,
+# 'lateral' aggregates every relation in its own subquery, so no film rows are multiplied,
+# 'document' reads the rows prepared by the triggers of etc/postgres/film_work_document.ddl by the primary key.
+FILMS_QUERIES = {
+    'join': """
+SELECT
+    fw.id,
+    fw.modified,
+    fw.rating AS imdb_rating,
+    fw.description,
+    fw.title,
+    COALESCE(array_agg(DISTINCT p.full_name) FILTER (WHERE pfw.role = 'actor'), ARRAY[]::text[]) AS "actors_names",
+    COALESCE(array_agg(DISTINCT p.full_name) FILTER (WHERE pfw.role = 'writer'), ARRAY[]::text[]) AS "writers_names",
+    COALESCE(array_agg(DISTINCT p.full_name) FILTER (WHERE pfw.role = 'director'), ARRAY[]::text[]) AS "director",
+    array_agg(DISTINCT g.name) as genre,
+   COALESCE (
+       json_agg(
+           DISTINCT jsonb_build_object(
+               'id', p.id,
+               'name', p.full_name
+           )
+       ) FILTER (WHERE p.id is not null and pfw.role = 'actor'),
+       '[]'
+   ) as actors,
+   COALESCE (
+       json_agg(
+           DISTINCT jsonb_build_object(
+               'id', p.id,
+               'name', p.full_name
+           )
+       ) FILTER (WHERE p.id is not null and pfw.role = 'writer'),
+       '[]'
+   ) as writers
+FROM {schema}.film_work fw
+LEFT JOIN {schema}.person_film_work pfw ON pfw.film_work_id = fw.id
+LEFT JOIN {schema}.person p ON p.id = pfw.person_id
+LEFT JOIN {schema}.genre_film_work gfw ON gfw.film_work_id = fw.id
+LEFT JOIN {schema}.genre g ON g.id = gfw.genre_id
+WHERE fw.id = ANY($1)
+GROUP BY fw.id, fw.modified, fw.rating, fw.description, fw.title
+""",
+    'lateral': """
+SELECT
+    fw.id,
+    fw.modified,
+    fw.rating AS imdb_rating,
+    fw.description,
+    fw.title,
+    COALESCE(persons.actors_names, ARRAY[]::text[]) AS "actors_names",
+    COALESCE(persons.writers_names, ARRAY[]::text[]) AS "writers_names",
+    COALESCE(persons.director, ARRAY[]::text[]) AS "director",
+    -- A film without genres gets [NULL] as the join query aggregates it from a NULL row
+    COALESCE(genres.genre, ARRAY[NULL]::text[]) AS genre,
+    COALESCE(persons.actors, '[]') AS actors,
+    COALESCE(persons.writers, '[]') AS writers
+FROM {schema}.film_work fw
+LEFT JOIN LATERAL (
+    SELECT
+        array_agg(DISTINCT p.full_name) FILTER (WHERE pfw.role = 'actor') AS actors_names,
+        array_agg(DISTINCT p.full_name) FILTER (WHERE pfw.role = 'writer') AS writers_names,
+        array_agg(DISTINCT p.full_name) FILTER (WHERE pfw.role = 'director') AS director,
+        json_agg(
+            DISTINCT jsonb_build_object(
+                'id', p.id,
+                'name', p.full_name
+            )
+        ) FILTER (WHERE pfw.role = 'actor') AS actors,
+        json_agg(
+            DISTINCT jsonb_build_object(
+                'id', p.id,
+                'name', p.full_name
+            )
+        ) FILTER (WHERE pfw.role = 'writer') AS writers
+    FROM {schema}.person_film_work pfw
+    JOIN {schema}.person p ON p.id = pfw.person_id
+    WHERE pfw.film_work_id = fw.id
+) persons ON TRUE
+LEFT JOIN LATERAL (
+    SELECT array_agg(DISTINCT g.name) AS genre
+    FROM {schema}.genre_film_work gfw
+    JOIN {schema}.genre g ON g.id = gfw.genre_id
+    WHERE gfw.film_work_id = fw.id
+) genres ON TRUE
+WHERE fw.id = ANY($1)
+""",
+    'document': """
+SELECT
+    d.id,
+    d.modified,
+    d.rating AS imdb_rating,
+    d.description,
+    d.title,
+    d.actors AS "actors_names",
+    d.writers AS "writers_names",
+    d.directors AS "director",
+    d.genres AS genre,
+    d.actor_persons AS actors,
+    d.writer_persons AS writers
+FROM {schema}.film_work_document d
+WHERE d.id = ANY($1)
+""",
+}
 
 
 class PostgresExtractor:
-    chunk_size: int = 100
     time: Optional[Union[datetime.datetime, str]] = None
+    last_id: Optional[str] = None
 
-    def __init__(self, conn: connection, schema: str = 'public') -> None:
+    def __init__(self, conn: connection, schema: str = 'public', films_query: str = 'lateral',
+                 validate: bool = True, connect: Optional[Callable[[], connection]] = None,
+                 batch_size: Optional[AdaptiveBatchSize] = None) -> None:
         """
         Initializes the PostgresExtractor instance.
 
         Args:
             conn (connection): A PostgreSQL database connection object.
             schema (str): The schema of the database to be used. Default is 'public'.
+            films_query (str): The key of FILMS_QUERIES used to assemble films. Default is 'lateral'.
+            validate (bool): Validate the film rows with pydantic, False trusts the database rows. Default is True.
+            connect (Callable[[], connection] | None): Opens a new connection when conn is broken. Default is None.
+            batch_size (AdaptiveBatchSize | None): Size of the batches, adapted to the time of the films query.
+                                                   Default is the EXTRACT_BATCH_* configuration.
         :return: None
         """
         self.connection = conn
         self.schema = schema
+        self.films_query = films_query
+        self.validate = validate
+        self.connect = connect
+        self.batch_size = batch_size or AdaptiveBatchSize('postgres', EXTRACT_BATCH_SIZE, EXTRACT_BATCH_MIN,
+                                                          EXTRACT_BATCH_MAX, EXTRACT_TARGET_SECONDS)
+        self.statements = PreparedStatements(conn)
+
+    @property
+    def chunk_size(self) -> int:
+        """Current size of the batches of ids and films."""
+        return self.batch_size.size
+
+    def recover(self, error: Exception) -> None:
+        """
+        Restores the connection after a failed query, called by backoff before the retry.
+
+        A closed connection is replaced with a new one, an open one is rolled back, as
+        Postgres rejects every statement of a failed transaction.
 
-    def update_time(self, time: Optional[Union[datetime.datetime, str]]):
+        Args:
+            error (Exception): The error of the failed query.
+        """
+        if not self.connection.closed:
+            self.connection.rollback()
+            return
+
+        if self.connect is None:
+            return
+
+        logger.warning('Postgres connection lost, reconnecting, Error: %s', error)
+        self.connection = self.connect()
+        self.statements = PreparedStatements(self.connection)
+
+    def update_time(self, time: Optional[Union[datetime.datetime, str]], last_id: Optional[str] = None):
         """
         Update the time used for time-based filtering during data extraction.
         Example time: 2023-07-27 20:30:42.494066
@@ -35,7 +222,12 @@ class PostgresExtractor:
             time (datetime.datetime | str | None): The time to use for filtering.
                                                   Can be a datetime object, a string representing
                                                   a datetime, or None for no filtering.
+            last_id (str | None): The id of the last processed row with the given time. Rows with the
+                                  same time and a greater id are still fetched. None means that all
+                                  rows with the given time are fetched again.
         """
+        self.last_id = last_id
+
         if isinstance(time, datetime.datetime):
             self.time = time
             return
@@ -51,47 +243,114 @@ class PostgresExtractor:
             logger.error('Error occurred during converting %s to datetime, time was set to None, Error: %s', time, e)
             self.time = None
 
-    @backoff()
-    def load_table_ids(self, table: str) -> Generator[List[Tuple[uuid.UUID, datetime.datetime]], None, None]:
+    @backoff(breaker='postgres', recover=True)
+    def now(self) -> datetime.datetime:
+        """
+        Returns the current time of the database clock.
+
+        clock_timestamp() is used, as now() of the open transaction of the connection may be long gone.
+
+        Returns:
+            datetime.datetime: The current time.
+        """
+        with self.connection.cursor() as cursor:
+            cursor.execute('SELECT clock_timestamp()')
+            return cursor.fetchone()[0]
+
+    @backoff(breaker='postgres', recover=True)
+    def load_table_ids(self, table: str, until: Optional[datetime.datetime] = None,
+                       resume_after: Optional[List[Tuple[uuid.UUID, datetime.datetime]]] = None) \
+            -> Generator[List[Tuple[uuid.UUID, datetime.datetime]], None, None]:
         """
         Fetches the 'id' values from the specified table in the Postgres database.
 
         Args:
             table (str): The name of the table from which to retrieve the 'id' values.
+            until (datetime.datetime | None): Rows modified later are left for the next cycle. None reads all
+                                              the rows.
+            resume_after (List[Tuple[uuid.UUID, datetime.datetime]] | None): The last batch delivered before
+                                                   a failure, reading continues after it. Set by backoff.
 
         Yields:
-            Generator[List[uuid.UUID], None, None]: A generator that yields batches of 'id' values
-                                                   fetched from the database table.
+            Generator[List[Tuple[uuid.UUID, datetime.datetime]], None, None]: A generator that yields batches of
+                                                   ('id', 'modified') pairs fetched from the database table.
 
         Note:
-            The function uses an SQL query to retrieve the 'id' values from the specified table.
-            If a self.time value is provided, it includes a WHERE clause in the query to filter
-            the 'modified' column based on the provided time.
+            Rows are read with keyset pagination over ('modified', 'id'): every batch is a separate
+            LIMIT query starting right after the last row of the previous one, so only one batch is
+            held in memory at a time and rows sharing the same 'modified' value are neither skipped
+            nor read twice. If self.time is provided, reading starts after (self.time, self.last_id).
         """
-        cursor = self.connection.cursor()
-        query = f"""SELECT id, modified
-        FROM {self.schema}.{table}
-        {"WHERE modified > %s" if self.time else ''}
-        ORDER BY modified
+        last_modified, last_id = self.time or '-infinity', self.last_id or NIL_UUID
+        until = until or 'infinity'
+        if resume_after:
+            last_id, last_modified = resume_after[-1]
+
+        query = TABLE_IDS_QUERY.format(schema=self.schema, table=table)
+
+        while True:
+            limit = self.chunk_size
+            with self.connection.cursor() as cursor:
+                self.statements.execute(cursor, f'{table}_ids', query,
+                                        ('timestamptz', 'uuid', 'int', 'timestamptz'),
+                                        (last_modified, last_id, limit, until))
+                data = cursor.fetchall()
+
+            if not data:
+                return
+
+            yield data
+
+            if len(data) < limit:
+                return
+
+            last_id, last_modified = data[-1]
+
+    @backoff(breaker='postgres', recover=True)
+    def load_film_ids_range(self, start_id: str, end_id: str, resume_after: Optional[List[str]] = None) \
+            -> Generator[List[str], None, None]:
         """
-        try:
-            # Execute the SQL query with optional time-based filtering
-            cursor.execute(query, (self.time,))
+        Fetches FilmWork 'id' values within the inclusive [start_id, end_id] range in the 'id' order.
 
-            # Fetch data from the database in batches using fetchmany and yield each batch
-            while data := cursor.fetchmany(self.chunk_size):
-                yield data
-        finally:
-            cursor.close()
+        Args:
+            start_id (str): The lowest id of the range.
+            end_id (str): The highest id of the range.
+            resume_after (List[str] | None): The last batch delivered before a failure, reading continues
+                                             after it. Set by backoff.
+
+        Yields:
+            Generator[List[str], None, None]: A generator that yields batches of 'id' values. Every batch
+                                              is a separate keyset query on the primary key index.
+        """
+        query = FILM_IDS_RANGE_QUERY.format(schema=self.schema)
+        if resume_after:
+            start_id = str(uuid.UUID(int=uuid.UUID(resume_after[-1]).int + 1))
+
+        while True:
+            limit = self.chunk_size
+            with self.connection.cursor() as cursor:
+                self.statements.execute(cursor, 'film_ids_range', query, ('uuid', 'uuid', 'int'),
+                                        (start_id, end_id, limit))
+                data = [str(id_) for id_, in cursor.fetchall()]
+
+            if not data:
+                return
+
+            yield data
 
-    @backoff()
+            if len(data) < limit or data[-1] == end_id:
+                return
+
+            start_id = str(uuid.UUID(int=uuid.UUID(data[-1]).int + 1))
+
+    @backoff(breaker='postgres', recover=True)
     def load_film_ids(self, m2m_table: str, column_id: str, ids: List[Tuple[uuid.UUID, datetime.datetime]]) -> \
     Generator[List[uuid.UUID], None, None]:
         """
         Fetches FilmWork 'id' values based on the provided m2m_table and column_id.
 
         Args:
-            m2m_table (str): The name of the m2m table to join with the FilmWork table.
+            m2m_table (str): The name of the m2m table to read the FilmWork ids from.
             column_id (str): The column ID representing the relationship with FilmWork.
             ids (List[Tuple[uuid.UUID, datetime.datetime]]): A list of UUIDs and modified time representing the IDs to match in the m2m_table.
 
@@ -102,22 +361,16 @@ class PostgresExtractor:
         """
         cursor = self.connection.cursor()
 
-        query = f"""
-        SELECT fw.id
-        FROM {self.schema}.film_work fw
-        LEFT JOIN {self.schema}.{m2m_table} m2mfw ON m2mfw.film_work_id = fw.id
-        WHERE m2mfw.{column_id} IN ({', '.join(['%s'] * len(ids))})
-        ORDER BY fw.modified
-        """
+        query = FILM_IDS_QUERY.format(schema=self.schema, m2m_table=m2m_table, column_id=column_id)
 
         try:
-            cursor.execute(query, [id_[0] for id_ in ids])
+            self.statements.execute(cursor, f'{m2m_table}_film_ids', query, ('uuid[]',), ([id_[0] for id_ in ids],))
             while data := cursor.fetchmany(self.chunk_size):
                 yield data
         finally:
             cursor.close()
 
-    @backoff()
+    @backoff(breaker='postgres', recover=True)
     def load_films(self, film_ids: List[uuid.UUID]) -> Generator[List[FilmWork], None, None]:
         """
         Fetches film data based on the provided film_ids.
@@ -132,46 +385,65 @@ class PostgresExtractor:
 
         cursor = self.connection.cursor(cursor_factory=DictCursor)
 
-        query = f"""
-SELECT
-    fw.id,
-    fw.modified,
-    fw.rating AS imdb_rating,
-    fw.description,
-    fw.title,
-    COALESCE(array_agg(DISTINCT p.full_name) FILTER (WHERE pfw.role = 'actor'), ARRAY[]::text[]) AS "actors_names",
-    COALESCE(array_agg(DISTINCT p.full_name) FILTER (WHERE pfw.role = 'writer'), ARRAY[]::text[]) AS "writers_names",
-    COALESCE(array_agg(DISTINCT p.full_name) FILTER (WHERE pfw.role = 'director'), ARRAY[]::text[]) AS "director",
-    array_agg(DISTINCT g.name) as genre,
-   COALESCE (
-       json_agg(
-           DISTINCT jsonb_build_object(
-               'id', p.id,
-               'name', p.full_name
-           )
-       ) FILTER (WHERE p.id is not null and pfw.role = 'actor'),
-       '[]'
-   ) as actors,
-   COALESCE (
-       json_agg(
-           DISTINCT jsonb_build_object(
-               'id', p.id,
-               'name', p.full_name
-           )
-       ) FILTER (WHERE p.id is not null and pfw.role = 'writer'),
-       '[]'
-   ) as writers
-FROM {self.schema}.film_work fw
-LEFT JOIN {self.schema}.person_film_work pfw ON pfw.film_work_id = fw.id
-LEFT JOIN {self.schema}.person p ON p.id = pfw.person_id
-LEFT JOIN {self.schema}.genre_film_work gfw ON gfw.film_work_id = fw.id
-LEFT JOIN {self.schema}.genre g ON g.id = gfw.genre_id
-WHERE fw.id  IN ({', '.join(['%s'] * len(film_ids))})
-GROUP BY fw.id, fw.modified, fw.rating, fw.description, fw.title;
-"""
+        query = FILMS_QUERIES[self.films_query].format(schema=self.schema)
+
         try:
-            cursor.execute(query, film_ids)
+            started = perf_counter()
+            self.statements.execute(cursor, f'films_{self.films_query}', query, ('uuid[]',), (list(film_ids),))
+            elapsed = perf_counter() - started
+            STAGE_SECONDS.labels('extract').observe(elapsed)
+            self.batch_size.record(len(film_ids), elapsed)
+
             while rows := cursor.fetchmany(self.chunk_size):
-                yield [FilmWork(**row) for row in rows]
+                yield [FilmWork.from_row(row, validate=self.validate) for row in rows]
         finally:
             cursor.close()
+
+    @backoff(breaker='postgres', recover=True)
+    def load_outbox(self, after_id: int = 0,
+                    resume_after: Optional[List[Tuple[int, uuid.UUID, datetime.datetime]]] = None) \
+            -> Generator[List[Tuple[int, uuid.UUID, datetime.datetime]], None, None]:
+        """
+        Fetches the rows of the outbox table in the 'id' order.
+
+        Args:
+            after_id (int): Rows with greater ids are fetched. Default is 0, all the rows.
+            resume_after (List[Tuple[int, uuid.UUID, datetime.datetime]] | None): The last batch delivered
+                before a failure, reading continues after it. Set by backoff.
+
+        Yields:
+            Generator[List[Tuple[int, uuid.UUID, datetime.datetime]], None, None]: A generator that yields
+                batches of outbox ('id', 'film_work_id', 'created') rows.
+        """
+        query = OUTBOX_QUERY.format(schema=self.schema)
+        if resume_after:
+            after_id = resume_after[-1][0]
+
+        while True:
+            limit = self.chunk_size
+            with self.connection.cursor() as cursor:
+                self.statements.execute(cursor, 'outbox', query, ('bigint', 'int'), (after_id, limit))
+                data = cursor.fetchall()
+
+            if not data:
+                return
+
+            yield data
+
+            if len(data) < limit:
+                return
+
+            after_id = data[-1][0]
+
+    @backoff(breaker='postgres', recover=True)
+    def delete_outbox(self, ids: List[int]) -> None:
+        """
+        Deletes the processed rows of the outbox table and commits.
+
+        Args:
+            ids (List[int]): Outbox 'id' values of the rows to delete.
+        """
+        with self.connection.cursor() as cursor:
+            self.statements.execute(cursor, 'outbox_delete', OUTBOX_DELETE_QUERY.format(schema=self.schema),
+                                    ('bigint[]',), (ids,))
+        self.connection.commit()
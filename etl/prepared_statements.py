@@ -0,0 +1,50 @@
+from typing import Any, Sequence, Set
+
+from psycopg2 import errors
+from psycopg2._psycopg import connection, cursor as Cursor
+
+from logger import logger
+
+
+class PreparedStatements:
+    """
+    Server-side prepared statements of a single Postgres connection.
+
+    A statement is sent to Postgres with PREPARE the first time it is used and is executed by
+    name afterwards, so its text is parsed and planned once for the whole connection lifetime.
+    Lists of ids are bound as a single array argument, so the statement text does not depend
+    on the batch size.
+    """
+
+    def __init__(self, conn: connection) -> None:
+        """
+        Initializes the PreparedStatements instance.
+
+        :param conn: A PostgreSQL database connection object the statements are prepared on.
+        """
+        self.connection = conn
+        self.prepared: Set[str] = set()
+
+    def execute(self, cursor: Cursor, name: str, query: str, arg_types: Sequence[str], args: Sequence[Any]) -> None:
+        """
+        Executes the prepared statement, preparing it first if needed.
+
+        :param cursor: Cursor of self.connection to execute the statement with.
+        :param name: Unique name of the statement.
+        :param query: SQL text of the statement with $1, $2, ... placeholders.
+        :param arg_types: Postgres types of the placeholders, e.g. 'uuid[]'.
+        :param args: Values of the placeholders.
+        :return: None
+        """
+        if name not in self.prepared:
+            cursor.execute(f"PREPARE {name} ({', '.join(arg_types)}) AS {query}")
+            self.prepared.add(name)
+            logger.debug('Statement %s prepared', name)
+
+        try:
+            cursor.execute(f"EXECUTE {name} ({', '.join(f'%s::{type_}' for type_ in arg_types)})", args)
+        except errors.InvalidSqlStatementName:
+            # The session lost its statements (e.g. it was reset), they are prepared again on retry
+            self.connection.rollback()
+            self.prepared.clear()
+            raise
@@ -0,0 +1,182 @@
+import argparse
+import uuid
+from functools import partial
+from multiprocessing import Pool
+from typing import Tuple
+
+import psycopg2
+from elasticsearch import Elasticsearch
+from redis.client import Redis
+
+from change_feed import encode_position
+from elastic_search_loader import ElasticsearchLoader
+from etl.config import REDIS_URL, DSL, SCHEMA_CONTENT, ES_HOST, ES_PORT, INDEX_NAME, ES_MAPPINGS, ES_SETTINGS, \
+    FILMS_QUERY, REINDEX_WORKERS, REINDEX_PARTITIONS, TABLES_DATA, ES_NUMBER_OF_REPLICAS, STRICT_VALIDATION
+from logger import logger
+from main import load_data
+from postgres_extractor import PostgresExtractor
+from state import RedisStorage, State
+from versioned_index import VersionedIndex
+
+# Value of the partition progress when all its films are indexed
+DONE = 'done'
+
+
+def make_state() -> State:
+    """Creates the state of the current process."""
+    return State(storage=RedisStorage(redis_adapter=Redis.from_url(url=REDIS_URL)))
+
+
+def partition_range(partition: int, partitions: int) -> Tuple[str, str]:
+    """
+    Returns the inclusive id range of the partition, the uuid space is split into equal ranges.
+
+    :param partition: Number of the partition, from 0 to partitions - 1.
+    :param partitions: Total number of the partitions.
+    :return: The lowest and the highest ids of the partition.
+    """
+    size = 2 ** 128 // partitions
+    start = partition * size
+    end = 2 ** 128 - 1 if partition == partitions - 1 else start + size - 1
+    return str(uuid.UUID(int=start)), str(uuid.UUID(int=end))
+
+
+def reindex_partition(partition: int, partitions: int, es_index: str) -> int:
+    """
+    Indexes all the films of the partition, starting from its saved progress.
+
+    Runs in a worker process with its own Postgres connection, Elasticsearch client and Redis client.
+
+    :param partition: Number of the partition.
+    :param partitions: Total number of the partitions.
+    :param es_index: The name of the index being built.
+    :return: Number of the films indexed.
+    """
+    state = make_state()
+    start_id, end_id = partition_range(partition, partitions)
+    start_id = state.get_state(f'reindex:{partition}:next_id') or start_id
+    if start_id == DONE:
+        return 0
+
+    logger.info("Reindexing partition %s from %s to %s", partition, start_id, end_id)
+
+    indexed = 0
+    pg_connection = psycopg2.connect(**DSL)
+    try:
+        with pg_connection as conn:
+            extractor = PostgresExtractor(conn, schema=SCHEMA_CONTENT, films_query=FILMS_QUERY,
+                                          validate=STRICT_VALIDATION, connect=partial(psycopg2.connect, **DSL))
+            es_loader = ElasticsearchLoader(es_host=ES_HOST, es_port=ES_PORT, es_index=es_index)
+
+            for batch_film_ids in extractor.load_film_ids_range(start_id, end_id):
+                for batch_films in extractor.load_films(batch_film_ids):
+                    es_loader.load_data_to_es(batch_films)
+
+                indexed += len(batch_film_ids)
+                next_id = str(uuid.UUID(int=uuid.UUID(batch_film_ids[-1]).int + 1)) \
+                    if batch_film_ids[-1] != end_id else DONE
+                state.set_state(f'reindex:{partition}:next_id', next_id)
+    finally:
+        pg_connection.close()
+
+    state.set_state(f'reindex:{partition}:next_id', DONE)
+    logger.info("Partition %s reindexed, %s films", partition, indexed)
+
+    return indexed
+
+
+def reset_progress(state: State, partitions: int) -> None:
+    """
+    Starts the rebuild from scratch if asked or if the number of the partitions has changed.
+
+    :param state: State storage.
+    :param partitions: Number of the partitions of the new rebuild.
+    """
+    saved_partitions = int(state.get_state('reindex:partitions', 0))
+
+    for partition in range(max(saved_partitions, partitions)):
+        state.set_state(f'reindex:{partition}:next_id', '')
+    state.set_state('reindex:partitions', partitions)
+
+
+def reset_positions(state: State, started: str) -> None:
+    """
+    Starts the catch-up positions of the sources at the rebuild start time.
+
+    :param state: State storage.
+    :param started: Time the rebuild started at, in ISO format.
+    """
+    state.set_states({f'reindex:{table}:position': encode_position(None, started)
+                      for table, _, _ in TABLES_DATA.values()})
+
+
+def catch_up(state: State, es_index: str) -> None:
+    """
+    Indexes the changes made since the rebuild started or since the previous catch-up.
+
+    Runs the incremental load into the new index with its own positions, see reset_positions(),
+    so every call continues where the previous one stopped.
+
+    :param state: State storage.
+    :param es_index: The name of the new index.
+    """
+    pg_connection = psycopg2.connect(**DSL)
+    try:
+        with pg_connection as conn:
+            extractor = PostgresExtractor(conn, schema=SCHEMA_CONTENT, films_query=FILMS_QUERY,
+                                          validate=STRICT_VALIDATION, connect=partial(psycopg2.connect, **DSL))
+            es_loader = ElasticsearchLoader(es_host=ES_HOST, es_port=ES_PORT, es_index=es_index)
+            load_data(state, extractor, es_loader, key_prefix='reindex:')
+    finally:
+        pg_connection.close()
+
+
+def database_time() -> str:
+    """Returns the current time of the Postgres server in ISO format."""
+    with psycopg2.connect(**DSL) as conn, conn.cursor() as cursor:
+        cursor.execute('SELECT now()')
+        return cursor.fetchone()[0].isoformat()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Rebuilds the Elasticsearch index in parallel processes.')
+    parser.add_argument('--workers', type=int, default=REINDEX_WORKERS, help='number of worker processes')
+    parser.add_argument('--partitions', type=int, default=REINDEX_PARTITIONS, help='number of id ranges')
+    parser.add_argument('--restart', action='store_true', help='ignore the progress of an interrupted rebuild')
+    args = parser.parse_args()
+
+    state = make_state()
+    versioned_index = VersionedIndex(Elasticsearch(f"http://{ES_HOST}:{ES_PORT}"), alias=INDEX_NAME)
+
+    # Resume the interrupted rebuild if its index is still there, otherwise start a new version
+    es_index = state.get_state('reindex:index')
+    if args.restart or not es_index or es_index not in versioned_index.versions() \
+            or int(state.get_state('reindex:partitions', 0)) != args.partitions:
+        es_index = versioned_index.next_name()
+        reset_progress(state, args.partitions)
+        state.set_state('reindex:index', es_index)
+        started = database_time()
+        state.set_state('reindex:started', started)
+        reset_positions(state, started)
+
+    logger.info("Rebuilding index %s", es_index)
+    versioned_index.create(es_index, mappings=ES_MAPPINGS, settings=ES_SETTINGS)
+
+    with Pool(processes=args.workers) as pool:
+        indexed = sum(pool.starmap(reindex_partition, [(partition, args.partitions, es_index)
+                                                       for partition in range(args.partitions)]))
+
+    # The live ETL keeps writing to the old index until the swap: the changes made while the partitions
+    # were loaded and the index was finalized are caught up before the swap, the ones made during
+    # the first catch-up right after it
+    versioned_index.finalize(es_index, settings=ES_SETTINGS, number_of_replicas=ES_NUMBER_OF_REPLICAS)
+    catch_up(state, es_index)
+    versioned_index.swap(es_index)
+    catch_up(state, es_index)
+    state.set_state('reindex:index', '')
+
+    logger.info("Reindex complete! %s Films uploaded to %s!", indexed, es_index)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,6 +1,7 @@
 import abc
 from typing import Any, Dict, Optional
 
+from redis.asyncio import Redis as AsyncRedis
 from redis.client import Redis
 
 from backoff import backoff
@@ -22,6 +23,12 @@ class BaseStorage(abc.ABC):
     def retrieve_state(self, key: str) -> Optional[Any]:
         """Retrieve state from the storage."""
 
+    def save_states(self, states: Dict[str, Any]) -> None:
+        """Save several states to the storage, atomically if the storage supports it."""
+
+        for key, value in states.items():
+            self.save_state({'key': key, 'value': value})
+
 
 class RedisStorage(BaseStorage):
     """
@@ -36,6 +43,11 @@ class RedisStorage(BaseStorage):
 
         self.redis_adapter.set(state['key'], state['value'])
 
+    def save_states(self, states: Dict[str, Any]) -> None:
+        """Save several states to the Redis storage atomically, in a single request."""
+
+        self.redis_adapter.mset(states)
+
     def retrieve_state(self, key: str) -> Optional[Any]:
         """Retrieve state from the Redis storage."""
 
@@ -48,7 +60,7 @@ class State:
     def __init__(self, storage: BaseStorage) -> None:
         self.storage = storage
 
-    @backoff()
+    @backoff(breaker='redis')
     def set_state(self, key: str, value: Any) -> None:
         """
         Set the state for a specific key.
@@ -63,7 +75,18 @@ class State:
             'value': value
         })
 
-    @backoff()
+    @backoff(breaker='redis')
+    def set_states(self, states: Dict[str, Any]) -> None:
+        """
+        Set the states for several keys at once.
+
+        :param states: Values by keys.
+
+        :return: None
+        """
+        self.storage.save_states(states)
+
+    @backoff(breaker='redis')
     def get_state(self, key: str, default: Any = None) -> Optional[Any]:
         """
         Get the state for a specific key.
@@ -79,3 +102,77 @@ class State:
             return default
 
         return result.decode() if result else None
+
+
+class AsyncRedisStorage:
+    """
+    Storage implementation that uses asyncio Redis client.
+    """
+
+    def __init__(self, redis_adapter: AsyncRedis) -> None:
+        self.redis_adapter = redis_adapter
+
+    async def save_state(self, state: Dict[str, Any]) -> None:
+        """Save state to the Redis storage."""
+
+        await self.redis_adapter.set(state['key'], state['value'])
+
+    async def save_states(self, states: Dict[str, Any]) -> None:
+        """Save several states to the Redis storage atomically, in a single request."""
+
+        await self.redis_adapter.mset(states)
+
+    async def retrieve_state(self, key: str) -> Optional[Any]:
+        """Retrieve state from the Redis storage."""
+
+        return await self.redis_adapter.get(key)
+
+
+class AsyncState:
+    """Class for managing states from asyncio code."""
+
+    def __init__(self, storage: AsyncRedisStorage) -> None:
+        self.storage = storage
+
+    @backoff(breaker='redis')
+    async def set_state(self, key: str, value: Any) -> None:
+        """
+        Set the state for a specific key.
+
+        :param key:
+        :param value:
+
+        :return: None
+        """
+        await self.storage.save_state({
+            'key': key,
+            'value': value
+        })
+
+    @backoff(breaker='redis')
+    async def set_states(self, states: Dict[str, Any]) -> None:
+        """
+        Set the states for several keys at once.
+
+        :param states: Values by keys.
+
+        :return: None
+        """
+        await self.storage.save_states(states)
+
+    @backoff(breaker='redis')
+    async def get_state(self, key: str, default: Any = None) -> Optional[Any]:
+        """
+        Get the state for a specific key.
+
+        :param key:
+        :param default: If nothing found by key returns value
+
+        :return: Optional[Any]
+        """
+
+        result = await self.storage.retrieve_state(key)
+        if default is not None and result is None:
+            return default
+
+        return result.decode() if result else None
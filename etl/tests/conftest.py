@@ -0,0 +1,33 @@
+"""
+Runs the tests the way the ETL runs: from the etl directory, with the ETL modules and the etl package importable.
+
+Usage:
+    python -m pytest etl/tests
+"""
+import os
+import sys
+
+import pytest
+
+ETL_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+sys.path[:0] = [ETL_DIR, os.path.dirname(ETL_DIR)]
+# The logger of the ETL writes to logs/ of the working directory
+os.chdir(ETL_DIR)
+os.makedirs('logs', exist_ok=True)
+
+import backoff  # noqa: E402
+
+
+@pytest.fixture
+def sleeps(monkeypatch):
+    """Records the retry delays of backoff instead of sleeping."""
+    slept = []
+    monkeypatch.setattr(backoff, 'sleep', slept.append)
+    return slept
+
+
+@pytest.fixture(autouse=True)
+def breakers(monkeypatch):
+    """Gives every test its own circuit breakers."""
+    monkeypatch.setattr(backoff, '_breakers', {})
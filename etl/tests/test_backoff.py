@@ -0,0 +1,218 @@
+import pytest
+
+import backoff as backoff_module
+from backoff import CircuitBreaker, backoff, circuit_breaker
+
+
+class Clock:
+    """Replaces the monotonic clock of the circuit breakers, the recorded sleeps move it forward."""
+
+    def __init__(self) -> None:
+        self.now = 1000.0
+        self.slept = []
+
+    def __call__(self) -> float:
+        return self.now
+
+    def sleep(self, seconds: float) -> None:
+        self.slept.append(seconds)
+        self.now += seconds
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(backoff_module, 'monotonic', clock)
+    monkeypatch.setattr(backoff_module, 'sleep', clock.sleep)
+    return clock
+
+
+def test_generator_resumes_after_the_last_delivered_item(sleeps):
+    calls = []
+
+    @backoff()
+    def numbers(stop, resume_after=None):
+        calls.append(resume_after)
+        start = 0 if resume_after is None else resume_after + 1
+        for number in range(start, stop):
+            if number == 3 and len(calls) == 1:
+                raise ConnectionError('connection lost')
+            yield number
+
+    assert list(numbers(6)) == [0, 1, 2, 3, 4, 5]
+    assert calls == [None, 2]
+    assert len(sleeps) == 1
+
+
+def test_generator_waits_from_the_start_after_a_delivered_item(sleeps):
+    @backoff(start_sleep_time=1, factor=2, border_sleep_time=100)
+    def numbers(resume_after=None):
+        start = 0 if resume_after is None else resume_after + 1
+        yield start
+        if start < 4:
+            raise ConnectionError('connection lost')
+
+    assert list(numbers()) == [0, 1, 2, 3, 4]
+    # Every failure follows a delivered item, so none of the waits grows
+    assert len(sleeps) == 4
+    assert all(1 / 2 <= slept <= 1 for slept in sleeps)
+
+
+def test_generator_failing_before_the_first_item_is_restarted_from_scratch(sleeps):
+    calls = []
+
+    @backoff()
+    def numbers(resume_after=None):
+        calls.append(resume_after)
+        if len(calls) < 3:
+            raise ConnectionError('connection refused')
+        yield from range(3)
+
+    assert list(numbers()) == [0, 1, 2]
+    assert calls == [None, None, None]
+
+
+def test_generator_without_resume_after_is_not_restarted_midstream(sleeps):
+    @backoff()
+    def numbers():
+        yield 0
+        raise ConnectionError('connection lost')
+
+    items = []
+    with pytest.raises(ConnectionError):
+        for item in numbers():
+            items.append(item)
+    assert items == [0]
+    assert sleeps == []
+
+
+def test_recover_is_called_before_every_retry(sleeps):
+    class Source:
+        def __init__(self) -> None:
+            self.errors = []
+            self.attempts = 0
+
+        def recover(self, error):
+            self.errors.append(error)
+
+        @backoff(recover=True)
+        def read(self):
+            self.attempts += 1
+            if self.attempts < 3:
+                raise ConnectionError(self.attempts)
+            return 'rows'
+
+    source = Source()
+    assert source.read() == 'rows'
+    assert [error.args for error in source.errors] == [(1,), (2,)]
+
+
+def test_delays_are_jittered_within_half_of_the_exponential_time(sleeps):
+    attempts = []
+
+    @backoff(start_sleep_time=1, factor=2, border_sleep_time=4)
+    def flaky():
+        attempts.append(1)
+        if len(attempts) <= 20:
+            raise ConnectionError('timeout')
+
+    flaky()
+
+    limits = [1, 2, 4] + [4] * 17
+    assert len(sleeps) == len(limits)
+    for slept, limit in zip(sleeps, limits):
+        assert limit / 2 <= slept <= limit
+    # The clients do not retry in step
+    assert len(set(sleeps)) > 1
+
+
+def test_circuit_opens_after_consecutive_failures(clock):
+    breaker = CircuitBreaker('postgres', failures=3, reset_seconds=30)
+
+    breaker.failure()
+    breaker.failure()
+    assert breaker.remaining() == 0
+
+    breaker.failure()
+    assert breaker.remaining() == 30
+
+    clock.now += 10
+    assert breaker.remaining() == 20
+
+
+def test_success_resets_the_consecutive_failures(clock):
+    breaker = CircuitBreaker('postgres', failures=2, reset_seconds=30)
+
+    breaker.failure()
+    breaker.success()
+    breaker.failure()
+    assert breaker.remaining() == 0
+
+
+def test_half_open_trial_closes_or_reopens_the_circuit(clock):
+    breaker = CircuitBreaker('elasticsearch', failures=2, reset_seconds=30)
+    breaker.failure()
+    breaker.failure()
+
+    # Half-open: the trial call is let through after reset_seconds
+    clock.now += 30
+    assert breaker.remaining() == 0
+
+    # The failed trial opens the circuit for another reset_seconds
+    breaker.failure()
+    assert breaker.remaining() == 30
+
+    clock.now += 30
+    breaker.success()
+    assert breaker.remaining() == 0
+    assert breaker.opened_at is None
+
+    # Closed again: a single failure does not open it
+    breaker.failure()
+    assert breaker.remaining() == 0
+
+
+def test_half_open_circuit_lets_one_trial_call_through(clock):
+    breaker = CircuitBreaker('elasticsearch', failures=1, reset_seconds=30)
+    breaker.failure()
+    assert not breaker.allow()
+
+    clock.now += 30
+    assert breaker.allow()
+    # The others wait while the trial call is in progress
+    assert not breaker.allow()
+
+    breaker.success()
+    assert breaker.allow()
+
+
+def test_open_circuit_delays_the_first_attempt(clock):
+    breaker = circuit_breaker('postgres')
+    breaker.failures, breaker.reset_seconds = 1, 30
+    breaker.failure()
+    clock.now += 10
+
+    @backoff(breaker='postgres')
+    def query():
+        return 'rows'
+
+    assert query() == 'rows'
+    assert clock.slept == [20]
+    assert breaker.opened_at is None
+
+
+def test_retries_wait_while_the_circuit_is_open(clock):
+    breaker = circuit_breaker('redis')
+    breaker.failures, breaker.reset_seconds = 1, 30
+    attempts = []
+
+    @backoff(start_sleep_time=0.1, breaker='redis')
+    def ping():
+        attempts.append(1)
+        if len(attempts) == 1:
+            raise ConnectionError('connection refused')
+        return 'PONG'
+
+    assert ping() == 'PONG'
+    assert clock.slept == [30]
+    assert breaker.remaining() == 0
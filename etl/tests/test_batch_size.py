@@ -0,0 +1,81 @@
+from batch_size import AdaptiveBatchSize
+
+
+def make(initial=100, minimum=10, maximum=1000, target_seconds=1.0):
+    return AdaptiveBatchSize('test', initial, minimum, maximum, target_seconds)
+
+
+def test_initial_size_is_bounded():
+    assert make(initial=5).size == 10
+    assert make(initial=5000).size == 1000
+
+
+def test_fast_full_batch_grows_the_size_by_half_at_most():
+    batch_size = make()
+
+    assert batch_size.record(100, 0.1) == 150
+    assert batch_size.record(150, 0.45) == 225
+
+
+def test_fast_partial_batch_keeps_the_size():
+    batch_size = make()
+
+    assert batch_size.record(40, 0.01) == 100
+
+
+def test_batch_within_the_target_keeps_the_size():
+    batch_size = make()
+
+    assert batch_size.record(100, 0.7) == 100
+    assert batch_size.reason == 'initial size'
+
+
+def test_slow_batch_shrinks_the_size_to_the_target():
+    batch_size = make()
+
+    assert batch_size.record(100, 1.25) == 80
+
+
+def test_very_slow_batch_halves_the_size_at_most():
+    batch_size = make()
+
+    assert batch_size.record(100, 10) == 50
+
+
+def test_throttled_batch_halves_the_size():
+    batch_size = make()
+
+    assert batch_size.record(100, 0.1, throttled=True) == 50
+    assert batch_size.reason.startswith('throttled')
+
+
+def test_size_stays_within_the_bounds():
+    batch_size = make(initial=20, minimum=15, maximum=25)
+
+    assert batch_size.record(20, 0.01) == 25
+    assert batch_size.record(25, 100, throttled=True) == 15
+
+
+def test_equal_bounds_give_a_fixed_size():
+    batch_size = make(initial=50, minimum=50, maximum=50)
+
+    assert batch_size.record(50, 0.01) == 50
+    assert batch_size.record(50, 100) == 50
+
+
+def test_empty_batch_is_not_measured():
+    batch_size = make()
+
+    assert batch_size.record(0, 100) == 100
+    assert batch_size.snapshot()['last_elapsed'] == 0.0
+
+
+def test_snapshot_reports_the_last_measurements():
+    batch_size = make()
+    batch_size.record(100, 0.1, payload_bytes=2048)
+
+    snapshot = batch_size.snapshot()
+
+    assert snapshot['size'] == 150
+    assert (snapshot['last_elapsed'], snapshot['last_bytes']) == (0.1, 2048)
+    assert snapshot['reason'] == '100 items in 0.100s, faster than 1.0s'
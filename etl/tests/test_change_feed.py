@@ -0,0 +1,150 @@
+import datetime
+import uuid
+
+import change_feed
+from change_feed import ChangeFeed, Checkpoint, SeenSet, decode_position, encode_position, new_film_batches
+from etl.config import TABLES_DATA
+from state import BaseStorage, State
+
+MODIFIED = datetime.datetime(2023, 7, 27, 20, 30, 42, 494066, tzinfo=datetime.timezone.utc)
+
+
+def film_ids(count):
+    return [str(uuid.UUID(int=i + 1)) for i in range(count)]
+
+
+class MemoryStorage(BaseStorage):
+
+    def __init__(self, states):
+        self.states = {key: value.encode() for key, value in states.items()}
+
+    def save_state(self, state):
+        self.states[state['key']] = str(state['value']).encode()
+
+    def retrieve_state(self, key):
+        return self.states.get(key)
+
+
+class FakeExtractor:
+    """Extractor of sources without changes, records the positions the sources are read from."""
+
+    chunk_size = 10
+    time = None
+
+    def __init__(self):
+        self.positions = []
+
+    def now(self):
+        return MODIFIED
+
+    def update_time(self, time, last_id=None):
+        self.positions.append((time, last_id))
+
+    def load_table_ids(self, table, until=None):
+        return iter([])
+
+
+def test_position_round_trip():
+    last_id = str(uuid.uuid4())
+
+    assert decode_position(encode_position(last_id, MODIFIED)) == (MODIFIED.isoformat(), last_id)
+    assert decode_position(encode_position(None, MODIFIED)) == (MODIFIED.isoformat(), None)
+    assert decode_position(None) == (None, None)
+
+
+def test_checkpoint_is_due_after_every_batches():
+    checkpoint = Checkpoint('reindex:', every_batches=2, every_seconds=3600)
+    first, second = film_ids(2)
+
+    assert not checkpoint.add({'film_work': (first, MODIFIED)})
+    assert checkpoint.add({'film_work': (second, MODIFIED), 'person': (first, MODIFIED)})
+
+    # The newest position of every source is kept
+    assert checkpoint.take() == {
+        'reindex:film_work:position': encode_position(second, MODIFIED),
+        'reindex:person:position': encode_position(first, MODIFIED),
+    }
+
+
+def test_checkpoint_is_due_after_every_seconds(monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr(change_feed, 'monotonic', lambda: now[0])
+    checkpoint = Checkpoint(every_batches=100, every_seconds=5)
+
+    assert not checkpoint.add({'genre': (film_ids(1)[0], MODIFIED)})
+    now[0] += 5
+    assert checkpoint.add({})
+
+
+def test_checkpoint_take_starts_a_new_checkpoint(monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr(change_feed, 'monotonic', lambda: now[0])
+    checkpoint = Checkpoint(every_batches=2, every_seconds=5)
+    checkpoint.add({'genre': (film_ids(1)[0], MODIFIED)})
+    now[0] += 5
+    checkpoint.take()
+
+    assert checkpoint.take() == {}
+    assert not checkpoint.add({})
+
+
+def test_seen_set_skips_the_duplicates():
+    seen = SeenSet(max_size=10)
+    first, second = film_ids(2)
+
+    assert seen.add(first)
+    assert seen.add(second)
+    assert not seen.add(first)
+    # The same uuid in another spelling
+    assert not seen.add(second.upper())
+    assert (seen.added, seen.skipped) == (2, 2)
+
+
+def test_seen_set_over_the_limit_indexes_again_but_never_skips():
+    seen = SeenSet(max_size=2)
+    first, second, third = film_ids(3)
+    seen.add(first)
+    seen.add(second)
+
+    # The set is cleared to take the third id, the first one is not remembered any more
+    assert seen.add(third)
+    assert seen.add(first)
+    assert not seen.add(third)
+
+
+def test_new_film_batches_attach_the_positions_to_the_last_batch():
+    ids = film_ids(5)
+    positions = {'person': (ids[0], MODIFIED)}
+
+    batches = new_film_batches(SeenSet(10), ids + ids[:2], 2, positions)
+
+    assert batches == [(ids[0:2], {}), (ids[2:4], {}), (ids[4:], positions)]
+
+
+def test_new_film_batches_keep_the_positions_of_already_seen_films():
+    ids = film_ids(3)
+    seen = SeenSet(10)
+    new_film_batches(seen, ids, 2, {})
+    positions = {'genre': (ids[0], MODIFIED)}
+
+    assert new_film_batches(seen, ids, 2, positions) == [([], positions)]
+
+
+def test_sources_without_position_start_from_the_legacy_time():
+    last_id = str(uuid.uuid4())
+    film_work, *others = [table for table, _, _ in TABLES_DATA.values()]
+    state = State(MemoryStorage({'last_modified': MODIFIED.isoformat(),
+                                 f'{film_work}:position': encode_position(last_id, MODIFIED)}))
+    extractor = FakeExtractor()
+
+    assert list(ChangeFeed(state, extractor).changed_film_ids()) == []
+    assert extractor.positions == [(MODIFIED.isoformat(), last_id)] + [(MODIFIED.isoformat(), None)] * len(others)
+
+
+def test_prefixed_sources_ignore_the_legacy_time():
+    state = State(MemoryStorage({'last_modified': MODIFIED.isoformat()}))
+    extractor = FakeExtractor()
+
+    list(ChangeFeed(state, extractor, key_prefix='reindex:').changed_film_ids())
+
+    assert extractor.positions == [(None, None)] * len(TABLES_DATA)
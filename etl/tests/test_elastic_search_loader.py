@@ -0,0 +1,158 @@
+import asyncio
+import json
+from types import SimpleNamespace
+
+import pytest
+
+import async_elastic_search_loader
+import elastic_search_loader
+from async_elastic_search_loader import AsyncElasticsearchLoader
+from elastic_search_loader import ElasticsearchLoader, chunk_actions
+from fingerprints import FingerprintStore
+
+
+class FakeElasticsearch:
+    """
+    Elasticsearch client answering the bulk requests with the scripted statuses.
+
+    statuses maps a document id to the statuses of its next attempts, the documents
+    without a scripted status are indexed.
+    """
+
+    def __init__(self, url):
+        self.statuses = {}
+        self.indices = SimpleNamespace(exists=lambda index: SimpleNamespace(body=True))
+        self.requests = []
+
+    def bulk(self, operations):
+        ids = [json.loads(line)['index']['_id'] for line in operations[::2]]
+        self.requests.append(ids)
+
+        items = []
+        for id_ in ids:
+            scripted = self.statuses.get(id_)
+            status = scripted.pop(0) if scripted else 201
+            error = {'type': 'es_rejected_execution_exception'} if status >= 300 else None
+            items.append({'index': {'_id': id_, 'status': status, 'error': error}})
+        return SimpleNamespace(body={'errors': True, 'items': items})
+
+
+class FakeAsyncElasticsearch(FakeElasticsearch):
+
+    async def bulk(self, operations):
+        return super().bulk(operations)
+
+
+class FakeAsyncFingerprints:
+
+    fingerprint = staticmethod(FingerprintStore.fingerprint)
+
+    def __init__(self):
+        self.saved = {}
+
+    async def get_many(self, ids):
+        return [self.saved.get(id_) for id_ in ids]
+
+    async def set_many(self, fingerprints):
+        self.saved.update(fingerprints)
+
+
+class FakeDeadLetters:
+
+    def __init__(self):
+        self.added = []
+
+    def add(self, action, status, error):
+        self.added.append((action['_id'], status))
+
+
+@pytest.fixture
+def loader(monkeypatch):
+    monkeypatch.setattr(elastic_search_loader, 'Elasticsearch', FakeElasticsearch)
+    monkeypatch.setattr(elastic_search_loader, 'sleep', lambda seconds: None)
+    return ElasticsearchLoader(es_index='movies', chunk_size=10, max_retries=2, dead_letters=FakeDeadLetters())
+
+
+@pytest.fixture
+def async_loader(monkeypatch):
+    monkeypatch.setattr(async_elastic_search_loader, 'AsyncElasticsearch', FakeAsyncElasticsearch)
+    no_wait = asyncio.sleep
+    monkeypatch.setattr(async_elastic_search_loader.asyncio, 'sleep', lambda seconds: no_wait(0))
+    return AsyncElasticsearchLoader(es_index='movies', chunk_size=10, max_retries=2, dead_letters=FakeDeadLetters(),
+                                    fingerprints=FakeAsyncFingerprints())
+
+
+def documents(count):
+    return [{'_index': 'movies', '_id': f'film-{i}', '_source': {'id': f'film-{i}', 'title': f'Film {i}'}}
+            for i in range(count)]
+
+
+def action(number, size):
+    """Bulk action with the header and source lines of size bytes in total, the newlines included."""
+    return {'_id': number}, [b'h', b'x' * (size - 3)]
+
+
+def ids(chunks):
+    return [[a['_id'] for a, _ in chunk] for chunk in chunks]
+
+
+def test_chunks_are_limited_by_the_number_of_documents():
+    actions = [action(i, 10) for i in range(5)]
+
+    assert ids(chunk_actions(actions, max_docs=2, max_bytes=1000)) == [[0, 1], [2, 3], [4]]
+
+
+def test_chunks_are_limited_by_the_payload_size():
+    actions = [action(0, 40), action(1, 40), action(2, 30), action(3, 50)]
+
+    chunks = list(chunk_actions(actions, max_docs=100, max_bytes=100))
+
+    assert ids(chunks) == [[0, 1], [2, 3]]
+    for chunk in chunks:
+        assert sum(len(line) + 1 for _, lines in chunk for line in lines) <= 100
+
+
+def test_larger_document_makes_its_own_chunk():
+    actions = [action(0, 10), action(1, 500), action(2, 10)]
+
+    assert ids(chunk_actions(actions, max_docs=100, max_bytes=100)) == [[0], [1], [2]]
+
+
+def test_no_actions_give_no_chunks():
+    assert list(chunk_actions([], max_docs=10, max_bytes=100)) == []
+
+
+def test_only_retryable_documents_are_resent(loader):
+    loader.es.statuses = {'film-1': [429], 'film-2': [503, 502], 'film-3': [400], 'film-4': [504]}
+
+    loader.load_actions(documents(6))
+
+    assert loader.es.requests == [[f'film-{i}' for i in range(6)], ['film-1', 'film-2', 'film-4'], ['film-2']]
+    assert loader.dead_letters.added == [('film-3', 400)]
+    assert loader.written == 5
+
+
+def test_documents_still_rejected_after_the_last_retry_are_dead_letters(loader):
+    loader.es.statuses = {'film-0': [503, 503, 503], 'film-1': [409]}
+
+    loader.load_actions(documents(3))
+
+    assert loader.es.requests == [['film-0', 'film-1', 'film-2'], ['film-0'], ['film-0']]
+    assert loader.dead_letters.added == [('film-1', 409), ('film-0', 503)]
+    assert loader.written == 1
+
+
+def test_async_loader_resends_only_retryable_documents_and_skips_unchanged(async_loader):
+    async_loader.es.statuses = {'film-1': [429], 'film-2': [503, 502], 'film-3': [400], 'film-4': [504]}
+
+    asyncio.run(async_loader.load_actions(documents(6)))
+
+    assert async_loader.es.requests == [[f'film-{i}' for i in range(6)], ['film-1', 'film-2', 'film-4'], ['film-2']]
+    assert async_loader.dead_letters.added == [('film-3', 400)]
+    assert async_loader.written == 5
+
+    # The indexed documents did not change, only the rejected one is sent again
+    asyncio.run(async_loader.load_actions(documents(6)))
+
+    assert async_loader.es.requests[-1] == ['film-3']
+    assert async_loader.skipped == 5
@@ -0,0 +1,63 @@
+import datetime
+import uuid
+
+import pytest
+
+import metrics
+from metrics import FRESHNESS_LAG, LAST_INDEXED_MODIFIED, observe_committed
+from outbox import OutboxFeed
+
+MODIFIED = datetime.datetime(2023, 7, 27, 20, 30, 42, tzinfo=datetime.timezone.utc)
+
+
+class FakeCleaner:
+
+    def __init__(self):
+        self.deleted = []
+
+    def delete_outbox(self, ids):
+        self.deleted += ids
+
+
+def gauge(metric):
+    return metric.collect()[0].samples[0].value
+
+
+@pytest.fixture(autouse=True)
+def newest_committed(monkeypatch):
+    monkeypatch.setattr(metrics, '_newest_committed', None)
+
+
+@pytest.fixture
+def now(monkeypatch):
+    clock = [MODIFIED.timestamp() + 60]
+    monkeypatch.setattr(metrics, 'time', lambda: clock[0])
+    return clock
+
+
+def test_newest_modified_does_not_go_back(now):
+    film_id = str(uuid.uuid4())
+
+    observe_committed({'film_work': (film_id, MODIFIED)})
+    observe_committed({'person': (film_id, MODIFIED - datetime.timedelta(hours=1)), 'genre': (None, None)})
+
+    assert gauge(LAST_INDEXED_MODIFIED) == MODIFIED.timestamp()
+    assert gauge(FRESHNESS_LAG) == 60
+
+
+def test_lag_grows_while_nothing_is_committed(now):
+    observe_committed({'film_work': (str(uuid.uuid4()), MODIFIED)})
+    now[0] += 30
+
+    assert gauge(FRESHNESS_LAG) == 90
+
+
+def test_outbox_commit_updates_freshness(now):
+    cleaner = FakeCleaner()
+    feed = OutboxFeed(extractor=None, cleaner=cleaner)
+
+    feed.commit([(1, MODIFIED), (2, MODIFIED - datetime.timedelta(seconds=10))])
+
+    assert cleaner.deleted == [1, 2]
+    assert gauge(LAST_INDEXED_MODIFIED) == MODIFIED.timestamp()
+    assert gauge(FRESHNESS_LAG) == 60
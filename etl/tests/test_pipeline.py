@@ -0,0 +1,61 @@
+import pytest
+
+from pipeline import Pipeline
+
+BATCHES = 50
+
+
+class FakeChangeFeed:
+    def __init__(self) -> None:
+        self.committed = 0
+
+    def changed_film_ids(self):
+        for number in range(BATCHES):
+            yield [str(number)], {'film_work': (str(number), None)}
+
+    def commit(self, positions) -> None:
+        self.committed += 1
+        if self.committed == 2:
+            raise RuntimeError('checkpoint failed')
+
+    def flush(self) -> None:
+        pass
+
+
+class FakeExtractor:
+    def __init__(self) -> None:
+        self.loaded = 0
+
+    def load_films(self, film_ids):
+        self.loaded += 1
+        yield film_ids
+
+
+class FakeLoader:
+    def __init__(self) -> None:
+        self.loaded = 0
+
+    def make_actions(self, films):
+        return films
+
+    def load_actions(self, documents) -> None:
+        self.loaded += 1
+
+
+def test_all_batches_are_loaded_and_committed():
+    change_feed, extractor, es_loader = FakeChangeFeed(), FakeExtractor(), FakeLoader()
+    change_feed.commit = lambda positions: setattr(change_feed, 'committed', change_feed.committed + 1)
+
+    Pipeline(change_feed, extractor, es_loader, queue_size=2).run()
+
+    assert extractor.loaded == es_loader.loaded == change_feed.committed == BATCHES
+
+
+def test_extraction_stops_after_a_consumer_error():
+    extractor = FakeExtractor()
+
+    with pytest.raises(RuntimeError, match='checkpoint failed'):
+        Pipeline(FakeChangeFeed(), extractor, FakeLoader(), queue_size=2).run()
+
+    # The batches in flight when the commit failed: two committed, up to two per queue and one per stage
+    assert extractor.loaded <= 2 + 2 * 2 + 2
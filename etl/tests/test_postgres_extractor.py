@@ -0,0 +1,113 @@
+import datetime
+import uuid
+
+import psycopg2
+import pytest
+
+from batch_size import AdaptiveBatchSize
+from postgres_extractor import PostgresExtractor
+
+T0 = datetime.datetime(2023, 7, 27, 20, 30, tzinfo=datetime.timezone.utc)
+T1 = T0 + datetime.timedelta(seconds=1)
+T2 = T0 + datetime.timedelta(seconds=2)
+
+
+def as_time(value, infinity):
+    if value in ('-infinity', 'infinity'):
+        return infinity
+    return datetime.datetime.fromisoformat(value) if isinstance(value, str) else value
+
+
+class FakeCursor:
+    """Runs the keyset query of load_table_ids over the rows of FakeConnection."""
+
+    def __init__(self, connection: 'FakeConnection') -> None:
+        self.connection = connection
+        self.result = []
+
+    def __enter__(self) -> 'FakeCursor':
+        return self
+
+    def __exit__(self, *exc) -> None:
+        pass
+
+    def execute(self, sql, args=None):
+        if sql.startswith('PREPARE'):
+            return
+
+        self.connection.queries += 1
+        if self.connection.queries in self.connection.fail_on:
+            raise psycopg2.OperationalError('server closed the connection unexpectedly')
+
+        last_modified, last_id, limit, until = args
+        last = (as_time(last_modified, datetime.datetime.min.replace(tzinfo=datetime.timezone.utc)),
+                uuid.UUID(str(last_id)))
+        until = as_time(until, datetime.datetime.max.replace(tzinfo=datetime.timezone.utc))
+        rows = sorted((modified, id_) for id_, modified in self.connection.rows)
+        self.result = [(id_, modified) for modified, id_ in rows if (modified, id_) > last and modified <= until]
+        self.result = self.result[:limit]
+
+    def fetchall(self):
+        return self.result
+
+
+class FakeConnection:
+    closed = False
+
+    def __init__(self, rows, fail_on=()) -> None:
+        self.rows = rows
+        self.fail_on = set(fail_on)
+        self.queries = 0
+
+    def cursor(self) -> FakeCursor:
+        return FakeCursor(self)
+
+    def rollback(self) -> None:
+        pass
+
+
+@pytest.fixture
+def rows():
+    # Five rows share the same modified time and are split between the pages
+    return [(uuid.UUID(int=i), T0) for i in (5, 1, 4, 2, 3)] + [(uuid.UUID(int=9), T1), (uuid.UUID(int=6), T2)]
+
+
+def extractor(connection, size=2):
+    return PostgresExtractor(connection, batch_size=AdaptiveBatchSize('test', size, size, size, 3600))
+
+
+def read(extractor_, **kwargs):
+    return [row for batch in extractor_.load_table_ids('person', **kwargs) for row in batch]
+
+
+def test_rows_with_equal_modified_are_neither_skipped_nor_repeated(rows):
+    result = read(extractor(FakeConnection(rows)))
+
+    assert result == sorted(rows, key=lambda row: (row[1], row[0]))
+
+
+def test_reading_continues_after_the_saved_id_within_the_same_time(rows):
+    extractor_ = extractor(FakeConnection(rows))
+    extractor_.update_time(T0.isoformat(), str(uuid.UUID(int=2)))
+
+    assert [id_.int for id_, _ in read(extractor_)] == [3, 4, 5, 9, 6]
+
+
+def test_saved_time_without_id_reads_its_rows_again(rows):
+    extractor_ = extractor(FakeConnection(rows))
+    extractor_.update_time(T1.isoformat())
+
+    assert [id_.int for id_, _ in read(extractor_)] == [9, 6]
+
+
+def test_rows_modified_after_until_are_left_for_the_next_cycle(rows):
+    assert [id_.int for id_, _ in read(extractor(FakeConnection(rows)), until=T1)] == [1, 2, 3, 4, 5, 9]
+
+
+def test_failed_page_is_read_again_without_duplicates(rows, sleeps):
+    connection = FakeConnection(rows, fail_on={2})
+
+    result = read(extractor(connection))
+
+    assert result == sorted(rows, key=lambda row: (row[1], row[0]))
+    assert len(sleeps) == 1
@@ -0,0 +1,102 @@
+import re
+from typing import Any, List, Mapping
+
+from elasticsearch import Elasticsearch
+
+from backoff import backoff
+from logger import logger
+
+
+class VersionedIndex:
+    """
+    Versioned Elasticsearch indices ({alias}_v1, {alias}_v2, ...) served to readers through an alias.
+
+    A new version is built with the bulk-friendly settings (no refresh, no replicas), then the
+    regular settings are restored, the index is force-merged and the alias is moved to it in a
+    single atomic request, so readers never see a partially loaded index.
+    """
+
+    def __init__(self, es: Elasticsearch, alias: str = "movies") -> None:
+        """
+        Initializes the VersionedIndex instance.
+
+        :param es: Elasticsearch client.
+        :param alias: The name of the alias the readers and the incremental ETL use.
+        """
+        self.es = es
+        self.alias = alias
+
+    def versions(self) -> List[str]:
+        """
+        Lists the existing versions of the index ordered by the version number.
+
+        :return: Names of the versioned indices.
+        """
+        pattern = re.compile(rf'^{re.escape(self.alias)}_v(\d+)$')
+        names = [name for name in self.es.indices.get(index=f'{self.alias}_v*').body if pattern.match(name)]
+        return sorted(names, key=lambda name: int(pattern.match(name).group(1)))
+
+    def next_name(self) -> str:
+        """
+        Returns the name of the next version of the index.
+
+        :return: {alias}_v{N + 1} where N is the latest existing version.
+        """
+        versions = self.versions()
+        version = int(versions[-1].rsplit('_v', 1)[1]) + 1 if versions else 1
+        return f'{self.alias}_v{version}'
+
+    @backoff(breaker='elasticsearch')
+    def create(self, name: str, mappings: Mapping[str, Any], settings: Mapping[str, Any]) -> None:
+        """
+        Creates the index with refresh and replicas disabled for the fastest bulk loading.
+
+        :param name: The name of the new version.
+        :param mappings: Mappings of the index.
+        :param settings: Regular settings of the index.
+        """
+        if self.es.indices.exists(index=name).body:
+            return
+
+        self.es.indices.create(index=name, mappings=mappings,
+                               settings={**settings, "refresh_interval": "-1", "number_of_replicas": 0})
+        logger.info("Index %s created for bulk loading", name)
+
+    @backoff(breaker='elasticsearch')
+    def finalize(self, name: str, settings: Mapping[str, Any], number_of_replicas: int) -> None:
+        """
+        Restores the regular refresh interval and replicas of the loaded index and force-merges it.
+
+        :param name: The name of the loaded version.
+        :param settings: Regular settings of the index.
+        :param number_of_replicas: Number of the replicas to restore.
+        """
+        self.es.indices.put_settings(index=name, settings={
+            "refresh_interval": settings.get("refresh_interval", "1s"),
+            "number_of_replicas": number_of_replicas,
+        })
+        self.es.indices.refresh(index=name)
+        self.es.indices.forcemerge(index=name, max_num_segments=1, request_timeout=3600)
+        logger.info("Index %s refreshed and force-merged", name)
+
+    @backoff(breaker='elasticsearch')
+    def swap(self, name: str) -> None:
+        """
+        Atomically points the alias at the given version and drops the previous ones.
+
+        An index created before the versioning with the name of the alias itself is dropped in the
+        same request, as an alias can not share its name with an index.
+
+        :param name: The name of the version to serve.
+        """
+        actions = [{"add": {"index": name, "alias": self.alias}}]
+
+        if self.es.indices.exists_alias(name=self.alias).body:
+            previous = [index for index in self.es.indices.get_alias(name=self.alias).body if index != name]
+        else:
+            previous = [self.alias] if self.es.indices.exists(index=self.alias).body else []
+
+        actions += [{"remove_index": {"index": index}} for index in previous]
+
+        self.es.indices.update_aliases(actions=actions)
+        logger.info("Alias %s points at %s, removed indices: %s", self.alias, name, previous)